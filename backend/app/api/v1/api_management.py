@@ -11,9 +11,12 @@ from app.models.schemas import (
     User
 )
 from app.core.security import get_current_user
+from app.core.api_auth import invalidate_user_api_key
 from app.core.dependencies import get_marketplace_service
 from app.services.marketplace_service import MarketplaceService
 from app.db.database import get_database
+from app.db.executor import execute
+from app.services.emission_service import EMISSION_COLUMNS
 from typing import Dict, List, Any
 import uuid
 import logging
@@ -34,10 +37,10 @@ async def generate_api_key(current_user: User = Depends(get_current_user)):
         new_api_key = str(uuid.uuid4())
         
         # Update user profile with new API key
-        result = supabase.table("user_profiles").update({
+        result = await execute(supabase.table("user_profiles").update({
             "api_key": new_api_key,
             "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", current_user.id).execute()
+        }).eq("id", current_user.id))
         
         if not result.data:
             raise HTTPException(
@@ -45,6 +48,9 @@ async def generate_api_key(current_user: User = Depends(get_current_user)):
                 detail="Failed to generate API key"
             )
         
+        # The previous key must stop working immediately
+        invalidate_user_api_key(str(current_user.id), new_api_key)
+        
         logger.info(f"Generated new API key for user: {current_user.email}")
         
         return APIKeyResponse(
@@ -152,11 +158,11 @@ async def get_api_analytics(current_user: User = Depends(get_current_user)):
         supabase = get_database()
         
         # Get usage logs for the user from both api_usage_logs and emissions table
-        logs_result = supabase.table("api_usage_logs").select("*").eq("user_id", current_user.id).execute()
+        logs_result = await execute(supabase.table("api_usage_logs").select("*").eq("user_id", current_user.id))
         api_logs = logs_result.data or []
         
-        # Get API emissions from emissions table
-        emissions_result = supabase.table("emissions").select("*").eq("user_id", current_user.id).eq("category", "api_external").execute()
+        # Get API emissions from emissions table, only the columns the analytics read
+        emissions_result = await execute(supabase.table("emissions").select("user_id, date, co2_equivalent, is_offset").eq("user_id", current_user.id).eq("category", "api_external"))
         emission_logs = emissions_result.data or []
         
         # Combine logs - convert emission logs to match api_logs format
@@ -168,7 +174,7 @@ async def get_api_analytics(current_user: User = Depends(get_current_user)):
                 "timestamp": emission["date"],
                 "emission_amount": emission["co2_equivalent"],
                 "offset_done": emission.get("is_offset", False),
-                "external_reference_id": emission.get("metadata", {}).get("external_reference_id") if emission.get("metadata") else None,
+                "external_reference_id": None,  # The external API doesn't store one on emissions
                 "offset_cost": 0  # Will be calculated if offset
             })
         
@@ -316,7 +322,7 @@ async def get_api_key(current_user: User = Depends(get_current_user)):
         supabase = get_service_role_database()  # Use service role to bypass RLS
         
         # Get user profile to check for existing API key
-        result = supabase.table("user_profiles").select("api_key").eq("id", current_user.id).execute()
+        result = await execute(supabase.table("user_profiles").select("api_key").eq("id", current_user.id))
         
         if not result.data:
             logger.error(f"User profile not found for user ID: {current_user.id}")
@@ -350,13 +356,13 @@ async def get_pending_api_emissions(current_user: User = Depends(get_current_use
         supabase = get_database()
         
         # Get emissions from API calls that are not yet offset
-        emissions_result = supabase.table("emissions").select("*").eq(
+        emissions_result = await execute(supabase.table("emissions").select(EMISSION_COLUMNS).eq(
             "user_id", current_user.id
         ).eq(
             "category", "api_external"
         ).is_(
             "offset_purchase_id", "null"
-        ).order("date", desc=True).execute()
+        ).order("date", desc=True))
         
         emissions = emissions_result.data or []
         
@@ -389,14 +395,14 @@ async def offset_pending_api_emissions(
     try:
         supabase = get_database()
         
-        # Get all pending API emissions
-        emissions_result = supabase.table("emissions").select("*").eq(
+        # Get all pending API emissions (ids and amounts are all the offset needs)
+        emissions_result = await execute(supabase.table("emissions").select("id, co2_equivalent").eq(
             "user_id", current_user.id
         ).eq(
             "category", "api_external"
         ).is_(
             "offset_purchase_id", "null"
-        ).execute()
+        ))
         
         emissions = emissions_result.data or []
         
@@ -435,7 +441,7 @@ async def offset_pending_api_emissions(
             "last_retirement_date": datetime.utcnow().isoformat()
         }
         
-        purchase_result = supabase.table("carbon_credit_purchases").insert(purchase_data).execute()
+        purchase_result = await execute(supabase.table("carbon_credit_purchases").insert(purchase_data))
         
         if not purchase_result.data:
             raise HTTPException(
@@ -447,11 +453,11 @@ async def offset_pending_api_emissions(
         
         # Update all emissions to mark them as offset
         for emission in emissions:
-            supabase.table("emissions").update({
+            await execute(supabase.table("emissions").update({
                 "offset_purchase_id": purchase_id,
                 "offset_date": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
-            }).eq("id", emission["id"]).execute()
+            }).eq("id", emission["id"]))
         
         return {
             "status": "success",
@@ -1,16 +1,20 @@
 """
 Blockchain API endpoints for Web3 interactions.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from typing import Optional, Dict
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime, timedelta
+from decimal import Decimal
+from web3 import Web3
+import asyncio
 import logging
 
 from ...core.security import get_current_user
 from ...core.dependencies import get_seller_service, get_marketplace_service
-from ...models.schemas import User, SellerCreditCreate
+from ...core.idempotency import idempotency_store
+from ...models.schemas import User, SellerCreditCreate, PurchaseStatus
 from ...services.blockchain_service import BlockchainService
 from ...services.seller_service import SellerService
 from ...services.marketplace_service import MarketplaceService
@@ -158,44 +162,53 @@ async def mint_credits(
 async def purchase_credits(
     request: PurchaseCreditsRequest,
     current_user: User = Depends(get_current_user),
-    seller_service: SellerService = Depends(get_seller_service)
+    marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    """Purchase carbon credits from marketplace with blockchain validation and database updates."""
+    """Purchase carbon credits from marketplace with blockchain validation and database updates.
+    
+    With a tx_hash, which must be wallet_address's payment of quantity x price_per_ton
+    ether to the CarbonMarketplace contract, the purchase completes right away.
+    Otherwise the purchase is accepted as pending_settlement and the credits are minted
+    to wallet_address in the background; poll GET /marketplace/purchases/{purchase_id}.
+    Retries with the same Idempotency-Key get the first response instead of buying again.
+    """
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "POST /blockchain/purchase-credits", request,
+        lambda: _purchase_credits(request, current_user, marketplace_service)
+    )
+
+async def _purchase_credits(request: PurchaseCreditsRequest, current_user: User, marketplace_service: MarketplaceService) -> Dict:
     try:
-        # 1. Get seller credit details first
-        seller_credit = await seller_service.get_seller_credit_by_id(request.project_id)
-        if not seller_credit:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Seller credit not found"
-            )
-        
-        # 2. Check available quantity
-        available_quantity = seller_credit.quantity - seller_credit.sold_quantity
-        if available_quantity < request.quantity:
+        if not Web3.is_address(request.wallet_address):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient quantity available. Available: {available_quantity}, Requested: {request.quantity}"
+                detail="Invalid wallet address"
             )
         
-        # 3. Calculate total cost
-        total_cost = seller_credit.price_per_ton * request.quantity
-        
-        # 4. BLOCKCHAIN FIRST - Mandatory blockchain transaction (no fallback)
-        blockchain_service = BlockchainService()
-        
-        if not blockchain_service.is_connected():
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Blockchain network not available - transaction cannot proceed"
-            )
-        
-        # If tx_hash is provided, validate it; otherwise mint new credits
+        blockchain_tx_hash = None
         if request.tx_hash:
-            tx_valid = blockchain_service.validate_transaction(
+            # Validation is a couple of quick node calls, but still blocking ones
+            blockchain_service = BlockchainService()
+            if not await asyncio.to_thread(blockchain_service.is_connected):
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Blockchain network not available - transaction cannot proceed"
+                )
+            
+            # The buyer pays quantity x price_per_ton, in ether, to the marketplace contract
+            credit = await marketplace_service.get_credit_by_id(request.project_id)
+            if credit is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Credit listing not found"
+                )
+            price_per_ton = credit.price_per_ton
+            tx_valid = await asyncio.to_thread(
+                blockchain_service.validate_transaction,
                 user_address=request.wallet_address,
-                amount=request.quantity,
-                tx_hash=request.tx_hash
+                tx_hash=request.tx_hash,
+                expected_value_wei=Web3.to_wei(Decimal(str(price_per_ton)) * Decimal(str(request.quantity)), 'ether')
             )
             
             if not tx_valid:
@@ -205,139 +218,40 @@ async def purchase_credits(
                 )
             blockchain_tx_hash = request.tx_hash
             logger.info(f"Blockchain validation successful: {blockchain_tx_hash}")
-        else:
-            # Mint new credits
-            blockchain_tx_hash = blockchain_service.mint_carbon_credits(
-                to_address=request.wallet_address,
-                amount=request.quantity,
-                project_id=str(request.project_id),
-                vintage=str(seller_credit.vintage_year),
-                standard="VCS",  # Could be fetched from project
-                price=seller_credit.price_per_ton
-            )
-            
-            if not blockchain_tx_hash:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Blockchain minting failed - transaction cannot proceed"
-                )
-            logger.info(f"Blockchain minting successful: {blockchain_tx_hash}")
         
-        # 5. DATABASE OPERATIONS - Only after successful blockchain transaction
-        db = seller_service.db
-        logger.info("Starting database operations after successful blockchain transaction...")
-        
-        # Create purchase record in carbon_credit_purchases
-        purchase_data = {
-            "user_id": str(current_user.id),
-            "credit_id": str(request.project_id),  # This is seller_credit.id
-            "quantity": request.quantity,
-            "price_per_ton": seller_credit.price_per_ton,
-            "total_cost": total_cost,
-            "status": "completed",
-            "retired_quantity": 0.0,
-            "blockchain_tx_hash": blockchain_tx_hash
-        }
-        
-        logger.info(f"Creating purchase record with data: {purchase_data}")
-        purchase_response = db.table("carbon_credit_purchases").insert(purchase_data).execute()
-        
-        if not purchase_response.data:
-            logger.error("Purchase response data is empty")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create purchase record"
+        # One transaction: locks the listing, checks the quantity left, records the
+        # purchase and the sale, and increments sold_quantity
+        if blockchain_tx_hash:
+            result = await marketplace_service.record_settled_purchase(
+                current_user.id,
+                request.project_id,
+                request.quantity,
+                blockchain_tx_hash,
+                price_per_ton,
+                settlement_address=request.wallet_address
             )
-        
-        purchase_id = purchase_response.data[0]['id']
-        logger.info(f"Purchase record created with ID: {purchase_id}")
-        
-        # Create sale transaction for the seller
-        sale_data = {
-            "seller_credit_id": str(request.project_id),
-            "buyer_id": str(current_user.id),
-            "quantity": request.quantity,
-            "price_per_ton": seller_credit.price_per_ton,
-            "total_amount": total_cost,
-            "blockchain_tx_hash": blockchain_tx_hash,
-            "status": "completed"
-        }
-        
-        logger.info(f"Creating sale transaction with data: {sale_data}")
-        sale_response = db.table("sale_transactions").insert(sale_data).execute()
-        
-        if not sale_response.data:
-            logger.error("Sale response data is empty")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to create sale transaction"
-            )
-        
-        sale_id = sale_response.data[0]['id']
-        logger.info(f"Sale transaction created with ID: {sale_id}")
-        
-        # Update seller_credits: keep original quantity, only update sold_quantity
-        # The quantity field should remain the original total amount
-        # Only sold_quantity should increase
-        original_quantity = seller_credit.quantity  # Keep original quantity
-        new_sold_quantity = seller_credit.sold_quantity + request.quantity
-        logger.info(f"Updating seller credit: quantity remains {original_quantity}, sold_quantity {seller_credit.sold_quantity} -> {new_sold_quantity}")
-        
-        # Use SQL function to update quantities (bypasses RLS)
-        try:
-            sql_response = db.rpc('update_seller_credit_quantities', {
-                'credit_id': str(request.project_id),
-                'new_quantity': float(original_quantity),
-                'new_sold_quantity': float(new_sold_quantity)
-            }).execute()
-            logger.info(f"SQL RPC response: {sql_response}")
-            
-            # Verify the update by fetching the updated record
-            verification_response = db.table("seller_credits").select("id, quantity, sold_quantity").eq("id", str(request.project_id)).execute()
-            
-            if verification_response.data:
-                updated_record = verification_response.data[0]
-                logger.info(f"Verification - Updated record: id={updated_record['id']}, quantity={updated_record['quantity']}, sold_quantity={updated_record['sold_quantity']}")
-                
-                # Check if the update actually took effect
-                if updated_record['quantity'] == original_quantity and updated_record['sold_quantity'] == new_sold_quantity:
-                    logger.info("Update verification successful - quantities match expected values")
-                else:
-                    logger.error(f"Update verification failed! Expected: quantity={original_quantity}, sold_quantity={new_sold_quantity}")
-                    logger.error(f"Actual: quantity={updated_record['quantity']}, sold_quantity={updated_record['sold_quantity']}")
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Seller credit update verification failed"
-                    )
-            else:
-                logger.error("Could not verify update - seller credit not found")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Could not verify seller credit update"
-                )
-                
-        except Exception as rpc_error:
-            logger.error(f"SQL RPC update failed: {str(rpc_error)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Seller credit update failed: {str(rpc_error)}"
+        else:
+            result = await marketplace_service.record_purchase(
+                request.project_id,
+                request.quantity,
+                settlement_address=request.wallet_address
             )
+        purchase = result['purchase']
+        logger.info(f"Purchase ID: {purchase['id']}, Sale ID: {result['sale']['id']}, status: {purchase['status']}")
         
-        logger.info(f"All database operations completed successfully")
-        logger.info(f"Purchase ID: {purchase_id}, Sale ID: {sale_id}")
-        
-        # Return successful response
+        settled = purchase['status'] == PurchaseStatus.COMPLETED
         return {
             "success": True,
-            "message": "Credits purchased successfully",
-            "purchase_id": purchase_id,
-            "sale_id": sale_id,
+            "message": "Credits purchased successfully" if settled else "Purchase accepted; credits are being minted",
+            "purchase_id": purchase['id'],
+            "sale_id": result['sale']['id'],
+            "status": purchase['status'],
             "quantity": request.quantity,
-            "total_cost": total_cost,
-            "seller_id": seller_credit.seller_id,
+            "total_cost": purchase['total_cost'],
+            "seller_id": result['seller_id'],
             "blockchain_tx_hash": blockchain_tx_hash,
             "blockchain_enabled": True,
-            "blockchain_minted": True
+            "blockchain_minted": settled
         }
         
     except HTTPException:
@@ -39,12 +39,13 @@ async def get_dashboard_stats(
             raise HTTPException(status_code=500, detail=f"Failed to fetch emission summary: {str(e)}")
           # Get recent activities (last 10)
         try:
-            recent_emissions = await emission_service.get_user_emissions(
+            # Newest first, so the first page is the most recent activity
+            recent_activities = await emission_service.get_user_emissions(
                 user_id=current_user.id,
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                limit=10
             )
-            recent_activities = recent_emissions[-10:] if recent_emissions else []
             print(f"Dashboard recent_activities count: {len(recent_activities)}")
         except Exception as e:
             print(f"Error in recent_emissions: {e}")
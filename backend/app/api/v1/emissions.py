@@ -1,18 +1,29 @@
 """
 Emissions API endpoints for tracking carbon emissions.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
 from ...core.security import get_current_user
 from ...core.dependencies import get_emission_service
-from ...models.schemas import EmissionCreate, Emission, EmissionSummary, User, MonthlyTrend
-from ...services.emission_service import EmissionService
+from ...core.config import settings
+from ...models.schemas import EmissionCreate, Emission, EmissionSummary, User, MonthlyTrend, EmissionIngestionJob
+from ...services.emission_service import EmissionService, emission_cursor
+from ...services.ingestion_service import emission_ingestion_service, INGEST_FORMATS
 
 router = APIRouter(prefix="/emissions", tags=["emissions"])
 
+INGEST_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
 
 @router.post("/", response_model=Emission, status_code=status.HTTP_201_CREATED)
 async def create_emission(
@@ -33,37 +44,94 @@ async def create_emission(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create emission.")
 
 
+@router.post("/bulk", response_model=EmissionIngestionJob, status_code=status.HTTP_202_ACCEPTED)
+async def bulk_ingest_emissions(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv or ndjson; defaults to the Content-Type of the body"),
+    current_user: User = Depends(get_current_user)
+):
+    """Upload emission activities as a CSV or NDJSON request body and ingest them in the background.
+
+    CSV needs a header row naming the EmissionCreate fields; NDJSON is one JSON object per line.
+    Poll GET /emissions/bulk/{job_id} for progress and per-row errors.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = format or INGEST_CONTENT_TYPES.get(content_type)
+    if fmt not in INGEST_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson"
+        )
+
+    spool = emission_ingestion_service.new_spool()
+    try:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.EMISSION_INGEST_MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Upload exceeds {settings.EMISSION_INGEST_MAX_UPLOAD_BYTES} bytes"
+                )
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    if received == 0:
+        spool.close()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload is empty")
+
+    return emission_ingestion_service.start_job(current_user.id, fmt, spool)
+
+
+@router.get("/bulk/{job_id}", response_model=EmissionIngestionJob)
+async def get_ingestion_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get the progress and row errors of a bulk ingestion job"""
+    job = emission_ingestion_service.get_job(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+
 @router.get("/", response_model=List[Emission])
 async def get_emissions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, le=100),
     category: Optional[str] = Query(None),
     start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None),
     filter_by_created_at: bool = Query(False, description="Filter by created_at instead of activity date to show recently added emissions"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page; replaces skip"),
     current_user: User = Depends(get_current_user),
     emission_service: EmissionService = Depends(get_emission_service)
 ):
     """Get emissions for current user with optional filtering and pagination"""
-    # Set default date range if not provided
-    if not end_date:
-        end_date = datetime.now(timezone.utc)
-    if not start_date:
-        start_date = end_date - timedelta(days=90)
-
     try:
-        return await emission_service.get_user_emissions(
+        emissions = await emission_service.get_user_emissions(
             user_id=current_user.id,
             start_date=start_date,
             end_date=end_date,
             category=category,
             skip=skip,
             limit=limit,
-            filter_by_created_at=filter_by_created_at
+            filter_by_created_at=filter_by_created_at,
+            cursor=cursor
         )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve emissions.")
 
+    # A full page may have more rows after it
+    if len(emissions) == limit:
+        response.headers["X-Next-Cursor"] = emission_cursor(emissions[-1])
+    return emissions
+
 
 @router.get("/summary", response_model=EmissionSummary)
 async def get_emission_summary(
@@ -10,9 +10,11 @@ from app.models.schemas import (
     ExternalOffsetResponse
 )
 from app.core.api_auth import verify_api_key
+from app.core.trends_cache import emission_trends_cache
 from app.services.carbon_interface_service import get_carbon_interface_service, CarbonInterfaceService
 from app.services.marketplace_service import MarketplaceService
 from app.db.database import get_database, get_service_role_database
+from app.db.executor import execute
 from typing import Dict, Any, Optional
 import uuid
 import logging
@@ -54,7 +56,7 @@ async def log_api_usage(
         }
         
         logger.info(f"Attempting to log API usage: {log_data}")
-        result = supabase.table("api_usage_logs").insert(log_data).execute()
+        result = await execute(supabase.table("api_usage_logs").insert(log_data))
         
         if result.data:
             logger.info(f"✅ API usage logged successfully: {result.data}")
@@ -204,7 +206,7 @@ async def log_emission_for_offset(
         }
         
         logger.info(f"Logging emission for future offset: {emission_data}")
-        emission_result = supabase.table("emissions").insert(emission_data).execute()
+        emission_result = await execute(supabase.table("emissions").insert(emission_data))
         
         if not emission_result.data:
             raise HTTPException(
@@ -213,6 +215,7 @@ async def log_emission_for_offset(
             )
             
         emission_id = emission_result.data[0]["id"]
+        emission_trends_cache.invalidate(user["id"])
         logger.info(f"Emission logged successfully for future offset: {emission_id}")
         
         # Log API usage with pending offset status
@@ -7,8 +7,17 @@ import logging
 
 from app.utils.auth_monitor import auth_monitor
 from app.core.user_cache import user_profile_cache
+from app.core.token_cache import verified_token_cache
+from app.core.auth_queue import auth_queue
+from app.utils.ttl_cache import get_all_cache_stats
 from app.utils.circuit_breaker import user_profile_circuit_breaker
-from app.db.database import get_database, get_service_role_database
+from app.db.database import db, get_database, get_service_role_database
+from app.db.executor import execute, get_executor_stats
+from app.db.analytics import analytics_db
+from app.services.ingestion_service import emission_ingestion_service
+from app.services.marketplace_catalog import marketplace_catalog
+from app.services.settlement_service import purchase_settlement_service
+from app.core.idempotency import idempotency_store
 
 logger = logging.getLogger(__name__)
 
@@ -52,7 +61,8 @@ async def auth_health_check() -> Dict[str, Any]:
             "authentication": auth_metrics,
             "cache": {
                 "status": "healthy" if cache_stats["hit_rate"] > 0.3 else "degraded",
-                "stats": cache_stats
+                "stats": cache_stats,
+                "token_cache": verified_token_cache.get_stats()
             },
             "circuit_breaker": {
                 "status": "healthy" if circuit_breaker_status["state"] == "closed" else "degraded",
@@ -72,14 +82,15 @@ async def _check_database_health() -> Dict[str, Any]:
         "regular_client_healthy": False,
         "service_role_healthy": False,
         "regular_client_error": None,
-        "service_role_error": None
+        "service_role_error": None,
+        "background_probe": db.get_probe_status()
     }
     
     # Test regular client
     try:
         db = get_database()
         # Simple query to test connection
-        result = db.table("user_profiles").select("id").limit(1).execute()
+        result = await execute(db.table("user_profiles").select("id").limit(1))
         health_status["regular_client_healthy"] = True
     except Exception as e:
         health_status["regular_client_error"] = str(e)
@@ -87,7 +98,7 @@ async def _check_database_health() -> Dict[str, Any]:
     # Test service role client
     try:
         service_db = get_service_role_database()
-        result = service_db.table("user_profiles").select("id").limit(1).execute()
+        result = await execute(service_db.table("user_profiles").select("id").limit(1))
         health_status["service_role_healthy"] = True
     except Exception as e:
         health_status["service_role_error"] = str(e)
@@ -164,16 +175,32 @@ def _generate_recommendations(
     
     return recommendations
 
+@router.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    """In-process cache, request-coalescing and connection pool counters"""
+    return {
+        "caches": get_all_cache_stats(),
+        "auth_coalescing": auth_queue.get_stats(),
+        "connection_pools": db.get_pool_stats(),
+        "db_executor": get_executor_stats(),
+        "analytics_pool": analytics_db.get_stats(),
+        "database_probe": db.get_probe_status(),
+        "emission_ingestion": emission_ingestion_service.get_stats(),
+        "marketplace_catalog": marketplace_catalog.get_stats(),
+        "purchase_settlement": purchase_settlement_service.get_stats(),
+        "idempotency": idempotency_store.get_stats()
+    }
+
 @router.get("/auth/quick")
 async def quick_auth_health() -> Dict[str, str]:
     """Quick authentication health check for load balancers"""
     try:
-        # Quick cache test
-        await user_profile_cache.get("health-check-key")
+        # Quick cache test (stats only, so probes don't skew the hit rate)
+        user_profile_cache.get_stats()
         
         # Quick database test
         db = get_database()
-        db.table("user_profiles").select("id").limit(1).execute()
+        await execute(db.table("user_profiles").select("id").limit(1))
         
         return {"status": "healthy"}
         
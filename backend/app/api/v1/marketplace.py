@@ -3,10 +3,11 @@ Marketplace API endpoints for carbon credit operations.
 """
 from typing import List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
 
 from ...core.security import get_current_user
 from ...core.dependencies import get_marketplace_service
+from ...core.idempotency import idempotency_store
 from ...models.schemas import CarbonCredit, CarbonCreditPurchase, CarbonCreditPurchaseCreate, User, RetireCreditsRequest, MarketplaceStats
 from ...services.marketplace_service import MarketplaceService
 
@@ -20,6 +21,8 @@ async def get_available_credits(
     project_type: Optional[str] = Query(None),
     min_price: Optional[float] = Query(None, ge=0),
     max_price: Optional[float] = Query(None, ge=0),
+    vintage_year: Optional[int] = Query(None),
+    verification_standard: Optional[str] = Query(None),
     marketplace_service: MarketplaceService = Depends(get_marketplace_service),
 ):
     """Get available carbon credits with optional filtering and pagination."""
@@ -28,7 +31,9 @@ async def get_available_credits(
         limit=limit,
         project_type=project_type,
         min_price=min_price,
-        max_price=max_price
+        max_price=max_price,
+        vintage_year=vintage_year,
+        verification_standard=verification_standard
     )
 
 
@@ -49,11 +54,18 @@ async def purchase_credits(
     purchase_data: CarbonCreditPurchaseCreate,
     current_user: User = Depends(get_current_user),
     marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    """Purchase carbon credits."""
-    return await marketplace_service.purchase_credits(
-        user_id=current_user.id,
-        purchase_data=purchase_data
+    """Purchase carbon credits. The purchase is returned pending_settlement while its credits are minted.
+    
+    Retries with the same Idempotency-Key get the first response instead of buying again.
+    """
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "POST /marketplace/purchase", purchase_data,
+        lambda: marketplace_service.purchase_credits(
+            user_id=current_user.id,
+            purchase_data=purchase_data
+        )
     )
 
 
@@ -72,16 +84,33 @@ async def get_user_purchases(
     )
 
 
+@router.get("/purchases/{purchase_id}", response_model=CarbonCreditPurchase)
+async def get_purchase(
+    purchase_id: UUID,
+    current_user: User = Depends(get_current_user),
+    marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+):
+    """Get one of the current user's purchases; poll its status while it is pending_settlement."""
+    purchase = await marketplace_service.get_purchase_by_id(purchase_id, current_user.id)
+    if not purchase:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase not found")
+    return purchase
+
+
 @router.post("/retire", response_model=CarbonCreditPurchase)
 async def retire_credits(
     retire_data: RetireCreditsRequest,
     current_user: User = Depends(get_current_user),
     marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    """Retire a specified quantity of purchased carbon credits."""
-    return await marketplace_service.retire_credits(
-        user_id=current_user.id,
-        retire_data=retire_data
+    """Retire a specified quantity of purchased carbon credits. Retries with the same Idempotency-Key get the first response."""
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "POST /marketplace/retire", retire_data,
+        lambda: marketplace_service.retire_credits(
+            user_id=current_user.id,
+            retire_data=retire_data
+        )
     )
 
 
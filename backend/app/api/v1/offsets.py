@@ -1,13 +1,14 @@
 """
 Offset API endpoints for managing emission offsets using retired carbon credits.
 """
-from typing import List
+from typing import List, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
 
 from ...core.security import get_current_user
 from ...core.dependencies import get_emission_service, get_marketplace_service
-from ...models.schemas import User, OffsetEmissionRequest, BulkOffsetEmissionRequest, OffsetEmissionResponse, OffsetStats, Emission
+from ...core.idempotency import idempotency_store
+from ...models.schemas import User, PurchaseStatus, OffsetEmissionRequest, BulkOffsetEmissionRequest, OffsetEmissionResponse, OffsetStats, Emission
 from ...services.emission_service import EmissionService
 from ...services.marketplace_service import MarketplaceService
 
@@ -20,14 +21,30 @@ async def offset_emissions(
     current_user: User = Depends(get_current_user),
     emission_service: EmissionService = Depends(get_emission_service),
     marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    """Offset specific emissions using retired carbon credits."""
+    """Offset specific emissions using retired carbon credits. Retries with the same Idempotency-Key get the first response."""
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "POST /offsets/emissions", offset_request,
+        lambda: _offset_emissions(offset_request, current_user, emission_service, marketplace_service)
+    )
+
+
+async def _offset_emissions(
+    offset_request: OffsetEmissionRequest,
+    current_user: User,
+    emission_service: EmissionService,
+    marketplace_service: MarketplaceService,
+) -> OffsetEmissionResponse:
     try:
         # Verify the purchase belongs to the user and has enough retired credits
         purchase = await marketplace_service.get_purchase_by_id(offset_request.purchase_id, current_user.id)
         if not purchase:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase not found")
         
+        if purchase.status != PurchaseStatus.COMPLETED:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Purchase is {purchase.status.value} and can't be used for offsets yet")
+        
         # Check if there are enough available credits to offset the emissions
         available_for_offset = purchase.quantity - purchase.retired_quantity
         if available_for_offset < offset_request.total_offset_amount:
@@ -51,6 +68,8 @@ async def offset_emissions(
             total_offset_amount=offset_request.total_offset_amount
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -63,8 +82,21 @@ async def bulk_offset_emissions(
     current_user: User = Depends(get_current_user),
     emission_service: EmissionService = Depends(get_emission_service),
     marketplace_service: MarketplaceService = Depends(get_marketplace_service),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 ):
-    """Offset specific emissions using multiple credit purchases in a single transaction."""
+    """Offset specific emissions using multiple credit purchases in a single transaction. Retries with the same Idempotency-Key get the first response."""
+    return await idempotency_store.run(
+        current_user.id, idempotency_key, "POST /offsets/emissions/bulk", offset_request,
+        lambda: _bulk_offset_emissions(offset_request, current_user, emission_service, marketplace_service)
+    )
+
+
+async def _bulk_offset_emissions(
+    offset_request: BulkOffsetEmissionRequest,
+    current_user: User,
+    emission_service: EmissionService,
+    marketplace_service: MarketplaceService,
+) -> OffsetEmissionResponse:
     try:
         # Basic validation
         if not offset_request.emission_ids:
@@ -82,6 +114,9 @@ async def bulk_offset_emissions(
             if not purchase:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Purchase {allocation.purchase_id} not found")
             
+            if purchase.status != PurchaseStatus.COMPLETED:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Purchase {allocation.purchase_id} is {purchase.status.value} and can't be used for offsets yet")
+            
             # Check if there are enough available credits
             available_for_offset = purchase.quantity - purchase.retired_quantity
             if available_for_offset < allocation.amount:
@@ -117,6 +152,8 @@ async def bulk_offset_emissions(
             total_offset_amount=total_offset_amount
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
@@ -138,12 +175,14 @@ async def get_offset_stats(
 
 @router.get("/available-emissions", response_model=List[Emission])
 async def get_available_emissions_for_offset(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all eligible emissions when omitted"),
     current_user: User = Depends(get_current_user),
     emission_service: EmissionService = Depends(get_emission_service),
 ):
     """Get emissions that are available for offsetting (not yet offset)."""
     try:
-        return await emission_service.get_emissions_for_offset(user_id=current_user.id)
+        return await emission_service.get_emissions_for_offset(user_id=current_user.id, skip=skip, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve available emissions")
 
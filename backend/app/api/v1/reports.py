@@ -13,6 +13,7 @@ from ...core.security import get_current_user
 from ...core.dependencies import get_report_service
 from ...models.schemas import User, Report
 from ...services.report_service import ReportService
+from ...db.executor import execute
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
@@ -346,9 +347,9 @@ async def delete_report(
         
         # Delete from database
         supabase = report_service.supabase
-        supabase.table("reports").delete().eq("id", str(report_id)).eq(
+        await execute(supabase.table("reports").delete().eq("id", str(report_id)).eq(
             "user_id", str(current_user.id)
-        ).execute()
+        ))
         
         return {"message": "Report deleted successfully"}
     
@@ -2,54 +2,93 @@
 API Key authentication for external API access.
 """
 from fastapi import Header, HTTPException, Depends
-from app.db.database import get_database
+from app.db.database import get_database, get_service_role_database
+from app.db.executor import execute
 from app.core.config import settings
-from supabase import create_client
+from app.utils.ttl_cache import TTLCache
+from app.utils.single_flight import SingleFlight
+from typing import Any, Dict, Optional
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# API key digest -> user record, or _UNKNOWN_KEY for keys that matched no user
+api_key_cache: TTLCache[Any] = TTLCache(
+    "api_keys",
+    max_size=settings.API_KEY_CACHE_MAX_SIZE,
+    ttl=settings.API_KEY_CACHE_TTL_SECONDS
+)
+_UNKNOWN_KEY = object()
+# user id -> digest of the key currently cached for that user, for invalidation on rotation
+_user_key_digests: Dict[str, str] = {}
+_api_key_lookups = SingleFlight("api_key_lookup")
+
+def api_key_digest(api_key: str) -> str:
+    """Digest used as the cache key for an API key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def invalidate_user_api_key(user_id: str, new_api_key: Optional[str] = None):
+    """Drop the cached record for a user's API key, e.g. when the key is rotated"""
+    old_digest = _user_key_digests.pop(str(user_id), None)
+    if old_digest:
+        api_key_cache.invalidate(old_digest)
+    if new_api_key:
+        # The new key may have been negatively cached before it was issued
+        api_key_cache.invalidate(api_key_digest(new_api_key))
+    logger.info(f"Invalidated cached API key for user {user_id}")
+
 def get_service_database():
     """Get database connection with service role for admin operations"""
-    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+    return get_service_role_database()
+
+async def _lookup_api_key(api_key: str) -> Optional[Dict[str, Any]]:
+    """Look up the user owning an API key (service role, bypasses RLS)"""
+    supabase = get_service_database()
+    response = await execute(supabase.table("user_profiles").select("*").eq("api_key", api_key))
+    return response.data[0] if response.data else None
 
 async def verify_api_key(x_api_key: str = Header(..., alias="X-API-Key", description="API key for authentication")):
     """
     Verify API key for external API access.
-    
+
     Args:
         x_api_key: API key from request header
-        
+
     Returns:
         dict: User information associated with the API key
-        
+
     Raises:
         HTTPException: If API key is invalid or missing
     """
     try:
-        # Use service role for API key verification to bypass RLS
-        supabase = get_service_database()
-        
-        # Query user_profiles table for the API key
-        response = supabase.table("user_profiles").select("*").eq("api_key", x_api_key).execute()
-        
-        if not response.data:
+        digest = api_key_digest(x_api_key)
+        user = api_key_cache.get(digest)
+
+        if user is None:
+            # Concurrent requests with the same key share one lookup
+            user = await _api_key_lookups.do(digest, lambda: _lookup_api_key(x_api_key))
+            if user:
+                api_key_cache.set(digest, user)
+                _user_key_digests[str(user["id"])] = digest
+            else:
+                api_key_cache.set(digest, _UNKNOWN_KEY, ttl=settings.API_KEY_NEGATIVE_CACHE_TTL_SECONDS)
+                user = _UNKNOWN_KEY
+
+        if user is _UNKNOWN_KEY:
             logger.warning(f"No user found for API key: {x_api_key[:8]}...")
             raise HTTPException(
-                status_code=401, 
+                status_code=401,
                 detail="Invalid or missing API key"
             )
-        
-        user = response.data[0]
-        
+
         return user
-        
+
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
         logger.error(f"Error verifying API key: {str(e)}")
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail="Error verifying API key"
         )
- 
\ No newline at end of file
@@ -28,14 +28,71 @@ class Settings(BaseSettings):
     SUPABASE_URL: str = ""
     SUPABASE_ANON_KEY: str = ""
     SUPABASE_SERVICE_ROLE_KEY: str = ""
+
+    # Supabase Auth token verification
+    SUPABASE_JWT_SECRET: str = ""  # Project JWT secret for HS256 tokens
+    SUPABASE_JWT_AUDIENCE: str = "authenticated"
+    SUPABASE_JWKS_URL: str = ""  # Defaults to {SUPABASE_URL}/auth/v1/.well-known/jwks.json
+    AUTH_LOCAL_TOKEN_VERIFICATION: bool = True  # Verify tokens in process, falling back to Supabase Auth
+    AUTH_JWKS_CACHE_SECONDS: int = 600
+    AUTH_TOKEN_LEEWAY_SECONDS: int = 0
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 60  # Upper bound; entries never outlive the token's exp
+    AUTH_TOKEN_CACHE_MAX_SIZE: int = 10000
+    AUTH_HEDGED_LOOKUP: bool = True  # Race the service role lookup against a slow regular lookup
+    AUTH_HEDGE_DELAY_SECONDS: float = 0.2  # Head start given to the regular client lookup
+    AUTH_LOOKUP_TIMEOUT_SECONDS: float = 3.0  # Total budget for profile lookup before returning 401
     
+    # In-process caches
+    USER_PROFILE_CACHE_TTL_SECONDS: int = 300
+    USER_PROFILE_CACHE_MAX_SIZE: int = 10000
+    CACHE_SWEEP_INTERVAL_SECONDS: int = 30
+    API_KEY_CACHE_TTL_SECONDS: int = 60
+    API_KEY_NEGATIVE_CACHE_TTL_SECONDS: int = 10  # Unknown keys
+    API_KEY_CACHE_MAX_SIZE: int = 10000
+    EMISSION_TRENDS_CACHE_TTL_SECONDS: int = 300  # Per user; emission writes and offsets invalidate sooner
+    EMISSION_TRENDS_CACHE_MAX_SIZE: int = 10000  # Users
+
     # Carbon Emissions APIs
     CARBON_INTERFACE_API_KEY: str = ""
     COIN_GECKO_API_KEY: str = ""
     
     # Database
     DATABASE_URL: str = ""
+    SUPABASE_POOL_MAX_CONNECTIONS: int = 100  # Per key type (anon, service role)
+    SUPABASE_POOL_MAX_KEEPALIVE: int = 20
+    SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    DB_HEALTH_PROBE_INTERVAL_SECONDS: int = 30  # Background connection check, off the request path
+    DB_EXECUTOR_MAX_WORKERS: int = 32  # Threads running blocking Supabase queries off the event loop
+    ANALYTICS_DB_ENABLED: bool = False  # Run aggregate reads over DATABASE_URL with asyncpg instead of PostgREST
+    ANALYTICS_DB_POOL_MIN_SIZE: int = 1
+    ANALYTICS_DB_POOL_MAX_SIZE: int = 10
+    ANALYTICS_DB_COMMAND_TIMEOUT_SECONDS: float = 10.0
+    DB_QUERY_BUDGET_PER_REQUEST: int = 10  # Warn when a request issues more queries than this
+    DB_REPEATED_QUERY_WARN_THRESHOLD: int = 3  # Warn when one query shape repeats this often (N+1)
     
+    # Marketplace catalog snapshot
+    MARKETPLACE_CATALOG_ENABLED: bool = True  # Serve listings from the in-memory catalog
+    MARKETPLACE_CATALOG_REFRESH_SECONDS: float = 5  # Apply updated_at deltas at most this often
+    MARKETPLACE_CATALOG_FULL_REFRESH_SECONDS: float = 300  # Full reload, catching deleted rows
+
+    # On-chain settlement of marketplace purchases
+    PURCHASE_SETTLEMENT_CONCURRENCY: int = 8  # Purchases settling at once; mints are sent one at a time
+    PURCHASE_SETTLEMENT_RECEIPT_TIMEOUT_SECONDS: float = 120  # Wait per attempt before checking back later
+    PURCHASE_SETTLEMENT_MAX_ATTEMPTS: int = 5  # Rejected or reverted mints before the purchase is cancelled; node outages don't count
+    PURCHASE_SETTLEMENT_RETRY_SECONDS: int = 15  # Base backoff, multiplied by the attempt number
+    PURCHASE_SETTLEMENT_SWEEP_SECONDS: float = 30  # Rescan for pending purchases (retries, other processes' leftovers)
+
+    # Idempotency-Key on purchase, retire and offset endpoints
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 24 * 3600  # How long a key's response is replayed
+    IDEMPOTENCY_LOCK_SECONDS: int = 300  # After this a retry may take over the key of a request that died
+
+    # Bulk emission ingestion
+    EMISSION_INGEST_BATCH_SIZE: int = 500  # Rows validated and inserted per statement
+    EMISSION_INGEST_MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+    EMISSION_INGEST_MAX_CONCURRENT_JOBS: int = 4  # Jobs processed at once; the rest wait queued
+    EMISSION_INGEST_MAX_REPORTED_ERRORS: int = 1000  # Per job; further row errors are only counted
+    EMISSION_INGEST_JOB_TTL_SECONDS: int = 3600  # How long job status stays queryable after its last update
+
     # Environment
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -5,8 +5,11 @@ from functools import lru_cache
 from fastapi import Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
+from jose import jwt
+from typing import Optional
 
 from ..db.database import get_database, db
+from ..db.analytics import analytics_db, AnalyticsSession
 from ..services.auth_service import AuthService
 from ..services.emission_service import EmissionService
 from ..services.marketplace_service import MarketplaceService
@@ -23,11 +26,23 @@ def get_user_db_client(credentials: HTTPAuthorizationCredentials = Depends(secur
     token = credentials.credentials
     return db.get_client_with_token(token)
 
+def get_analytics_session(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user: User = Depends(get_current_user)
+) -> Optional[AnalyticsSession]:
+    """Get a direct Postgres session carrying the caller's JWT claims for RLS, if enabled"""
+    # get_current_user has already verified the token
+    return analytics_db.session(jwt.get_unverified_claims(credentials.credentials))
+
 def get_auth_service(db: Client = Depends(get_database)) -> AuthService:
     return AuthService(db)
 
-def get_emission_service(db: Client = Depends(get_user_db_client), user: User = Depends(get_current_user)) -> EmissionService:
-    return EmissionService(db)
+def get_emission_service(
+    db: Client = Depends(get_user_db_client),
+    user: User = Depends(get_current_user),
+    analytics: Optional[AnalyticsSession] = Depends(get_analytics_session)
+) -> EmissionService:
+    return EmissionService(db, analytics)
 
 def get_marketplace_service(db: Client = Depends(get_user_db_client), user: User = Depends(get_current_user)) -> MarketplaceService:
     return MarketplaceService(db)
@@ -35,8 +50,16 @@ def get_marketplace_service(db: Client = Depends(get_user_db_client), user: User
 def get_ai_service(db: Client = Depends(get_user_db_client), user: User = Depends(get_current_user)) -> AIRecommendationService:
     return AIRecommendationService(db)
 
-def get_report_service(db: Client = Depends(get_user_db_client), user: User = Depends(get_current_user)) -> ReportService:
-    return ReportService(db)
+def get_report_service(
+    db: Client = Depends(get_user_db_client),
+    user: User = Depends(get_current_user),
+    analytics: Optional[AnalyticsSession] = Depends(get_analytics_session)
+) -> ReportService:
+    return ReportService(db, analytics)
 
-def get_seller_service(db: Client = Depends(get_user_db_client), user: User = Depends(get_current_user)) -> SellerService:
-    return SellerService(db)
+def get_seller_service(
+    db: Client = Depends(get_user_db_client),
+    user: User = Depends(get_current_user),
+    analytics: Optional[AnalyticsSession] = Depends(get_analytics_session)
+) -> SellerService:
+    return SellerService(db, analytics)
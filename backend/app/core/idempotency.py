@@ -0,0 +1,199 @@
+"""
+Idempotency-Key handling for endpoints that move credits (purchase, retire, offsets).
+
+A client sends the same Idempotency-Key header when it retries a request. The first
+request with a key runs and its response is stored with a fingerprint of the route
+and body; a retry gets the stored response back instead of running again. Keys are
+per user and live in the idempotency_keys table, so replays work across workers.
+
+- A duplicate arriving while the first request is still running in this process
+  waits for it and shares its result. If it is running in another process, the
+  duplicate gets 409 and should retry shortly.
+- Reusing a key with a different request is rejected with 422.
+- Only successful responses are stored. A request that fails releases its key, so
+  a retry runs it again.
+- Keys expire after IDEMPOTENCY_KEY_TTL_SECONDS.
+- If a key can't be claimed (database error or timeout) the request is refused
+  with 503 and Retry-After rather than run unprotected. Only a database without
+  the idempotency_keys migration runs requests without their key.
+"""
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from uuid import UUID
+import logging
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+
+from app.core.config import settings
+from app.db.database import get_service_role_database
+from app.db.executor import execute
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_KEY_LENGTH = 255
+
+# Expired keys are deleted at most this often (and reused on a clash in between)
+PURGE_INTERVAL_SECONDS = 3600
+
+# claim_idempotency_key doesn't exist (PostgREST's and Postgres's function-not-found codes)
+FUNCTION_NOT_FOUND_CODES = {"PGRST202", "42883"}
+
+# Suggested wait before retrying when keys can't be claimed
+CLAIM_RETRY_AFTER_SECONDS = 5
+
+def _fingerprint(scope: str, payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{scope}\n{body}".encode()).hexdigest()
+
+class IdempotencyStore:
+    def __init__(self):
+        self._flight = SingleFlight("idempotency")
+        # (user, key) -> fingerprint of the request running in this process
+        self._running: Dict[Tuple[str, str], str] = {}
+        self._last_purge = time.monotonic()
+        self.executed = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.unavailable = 0
+
+    async def run(self, user_id: UUID, key: Optional[str], scope: str, payload: Any, fn: Callable[[], Awaitable[T]]) -> Any:
+        """
+        Run `fn` once per (user, Idempotency-Key). `scope` names the endpoint and
+        `payload` is the request body; together they must match on every retry.
+        Without a key `fn` simply runs.
+        """
+        if key is None:
+            return await fn()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            )
+
+        fingerprint = _fingerprint(scope, payload)
+        flight_key = (str(user_id), key)
+        running = self._running.get(flight_key)
+        if running is None:
+            self._running[flight_key] = fingerprint
+        elif running != fingerprint:
+            self._reject_mismatch()
+
+        return await self._flight.do(flight_key, lambda: self._run_once(user_id, key, fingerprint, fn))
+
+    async def _run_once(self, user_id: UUID, key: str, fingerprint: str, fn: Callable[[], Awaitable[T]]) -> Any:
+        try:
+            return await self._claim_and_run(user_id, key, fingerprint, fn)
+        finally:
+            self._running.pop((str(user_id), key), None)
+
+    async def _claim_and_run(self, user_id: UUID, key: str, fingerprint: str, fn: Callable[[], Awaitable[T]]) -> Any:
+        db = get_service_role_database()
+        try:
+            claim = await execute(db.rpc("claim_idempotency_key", {
+                "p_user_id": str(user_id),
+                "p_key": key,
+                "p_fingerprint": fingerprint,
+                "p_lock_seconds": settings.IDEMPOTENCY_LOCK_SECONDS,
+                "p_ttl_seconds": settings.IDEMPOTENCY_KEY_TTL_SECONDS
+            }))
+        except APIError as e:
+            if e.code in FUNCTION_NOT_FOUND_CODES:
+                # Migration not applied yet: concurrent duplicates in this process are still coalesced
+                logger.warning(f"Idempotency keys unavailable, running request without one: {e.message}")
+                return await fn()
+            # Running without the key could repeat a request the client is retrying
+            logger.error(f"Could not claim Idempotency-Key {key}: {e.message}")
+            raise self._claim_unavailable()
+        except Exception as e:
+            logger.error(f"Could not claim Idempotency-Key {key}: {e}")
+            raise self._claim_unavailable()
+
+        state = claim.data["state"]
+        if state == "completed":
+            self.replayed += 1
+            return claim.data["response"]
+        if state == "mismatch":
+            self._reject_mismatch()
+        if state == "in_progress":
+            self.conflicts += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": "1"}
+            )
+
+        try:
+            result = await fn()
+        except BaseException:
+            await self._release(user_id, key)
+            raise
+        self.executed += 1
+
+        try:
+            await execute(db.table("idempotency_keys").update({
+                "status": "completed",
+                "response": jsonable_encoder(result),
+                "locked_until": None
+            }, returning=ReturnMethod.minimal).eq("user_id", str(user_id)).eq("key", key))
+        except Exception as e:
+            # The request did happen; a retry after the lock expires would run it again
+            logger.error(f"Could not store the response for Idempotency-Key {key}: {e}")
+
+        await self._purge_expired()
+        return result
+
+    def _claim_unavailable(self) -> HTTPException:
+        self.unavailable += 1
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Idempotency-Key could not be checked, retry the request",
+            headers={"Retry-After": str(CLAIM_RETRY_AFTER_SECONDS)}
+        )
+
+    def _reject_mismatch(self):
+        self.conflicts += 1
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+
+    async def _release(self, user_id: UUID, key: str):
+        try:
+            await execute(get_service_role_database().table("idempotency_keys").delete(
+                returning=ReturnMethod.minimal
+            ).eq("user_id", str(user_id)).eq("key", key).eq("status", "in_progress"))
+        except Exception as e:
+            # The lock expires on its own and a retry of the same request takes it over
+            logger.warning(f"Could not release Idempotency-Key {key}: {e}")
+
+    async def _purge_expired(self):
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        try:
+            await execute(get_service_role_database().table("idempotency_keys").delete(
+                returning=ReturnMethod.minimal
+            ).lt("expires_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())))
+        except Exception as e:
+            logger.warning(f"Could not purge expired idempotency keys: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+            "unavailable": self.unavailable,
+            "coalescing": self._flight.get_stats()
+        }
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
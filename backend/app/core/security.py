@@ -3,13 +3,17 @@ from typing import Optional, Dict, Any
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import Client
+from jose import jwt
 import asyncio
 
 from app.core.config import settings
 from app.models.schemas import User
 from app.db.database import get_database
+from app.db.executor import execute, run_sync
 from app.core.auth_queue import auth_queue
 from app.core.user_cache import user_profile_cache
+from app.core.token_verifier import token_verifier, InvalidTokenError
+from app.core.token_cache import verified_token_cache
 from app.utils.circuit_breaker import user_profile_circuit_breaker
 from app.utils.auth_monitor import auth_monitor, AuthStrategy
 
@@ -24,6 +28,9 @@ def create_credentials_exception():
 # Security setup
 security = HTTPBearer()
 
+# Profile and seller verification in one round trip (PostgREST embedded resource)
+PROFILE_WITH_VERIFICATION = "*, seller_verifications(*)"
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Client = Depends(get_database)
@@ -31,17 +38,14 @@ async def get_current_user(
     """Get current authenticated user using Supabase token verification with multiple fallback strategies."""
     token = credentials.credentials
     
+    # Fast path: this exact token was already verified and resolved recently
+    cached_user = verified_token_cache.get(token)
+    if cached_user:
+        return cached_user
+    
     # First, verify the token to get the user ID
-    try:
-        user_response = db.auth.get_user(token)
-        user_obj = getattr(user_response, "user", None)
-        if not user_obj or not hasattr(user_obj, "id"):
-            print(f"Invalid user object in token response")
-            raise create_credentials_exception()
-        user_id = user_obj.id
-    except Exception as e:
-        print(f"Token verification failed at Supabase level: {e}")
-        raise create_credentials_exception()
+    claims = await verify_access_token(token, db)
+    user_id = claims["sub"]
     
     # Use auth queue to handle concurrent requests for the same user
     async def fetch_user_profile():
@@ -49,39 +53,34 @@ async def get_current_user(
         
         # Strategy 0: Check cache first
         async with auth_monitor.measure_duration(user_id, AuthStrategy.CACHE):
-            cached_data = await user_profile_cache.get(user_id)
-            if cached_data:
-                print(f"🚀 Cache hit for user: {cached_data.get('email')}")
-                return await finalize_user_model(cached_data, db)
+            cached_user = await user_profile_cache.get(user_id)
+            if cached_user:
+                print(f"🚀 Cache hit for user: {cached_user.email}")
+                return cached_user
         
-        # Strategy 1: Try with regular client (with retry)
-        async with auth_monitor.measure_duration(user_id, AuthStrategy.REGULAR_CLIENT):
-            user_data = await try_regular_client_lookup(db, user_id)
-            if user_data:
-                await user_profile_cache.set(user_id, user_data)  # Cache successful lookup
-                return await finalize_user_model(user_data, db)
+        # Strategies 1-3: regular client, service role client, fresh client - under one time budget
+        lookup = hedged_profile_lookup if settings.AUTH_HEDGED_LOOKUP else sequential_profile_lookup
+        try:
+            user_data = await asyncio.wait_for(
+                lookup(db, user_id),
+                timeout=settings.AUTH_LOOKUP_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            print(f"⏱️ Profile lookup exceeded {settings.AUTH_LOOKUP_TIMEOUT_SECONDS}s for user_id: {user_id}")
+            user_data = None
         
-        # Strategy 2: Fallback to service role client
-        print("🔑 Regular client failed, trying service role fallback...")
-        async with auth_monitor.measure_duration(user_id, AuthStrategy.SERVICE_ROLE):
-            user_data = await try_service_role_lookup(user_id)
-            if user_data:
-                await user_profile_cache.set(user_id, user_data)  # Cache successful lookup
-                return await finalize_user_model(user_data, None, use_service_role=True)
-        
-        # Strategy 3: Last resort - create new client and try again
-        print("🆘 Service role failed, trying fresh client connection...")
-        async with auth_monitor.measure_duration(user_id, AuthStrategy.FRESH_CLIENT):
-            user_data = await try_fresh_client_lookup(user_id)
-            if user_data:
-                await user_profile_cache.set(user_id, user_data)  # Cache successful lookup
-                return await finalize_user_model(user_data, None, use_service_role=True)
+        if user_data:
+            user = finalize_user_model(user_data)
+            await user_profile_cache.set(user_id, user)  # Cache the assembled user
+            return user
         
         print(f"❌ All fallback strategies failed for user_id: {user_id}")
         raise create_credentials_exception()
     
     try:
-        return await auth_queue.process_auth_request(user_id, fetch_user_profile)
+        user = await auth_queue.process_auth_request(user_id, fetch_user_profile)
+        verified_token_cache.set(token, user, claims.get("exp"))
+        return user
     except HTTPException:
         # Re-raise HTTPExceptions (like credentials exceptions) as-is
         raise
@@ -89,6 +88,88 @@ async def get_current_user(
         print(f"Token verification failed in auth queue: {e}")
         raise create_credentials_exception()
 
+async def verify_access_token(token: str, db: Client) -> Dict[str, Any]:
+    """Verify an access token, locally when possible, and return its claims"""
+    if settings.AUTH_LOCAL_TOKEN_VERIFICATION:
+        try:
+            claims = await token_verifier.verify(token)
+        except InvalidTokenError as e:
+            print(f"Token rejected by local verification: {e}")
+            raise create_credentials_exception()
+        if claims:
+            return claims
+    
+    # Local checks couldn't decide - ask Supabase Auth
+    try:
+        user_response = await run_sync(db.auth.get_user, token)
+        user_obj = getattr(user_response, "user", None)
+        if not user_obj or not hasattr(user_obj, "id"):
+            print(f"Invalid user object in token response")
+            raise create_credentials_exception()
+        claims = jwt.get_unverified_claims(token)
+        claims["sub"] = user_obj.id
+        return claims
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Token verification failed at Supabase level: {e}")
+        raise create_credentials_exception()
+
+async def _regular_strategy(db: Client, user_id: str) -> Optional[Dict[str, Any]]:
+    async with auth_monitor.measure_duration(user_id, AuthStrategy.REGULAR_CLIENT):
+        return await try_regular_client_lookup(db, user_id)
+
+async def _service_role_strategy(user_id: str) -> Optional[Dict[str, Any]]:
+    async with auth_monitor.measure_duration(user_id, AuthStrategy.SERVICE_ROLE):
+        return await try_service_role_lookup(user_id)
+
+async def _fresh_client_strategy(user_id: str) -> Optional[Dict[str, Any]]:
+    async with auth_monitor.measure_duration(user_id, AuthStrategy.FRESH_CLIENT):
+        return await try_fresh_client_lookup(user_id)
+
+async def sequential_profile_lookup(db: Client, user_id: str) -> Optional[Dict[str, Any]]:
+    """Try regular client, then service role, then a fresh client"""
+    user_data = await _regular_strategy(db, user_id)
+    if user_data:
+        return user_data
+    
+    print("🔑 Regular client failed, trying service role fallback...")
+    user_data = await _service_role_strategy(user_id)
+    if user_data:
+        return user_data
+    
+    print("🆘 Service role failed, trying fresh client connection...")
+    return await _fresh_client_strategy(user_id)
+
+async def hedged_profile_lookup(db: Client, user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Give the regular client a short head start, then race it against the service role client.
+    The first lookup that finds the profile wins and the other is cancelled; a fresh client is
+    only tried if both come back empty.
+    """
+    pending = {asyncio.create_task(_regular_strategy(db, user_id))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=settings.AUTH_HEDGE_DELAY_SECONDS)
+        for task in done:
+            user_data = task.result()
+            if user_data:
+                return user_data
+        
+        print("🔑 Regular client slow or empty, hedging with service role lookup...")
+        pending.add(asyncio.create_task(_service_role_strategy(user_id)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                user_data = task.result()
+                if user_data:
+                    return user_data
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    print("🆘 Regular and service role lookups failed, trying fresh client connection...")
+    return await _fresh_client_strategy(user_id)
+
 async def try_regular_client_lookup(db: Client, user_id: str) -> Optional[Dict[str, Any]]:
     """Try to fetch user profile with regular client (with circuit breaker and retry logic)"""
     
@@ -100,7 +181,7 @@ async def try_regular_client_lookup(db: Client, user_id: str) -> Optional[Dict[s
         for attempt in range(max_retries):
             try:
                 print(f"Regular client lookup attempt {attempt + 1}")
-                result = db.table("user_profiles").select("*").eq("id", user_id).execute()
+                result = await execute(db.table("user_profiles").select(PROFILE_WITH_VERIFICATION).eq("id", user_id))
                 
                 if result.data:
                     user_data = result.data[0]
@@ -136,7 +217,7 @@ async def try_service_role_lookup(user_id: str) -> Optional[Dict[str, Any]]:
         service_db = get_service_role_database()
         
         print("Executing service role query...")
-        result = service_db.table("user_profiles").select("*").eq("id", user_id).execute()
+        result = await execute(service_db.table("user_profiles").select(PROFILE_WITH_VERIFICATION).eq("id", user_id))
         
         if result.data:
             user_data = result.data[0]
@@ -163,7 +244,7 @@ async def try_fresh_client_lookup(user_id: str) -> Optional[Dict[str, Any]]:
         print("Creating fresh service role client...")
         fresh_db = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
         
-        result = fresh_db.table("user_profiles").select("*").eq("id", user_id).execute()
+        result = await execute(fresh_db.table("user_profiles").select(PROFILE_WITH_VERIFICATION).eq("id", user_id))
         
         if result.data:
             user_data = result.data[0]
@@ -179,37 +260,17 @@ async def try_fresh_client_lookup(user_id: str) -> Optional[Dict[str, Any]]:
         print(f"🔴 Circuit breaker blocked fresh client or query failed: {e}")
         return None
 
-async def finalize_user_model(user_data: Dict[str, Any], db: Optional[Client] = None, use_service_role: bool = False) -> User:
-    """Finalize user model creation with seller verification if needed"""
+def finalize_user_model(user_data: Dict[str, Any]) -> User:
+    """Build the User model from a profile row with its embedded seller verification"""
     try:
-        # If user is a seller, fetch their verification data
-        if user_data.get("type") == "seller":
-            verification_data = None
-            
-            # Try to get seller verification with the appropriate client
-            if use_service_role or not db:
-                try:
-                    from app.db.database import get_service_role_database
-                    service_db = get_service_role_database()
-                    verification_result = service_db.table("seller_verifications").select("*").eq("user_id", user_data["id"]).execute()
-                    if verification_result.data:
-                        verification_data = verification_result.data[0]
-                except Exception as e:
-                    print(f"⚠️ Failed to fetch seller verification with service role: {e}")
-            else:
-                try:
-                    verification_result = db.table("seller_verifications").select("*").eq("user_id", user_data["id"]).execute()
-                    if verification_result.data:
-                        verification_data = verification_result.data[0]
-                except Exception as e:
-                    print(f"⚠️ Failed to fetch seller verification with regular client: {e}")
-            
-            user_data["seller_verification"] = verification_data
-        else:
-            # Non-sellers don't have verification
-            user_data["seller_verification"] = None
+        user_data = dict(user_data)
+        verifications = user_data.pop("seller_verifications", None)
+        if isinstance(verifications, list):
+            verifications = verifications[0] if verifications else None
+        
+        # Only sellers carry their verification
+        user_data["seller_verification"] = verifications if user_data.get("type") == "seller" else None
         
-        print(f"About to create User model with data: {user_data}")
         user_model = User(**user_data)
         print(f"✅ User model created successfully: {user_model.email}")
         return user_model
@@ -0,0 +1,83 @@
+"""
+Cache of verified bearer tokens to the resolved User model.
+
+Entries are keyed by a SHA-256 digest of the token (the raw token is never stored)
+and expire at the earlier of the token's `exp` claim and the configured TTL, so a
+cached entry can never outlive the token it was verified from.
+"""
+import hashlib
+import time
+from typing import Any, Dict, Optional, Set
+import logging
+
+from app.core.config import settings
+from app.models.schemas import User
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def token_digest(token: str) -> str:
+    """Digest used as the cache key for a bearer token"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class VerifiedTokenCache:
+    def __init__(self, ttl: int = 60, max_size: int = 10000):
+        self.ttl = ttl
+        self._cache: TTLCache[User] = TTLCache("verified_tokens", max_size=max_size, ttl=ttl)
+        # Reverse index so a profile change can drop every token of that user.
+        # Digests of evicted/expired entries are pruned lazily on invalidation.
+        self._user_digests: Dict[str, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[User]:
+        """Get the user for a previously verified token, if still valid"""
+        return self._cache.get(token_digest(token))
+
+    def set(self, token: str, user: User, token_exp: Optional[float] = None):
+        """Cache the user for a verified token until min(token exp, now + ttl)"""
+        expires_at = float(token_exp) if token_exp is not None else None
+        if expires_at is not None and expires_at <= time.time():
+            return
+
+        digest = token_digest(token)
+        self._cache.set(digest, user, expires_at=expires_at)
+
+        user_id = str(user.id)
+        digests = self._user_digests.setdefault(user_id, set())
+        digests.add(digest)
+        if len(digests) > 1:
+            digests.intersection_update(d for d in list(digests) if d in self._cache)
+        if len(self._user_digests) > self._cache.max_size:
+            self._prune_user_index()
+
+    def invalidate_user(self, user_id: str):
+        """Drop all cached tokens for a user (e.g. after a profile or verification change)"""
+        digests = self._user_digests.pop(str(user_id), set())
+        removed = sum(1 for digest in digests if self._cache.invalidate(digest))
+        if removed:
+            logger.info(f"Invalidated {removed} cached tokens for user {user_id}")
+
+    def clear_all(self):
+        """Clear all cached tokens"""
+        self._cache.clear()
+        self._user_digests.clear()
+
+    def _prune_user_index(self):
+        """Drop reverse-index entries whose tokens have all left the cache"""
+        for user_id in list(self._user_digests):
+            live = {d for d in self._user_digests[user_id] if d in self._cache}
+            if live:
+                self._user_digests[user_id] = live
+            else:
+                del self._user_digests[user_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        stats = self._cache.get_stats()
+        stats["cached_users"] = len(self._user_digests)
+        return stats
+
+# Global verified-token cache instance
+verified_token_cache = VerifiedTokenCache(
+    ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS,
+    max_size=settings.AUTH_TOKEN_CACHE_MAX_SIZE
+)
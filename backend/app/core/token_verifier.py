@@ -0,0 +1,143 @@
+"""
+Local verification of Supabase access tokens.
+
+Supabase signs access tokens either with the project JWT secret (HS256) or with an
+asymmetric key published on the project's JWKS endpoint. Verifying them in process
+saves a round trip to Supabase Auth on every request. Tokens that cannot be decided
+locally (no secret configured, unknown key id, JWKS unreachable) are left to the
+remote check.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+import logging
+
+import httpx
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+class InvalidTokenError(Exception):
+    """Raised when a token is definitively invalid (bad signature, expired, wrong audience)."""
+
+class TokenVerifier:
+    def __init__(
+        self,
+        jwt_secret: str,
+        audience: str,
+        jwks_url: str,
+        jwks_ttl: int = 600,
+        jwks_min_refresh_interval: int = 30,
+        leeway: int = 0
+    ):
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.jwks_url = jwks_url
+        self.jwks_ttl = jwks_ttl
+        self.jwks_min_refresh_interval = jwks_min_refresh_interval
+        self.leeway = leeway
+        self._jwks: Dict[str, Dict[str, Any]] = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = asyncio.Lock()
+
+    async def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Verify a token locally.
+
+        Returns:
+            The token claims if the token is valid, or None if it cannot be decided locally
+
+        Raises:
+            InvalidTokenError: If the token is malformed, expired, or fails signature/audience checks
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise InvalidTokenError(f"Malformed token: {e}")
+
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            if not self.jwt_secret:
+                return None
+            key: Any = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self._get_signing_key(header.get("kid"))
+            if key is None:
+                return None
+        else:
+            return None
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                options={"leeway": self.leeway}
+            )
+        except ExpiredSignatureError:
+            raise InvalidTokenError("Token has expired")
+        except JWTClaimsError as e:
+            raise InvalidTokenError(f"Invalid token claims: {e}")
+        except JWTError as e:
+            raise InvalidTokenError(f"Invalid token signature: {e}")
+
+        if not claims.get("sub"):
+            raise InvalidTokenError("Token has no subject")
+        return claims
+
+    async def _get_signing_key(self, kid: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Look up a signing key by id, refreshing the cached JWKS when it is stale or the kid is unknown"""
+        if not kid or not self.jwks_url:
+            return None
+
+        now = time.time()
+        stale = now - self._jwks_fetched_at > self.jwks_ttl
+        if kid in self._jwks and not stale:
+            return self._jwks[kid]
+
+        # Don't hammer the JWKS endpoint with unknown key ids
+        if not stale and now - self._jwks_fetched_at < self.jwks_min_refresh_interval:
+            return self._jwks.get(kid)
+
+        async with self._jwks_lock:
+            # Another request may have refreshed the keys while we waited
+            if self._jwks_fetched_at > now:
+                return self._jwks.get(kid)
+            await self._refresh_jwks()
+        return self._jwks.get(kid)
+
+    async def _refresh_jwks(self):
+        """Fetch the project's JWKS, keeping the previous keys if the fetch fails"""
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(self.jwks_url)
+                response.raise_for_status()
+                keys = response.json().get("keys", [])
+            self._jwks = {key["kid"]: key for key in keys if key.get("kid")}
+            logger.info(f"Loaded {len(self._jwks)} signing keys from JWKS")
+        except Exception as e:
+            logger.warning(f"Failed to refresh JWKS from {self.jwks_url}: {e}")
+        finally:
+            self._jwks_fetched_at = time.time()
+
+def _default_jwks_url() -> str:
+    if settings.SUPABASE_JWKS_URL:
+        return settings.SUPABASE_JWKS_URL
+    if settings.SUPABASE_URL:
+        return f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+    return ""
+
+# Global token verifier instance
+token_verifier = TokenVerifier(
+    jwt_secret=settings.SUPABASE_JWT_SECRET,
+    audience=settings.SUPABASE_JWT_AUDIENCE,
+    jwks_url=_default_jwks_url(),
+    jwks_ttl=settings.AUTH_JWKS_CACHE_SECONDS,
+    leeway=settings.AUTH_TOKEN_LEEWAY_SECONDS
+)
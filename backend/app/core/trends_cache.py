@@ -0,0 +1,83 @@
+"""
+Per-user cache of emission aggregates: the get_emission_summary payload (totals,
+per-category sums and monthly trends), keyed by user and trends start month.
+
+A user's aggregates only change when their emissions do, so every emission write
+and offset invalidates that user's entries. Invalidation is in-process only; with
+several workers the TTL bounds how stale another worker's entry can be.
+"""
+import time
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+import logging
+
+from app.core.config import settings
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# start month ("YYYY-MM") -> (payload, expires_at)
+TrendsBucket = Dict[str, Tuple[Dict[str, Any], float]]
+
+class EmissionTrendsCache:
+    def __init__(self, ttl: int = 300, max_size: int = 10000):
+        self.ttl = ttl
+        # One bucket per user, so invalidating a user drops all of their start months
+        self._cache: TTLCache[TrendsBucket] = TTLCache("emission_trends", max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: UUID, start_month: str) -> Optional[Dict[str, Any]]:
+        """Get a user's cached aggregates for a start month, if still valid"""
+        bucket = self._cache.get(str(user_id))
+        entry = bucket.get(start_month) if bucket is not None else None
+        if entry is None or time.time() >= entry[1]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def bucket(self, user_id: UUID) -> TrendsBucket:
+        """The user's bucket; take it before fetching and pass it to set()"""
+        key = str(user_id)
+        bucket = self._cache.get(key)
+        if bucket is None:
+            bucket = {}
+            self._cache.set(key, bucket)
+        return bucket
+
+    def set(self, user_id: UUID, bucket: TrendsBucket, start_month: str, payload: Dict[str, Any]):
+        """Store aggregates fetched after bucket() was taken.
+
+        If the user was invalidated while the fetch was in flight the bucket is no
+        longer current and the (possibly stale) payload is dropped.
+        """
+        key = str(user_id)
+        if self._cache.get(key) is not bucket:
+            return
+        bucket[start_month] = (payload, time.time() + self.ttl)
+        # Re-storing restarts the bucket's TTL so it outlives its newest entry
+        self._cache.set(key, bucket)
+
+    def invalidate(self, user_id: UUID):
+        """Drop a user's aggregates after their emissions changed"""
+        if self._cache.invalidate(str(user_id)):
+            logger.debug(f"Invalidated emission trends for user {user_id}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics, with hits and misses counted per start month"""
+        stats = self._cache.get_stats()
+        lookups = self.hits + self.misses
+        stats.update({
+            "cached_users": stats["size"],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0
+        })
+        return stats
+
+# Global emission trends cache instance
+emission_trends_cache = EmissionTrendsCache(
+    ttl=settings.EMISSION_TRENDS_CACHE_TTL_SECONDS,
+    max_size=settings.EMISSION_TRENDS_CACHE_MAX_SIZE
+)
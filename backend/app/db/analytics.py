@@ -0,0 +1,117 @@
+"""
+Direct Postgres access for aggregation-heavy reads.
+
+An optional asyncpg pool on DATABASE_URL that lets services run real SQL (GROUP BY,
+FILTER, joins) instead of pulling every row through PostgREST. Row level security
+still applies: every query runs in a transaction that switches to the
+`authenticated` role and sets the request's JWT claims, exactly as PostgREST does,
+so `auth.uid()` in policies resolves to the caller.
+
+When the pool is disabled or unavailable, services use their PostgREST path.
+"""
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import time
+
+import asyncpg
+
+from app.core.config import settings
+from app.db.query_stats import record_query, sql_shape
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsDatabase:
+    def __init__(self):
+        self.pool: Optional[asyncpg.Pool] = None
+        self.queries = 0
+        self.failures = 0
+
+    @property
+    def configured(self) -> bool:
+        return settings.ANALYTICS_DB_ENABLED and bool(settings.DATABASE_URL)
+
+    @property
+    def available(self) -> bool:
+        return self.pool is not None
+
+    async def connect(self):
+        """Create the pool; on failure log and leave services on PostgREST"""
+        if not self.configured or self.pool is not None:
+            return
+        try:
+            self.pool = await asyncpg.create_pool(
+                settings.DATABASE_URL,
+                min_size=settings.ANALYTICS_DB_POOL_MIN_SIZE,
+                max_size=settings.ANALYTICS_DB_POOL_MAX_SIZE,
+                command_timeout=settings.ANALYTICS_DB_COMMAND_TIMEOUT_SECONDS,
+                # Prepared statements don't survive Supabase's transaction-mode pooler
+                statement_cache_size=0
+            )
+            logger.info("Analytics database pool ready")
+        except Exception as e:
+            self.pool = None
+            logger.error(f"Failed to create analytics database pool, using PostgREST: {e}")
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    def session(self, claims: Dict[str, Any]) -> Optional["AnalyticsSession"]:
+        """Bind the pool to one request's JWT claims, or None when the pool is unavailable"""
+        if not self.available:
+            return None
+        return AnalyticsSession(self, claims)
+
+    async def fetch(self, claims: Dict[str, Any], query: str, *args: Any) -> List[asyncpg.Record]:
+        """Run a query as the user identified by `claims`, with RLS enforced"""
+        self.queries += 1
+        start = time.perf_counter()
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "select set_config('request.jwt.claims', $1, true), "
+                        "set_config('request.jwt.claim.sub', $2, true)",
+                        json.dumps(claims),
+                        str(claims.get("sub", ""))
+                    )
+                    await conn.execute("set local role authenticated")
+                    return await conn.fetch(query, *args)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            record_query(sql_shape(query), time.perf_counter() - start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics"""
+        stats: Dict[str, Any] = {
+            "configured": self.configured,
+            "available": self.available,
+            "queries": self.queries,
+            "failures": self.failures
+        }
+        if self.pool is not None:
+            stats["size"] = self.pool.get_size()
+            stats["idle"] = self.pool.get_idle_size()
+            stats["max_size"] = self.pool.get_max_size()
+        return stats
+
+class AnalyticsSession:
+    """Analytics queries on behalf of one authenticated request"""
+
+    def __init__(self, database: AnalyticsDatabase, claims: Dict[str, Any]):
+        self._database = database
+        self.claims = claims
+
+    async def fetch(self, query: str, *args: Any) -> List[asyncpg.Record]:
+        return await self._database.fetch(self.claims, query, *args)
+
+    async def fetchrow(self, query: str, *args: Any) -> Optional[asyncpg.Record]:
+        rows = await self._database.fetch(self.claims, query, *args)
+        return rows[0] if rows else None
+
+# Global analytics database instance
+analytics_db = AnalyticsDatabase()
@@ -1,50 +1,227 @@
+from typing import Any, Dict, Optional
 from supabase import create_client, Client
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient
+import asyncio
+import httpx
+import threading
+import time
 from app.core.config import settings
+from app.db.query_stats import record_bytes
 import logging
 
 logger = logging.getLogger(__name__)
 
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose HTTP session runs on a shared, pooled transport"""
+
+    def __init__(self, base_url: str, transport: httpx.BaseTransport, event_hooks: Dict[str, list], **kwargs):
+        self._transport = transport
+        self._event_hooks = event_hooks
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=self._transport,
+            event_hooks=self._event_hooks,
+            follow_redirects=True
+        )
+
+class ClientPool:
+    """
+    One long-lived, pooled HTTP transport per Supabase key. Scoped clients built from the
+    pool share its keep-alive connections and differ only in their Authorization header.
+    """
+
+    def __init__(self, name: str, api_key: str):
+        self.name = name
+        self.api_key = api_key
+        self.transport = httpx.HTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+        self._event_hooks = {"request": [self._on_request], "response": [self._on_response]}
+        self._base_client: Optional[Client] = None
+        self._lock = threading.Lock()
+        self.scoped_clients = 0
+        self.requests = 0
+
+    def _on_request(self, request: httpx.Request):
+        with self._lock:
+            self.requests += 1
+
+    def _on_response(self, response: httpx.Response):
+        # Attribute the body size to the request being served, if any
+        response.read()
+        record_bytes(len(response.content))
+
+    @property
+    def base_client(self) -> Client:
+        """Full Supabase client for this key (auth, storage), created on first use"""
+        if self._base_client is None:
+            self._base_client = create_client(settings.SUPABASE_URL, self.api_key)
+        return self._base_client
+
+    def scoped(self, token: Optional[str] = None) -> "ScopedClient":
+        """Client acting as `token` (defaults to the pool's own key) on the shared transport"""
+        self.scoped_clients += 1
+        return ScopedClient(self, token or self.api_key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics"""
+        stats: Dict[str, Any] = {
+            "name": self.name,
+            "max_connections": settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.SUPABASE_POOL_MAX_KEEPALIVE,
+            "scoped_clients_created": self.scoped_clients,
+            "requests": self.requests
+        }
+        try:
+            connections = self.transport._pool.connections
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = len([c for c in connections if c.is_idle()])
+        except Exception:
+            pass
+        return stats
+
+    def close(self):
+        self.transport.close()
+
+class ScopedClient:
+    """
+    Token-scoped facade exposing the parts of the Supabase client the services use.
+    Table and RPC calls go through the pool's transport with this client's token.
+    """
+
+    def __init__(self, pool: ClientPool, token: str):
+        self._pool = pool
+        self.postgrest = PooledPostgrestClient(
+            f"{settings.SUPABASE_URL}/rest/v1",
+            transport=pool.transport,
+            event_hooks=pool._event_hooks,
+            headers={
+                "apiKey": pool.api_key,
+                "Authorization": f"Bearer {token}"
+            },
+            timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT
+        )
+
+    def table(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def from_(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn: str, params: Optional[Dict[Any, Any]] = None):
+        return self.postgrest.rpc(fn, params or {})
+
+    @property
+    def auth(self):
+        return self._pool.base_client.auth
+
+    @property
+    def storage(self):
+        return self._pool.base_client.storage
+
 class Database:
     def __init__(self):
         self.supabase: Client = None
-        
+        self._anon_pool: Optional[ClientPool] = None
+        self._service_pool: Optional[ClientPool] = None
+        self._service_client: Optional[ScopedClient] = None
+        self.healthy: Optional[bool] = None
+        self.last_probe_at: Optional[float] = None
+        self.last_probe_error: Optional[str] = None
+        self.consecutive_probe_failures = 0
+
     def connect(self):
         """Create Supabase client connection with anon key (for RLS)"""
         try:
             self.supabase = create_client(
-                settings.SUPABASE_URL, 
+                settings.SUPABASE_URL,
                 settings.SUPABASE_ANON_KEY  # Use anon key for RLS, set JWT token per request
             )
             return self.supabase
         except Exception as e:
             logger.error(f"Failed to connect to Supabase: {e}")
             raise
-    
+
     def get_client(self) -> Client:
-        """Get Supabase client instance with retry logic"""
+        """Get Supabase client instance (connection health is tracked by the background prober)"""
         if not self.supabase:
             self.connect()
-        
-        # Test the connection with a simple query to ensure it's working
+        return self.supabase
+
+    def probe(self) -> bool:
+        """Run a lightweight query against Supabase, reconnecting if it fails"""
+        self.last_probe_at = time.time()
         try:
-            # This is a lightweight test query
+            if not self.supabase:
+                self.connect()
             self.supabase.table("user_profiles").select("count").limit(0).execute()
+            self.healthy = True
+            self.consecutive_probe_failures = 0
         except Exception as e:
-            logger.warning(f"Supabase connection test failed, reconnecting: {e}")
-            self.supabase = None
-            self.connect()
-            
-        return self.supabase
-    
-    def get_client_with_token(self, token: str) -> Client:
-        """Get Supabase client with user token for RLS"""
-        client = create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
-        client.postgrest.auth(token)
-        return client
-    
-    def get_service_role_client(self) -> Client:
-        """Get Supabase client with service role key (bypasses RLS)"""
-        return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+            self.healthy = False
+            self.consecutive_probe_failures += 1
+            self.last_probe_error = str(e)
+            logger.warning(f"Supabase connection probe failed, reconnecting: {e}")
+            try:
+                self.connect()
+            except Exception as reconnect_error:
+                logger.error(f"Supabase reconnect failed: {reconnect_error}")
+        return self.healthy
+
+    def get_probe_status(self) -> Dict[str, Any]:
+        """Get the result of the most recent background probe"""
+        return {
+            "healthy": self.healthy,
+            "last_probe_at": self.last_probe_at,
+            "consecutive_failures": self.consecutive_probe_failures,
+            "last_error": self.last_probe_error
+        }
+
+    @property
+    def anon_pool(self) -> ClientPool:
+        if self._anon_pool is None:
+            self._anon_pool = ClientPool("anon", settings.SUPABASE_ANON_KEY)
+        return self._anon_pool
+
+    @property
+    def service_pool(self) -> ClientPool:
+        if self._service_pool is None:
+            self._service_pool = ClientPool("service_role", settings.SUPABASE_SERVICE_ROLE_KEY)
+        return self._service_pool
+
+    def get_client_with_token(self, token: str) -> ScopedClient:
+        """Get Supabase client with user token for RLS (shares the anon key's connection pool)"""
+        return self.anon_pool.scoped(token)
+
+    def get_service_role_client(self) -> ScopedClient:
+        """Get Supabase client with service role key (bypasses RLS, shares the service role connection pool)"""
+        # Its headers never change, so one long-lived instance serves every caller
+        if self._service_client is None:
+            self._service_client = self.service_pool.scoped()
+        return self._service_client
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get statistics for the connection pools in use"""
+        pools = [pool for pool in (self._anon_pool, self._service_pool) if pool is not None]
+        return {pool.name: pool.get_stats() for pool in pools}
+
+    def close(self):
+        """Close pooled connections"""
+        for pool in (self._anon_pool, self._service_pool):
+            if pool is not None:
+                pool.close()
 
 # Global database instance
 db = Database()
@@ -53,6 +230,33 @@ def get_database() -> Client:
     """Dependency to get database client"""
     return db.get_client()
 
-def get_service_role_database() -> Client:
+def get_service_role_database() -> ScopedClient:
     """Dependency to get service role database client (bypasses RLS)"""
     return db.get_service_role_client()
+
+_prober_task: Optional[asyncio.Task] = None
+
+async def _probe_forever(interval: float):
+    while True:
+        try:
+            await asyncio.to_thread(db.probe)
+        except Exception as e:
+            logger.error(f"Database health probe crashed: {e}")
+        await asyncio.sleep(interval)
+
+def start_health_prober(interval: float = 30):
+    """Start the background task that checks the Supabase connection and reconnects on failure"""
+    global _prober_task
+    if _prober_task is None or _prober_task.done():
+        _prober_task = asyncio.create_task(_probe_forever(interval))
+
+async def stop_health_prober():
+    """Stop the background health prober"""
+    global _prober_task
+    if _prober_task is not None:
+        _prober_task.cancel()
+        try:
+            await _prober_task
+        except asyncio.CancelledError:
+            pass
+        _prober_task = None
@@ -0,0 +1,77 @@
+"""
+Non-blocking execution of Supabase queries.
+
+supabase-py's query builders only offer a blocking `.execute()`. Calling it from an
+async route stalls the event loop for the whole network round trip, so every query
+goes through `execute()` here instead, which runs it on a bounded thread pool and
+awaits the result. The pool size caps how many queries a worker has in flight.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+import logging
+
+from app.core.config import settings
+from app.db.query_stats import current_stats, record_query, query_shape
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="db"
+)
+_lock = threading.Lock()
+_stats = {"submitted": 0, "active": 0, "completed": 0, "failed": 0}
+
+def _run(fn: Callable[..., T], *args: Any) -> T:
+    with _lock:
+        _stats["active"] += 1
+    try:
+        result = fn(*args)
+    except Exception:
+        with _lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        with _lock:
+            _stats["active"] -= 1
+            _stats["completed"] += 1
+    return result
+
+async def run_sync(fn: Callable[..., T], *args: Any) -> T:
+    """Run a blocking Supabase call (auth, storage, ...) on the database thread pool"""
+    with _lock:
+        _stats["submitted"] += 1
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (query stats) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, context.run, _run, fn, *args)
+
+def _timed_execute(query: Any) -> Any:
+    start = time.perf_counter()
+    try:
+        return query.execute()
+    finally:
+        if current_stats() is not None:
+            record_query(query_shape(query), time.perf_counter() - start)
+
+async def execute(query: Any) -> Any:
+    """Execute a PostgREST query builder without blocking the event loop"""
+    return await run_sync(_timed_execute, query)
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Get database thread pool statistics"""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats["max_workers"] = settings.DB_EXECUTOR_MAX_WORKERS
+    stats["queued"] = stats["submitted"] - stats["completed"] - stats["active"]
+    return stats
+
+def shutdown_executor():
+    """Stop the database thread pool, waiting for queries already running"""
+    _executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,91 @@
+"""
+Per-request database query instrumentation.
+
+Every query awaited through `app.db.executor.execute` (and every analytics SQL query)
+is recorded against the request that issued it: count, latency, response bytes and
+its shape - method, path and filter operators with the values stripped - so a loop
+issuing the same query per item shows up as one shape repeated many times.
+"""
+from collections import Counter
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+
+class RequestQueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.bytes = 0
+        self.shapes: Counter = Counter()
+        # Response hooks run on database executor threads
+        self._lock = threading.Lock()
+
+    def record_query(self, shape: str, duration: float):
+        with self._lock:
+            self.queries += 1
+            self.duration += duration
+            self.shapes[shape] += 1
+
+    def record_bytes(self, size: int):
+        with self._lock:
+            self.bytes += size
+
+    def repeated_shapes(self, threshold: int) -> List[Tuple[str, int]]:
+        """Query shapes issued at least `threshold` times"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.queries} queries, {self.bytes} bytes"'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "queries": self.queries,
+            "duration_ms": round(self.duration * 1000, 1),
+            "bytes": self.bytes,
+            "shapes": dict(self.shapes)
+        }
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+def begin_request() -> Tuple[RequestQueryStats, Token]:
+    """Start collecting query stats for the current request"""
+    stats = RequestQueryStats()
+    return stats, _current_stats.set(stats)
+
+def end_request(token: Token):
+    _current_stats.reset(token)
+
+def current_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+def record_query(shape: str, duration: float):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record_query(shape, duration)
+
+def record_bytes(size: int):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record_bytes(size)
+
+def query_shape(query: Any) -> str:
+    """Describe a PostgREST query without its filter values, e.g. `GET /emissions?select=*&user_id=eq`"""
+    method = getattr(query, "http_method", "?")
+    path = getattr(query, "path", "?")
+    parts = []
+    try:
+        for key, value in query.params.multi_items():
+            if key == "select":
+                parts.append(f"select={value}")
+            else:
+                # Keep the operator ("eq", "gte", "in", ...), drop the operand
+                parts.append(f"{key}={value.split('.', 1)[0]}")
+    except Exception:
+        # Instrumentation must never fail the query itself
+        pass
+    return f"{method} {path}" + (f"?{'&'.join(parts)}" if parts else "")
+
+def sql_shape(query: str) -> str:
+    """Describe a SQL query by its normalised text"""
+    return "SQL " + " ".join(query.split())[:120]
@@ -0,0 +1,48 @@
+"""
+Shared decoding of PostgREST rows into Pydantic models.
+
+`columns(Model)` is the select list for exactly the model's fields, so queries stop
+fetching columns nobody reads. `decode_rows(Model, rows)` validates a whole result
+with one cached TypeAdapter call instead of a Python-level model_validate per row;
+Pydantic parses the ISO timestamps and UUID strings PostgREST returns.
+
+Callers that only aggregate should select the few columns they need and read the
+row dicts directly rather than building models at all.
+"""
+from functools import lru_cache
+from typing import Any, Dict, List, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+@lru_cache(maxsize=None)
+def columns(model: Type[BaseModel]) -> str:
+    """Comma-separated select list of the model's fields"""
+    return ", ".join(model.model_fields)
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[M]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def decode_rows(model: Type[M], rows: List[Dict[str, Any]], skip_invalid: bool = False) -> List[M]:
+    """Validate rows into models in one pass.
+
+    With skip_invalid, a result containing bad rows is re-validated row by row and
+    the bad rows are dropped instead of failing the whole list.
+    """
+    if not rows:
+        return []
+    try:
+        return _list_adapter(model).validate_python(rows)
+    except ValidationError:
+        if not skip_invalid:
+            raise
+
+    decoded = []
+    for row in rows:
+        try:
+            decoded.append(model.model_validate(row))
+        except ValidationError:
+            continue
+    return decoded
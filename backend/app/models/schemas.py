@@ -33,6 +33,7 @@ class CreditStatus(str, Enum):
 
 class PurchaseStatus(str, Enum):
     PENDING = "pending"
+    PENDING_SETTLEMENT = "pending_settlement"  # Recorded and reserved; the mint hasn't been confirmed yet
     COMPLETED = "completed"
     CANCELLED = "cancelled"
 
@@ -128,6 +129,26 @@ class Emission(EmissionBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class IngestionRowError(BaseModel):
+    line: int  # Line in the upload (CSV header is line 1)
+    error: str
+
+class EmissionIngestionJob(BaseModel):
+    job_id: str
+    user_id: UUID
+    status: str  # queued, processing, completed, failed
+    format: str  # csv, ndjson
+    progress: int = 0  # 0-100, by bytes of the upload consumed
+    bytes_total: int = 0
+    rows_processed: int = 0
+    rows_inserted: int = 0
+    rows_failed: int = 0
+    errors: List[IngestionRowError] = []
+    errors_truncated: bool = False
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
 # Carbon Credit Models
 class CarbonCreditBase(BaseModel):
     project_name: str
@@ -169,6 +190,8 @@ class CarbonCreditPurchase(CarbonCreditPurchaseBase):
     retired_quantity: float = 0.0
     last_retirement_date: Optional[datetime] = None
     blockchain_tx_hash: Optional[str] = None
+    settlement_error: Optional[str] = None
+    settled_at: Optional[datetime] = None
     credit: Optional['SellerCreditWithProject'] = None
     
     model_config = ConfigDict(from_attributes=True)
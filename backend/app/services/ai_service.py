@@ -6,8 +6,14 @@ from uuid import UUID
 import random
 from datetime import datetime, timedelta, timezone
 from supabase import Client
+import logging
 
 from ..models.schemas import CarbonCredit, Emission
+from ..db.executor import execute
+from ..core.config import settings
+from .marketplace_catalog import marketplace_catalog
+
+logger = logging.getLogger(__name__)
 
 
 class AIRecommendationService:
@@ -74,7 +80,16 @@ class AIRecommendationService:
 
     async def _get_available_credits(self) -> List[CarbonCredit]:
         """Get all available carbon credits."""
-        response = self.supabase.table("carbon_credits").select("*").eq("status", "available").execute()
+        # The marketplace's own listings, with what's actually left of each
+        if settings.MARKETPLACE_CATALOG_ENABLED:
+            try:
+                await marketplace_catalog.ensure_fresh()
+                return marketplace_catalog.all_credits()
+            except Exception as e:
+                logger.warning(f"Marketplace catalog unavailable, querying listings: {str(e)}")
+            return await marketplace_catalog.load_credits()
+        
+        response = await execute(self.supabase.table("carbon_credits").select("*").eq("status", "available"))
         return [CarbonCredit(**credit) for credit in response.data]
 
     def _find_exact_matches(self, emissions: List[Emission], credits: List[CarbonCredit]) -> List[Dict[str, Any]]:
@@ -2,6 +2,8 @@ from typing import Optional
 from supabase import Client
 from app.models.schemas import UserCreate, UserLogin, User, UserInDB, UserType
 from app.db.database import get_database
+from app.db.executor import execute, run_sync
+import asyncio
 import uuid
 from datetime import datetime
 
@@ -12,7 +14,7 @@ class AuthService:
     async def create_user(self, user_create: UserCreate, user_type: str = "buyer") -> tuple[User, str]:
         """Create a new user using Supabase Auth API and return user with Supabase token."""
         # Check if user already exists
-        existing_user = self.db.table("user_profiles").select("*").eq("email", user_create.email).execute()
+        existing_user = await execute(self.db.table("user_profiles").select("*").eq("email", user_create.email))
         if existing_user.data:
             raise ValueError("User with this email already exists")
         
@@ -21,7 +23,7 @@ class AuthService:
             user_create.type = UserType(user_type)
         
         # Register user with Supabase Auth (not direct insert)
-        auth_response = self.db.auth.sign_up({
+        auth_response = await run_sync(self.db.auth.sign_up, {
             "email": user_create.email,
             "password": user_create.password,
             "options": {
@@ -51,9 +53,8 @@ class AuthService:
         user_id = user_data.id
         
         # Wait for trigger to create user_profiles row, then update it with correct type
-        import time
         for attempt in range(10):  # Try for up to ~2 seconds
-            profile = self.db.table("user_profiles").select("*").eq("email", user_create.email).execute()
+            profile = await execute(self.db.table("user_profiles").select("*").eq("email", user_create.email))
             if profile.data:
                 # Update the profile with the correct type if it's missing or incorrect
                 profile_data = profile.data[0]
@@ -63,20 +64,20 @@ class AuthService:
                         "type": expected_type
                     }
                     
-                    updated_profile = self.db.table("user_profiles").update(update_data).eq("id", profile_data["id"]).execute()
+                    updated_profile = await execute(self.db.table("user_profiles").update(update_data).eq("id", profile_data["id"]))
                     if updated_profile.data:
                         profile_data = updated_profile.data[0]
                 
                 user = User(**profile_data)
                 return user, access_token
-            time.sleep(0.2)
+            await asyncio.sleep(0.2)
         raise Exception("User profile creation timed out. Please try again.")
     
     async def authenticate_user(self, email: str, password: str) -> Optional[tuple[User, str]]:
         """Authenticate user with Supabase Auth and return user with Supabase token."""
         try:
             # Supabase Auth sign-in
-            auth_response = self.db.auth.sign_in_with_password({
+            auth_response = await run_sync(self.db.auth.sign_in_with_password, {
                 "email": email,
                 "password": password
             })
@@ -93,7 +94,7 @@ class AuthService:
                 return None
             user_id = user_data.id
             # Fetch user profile by ID (not email) to match RLS policy
-            result = self.db.table("user_profiles").select("*").eq("id", user_id).execute()
+            result = await execute(self.db.table("user_profiles").select("*").eq("id", user_id))
             if not result.data:
                 return None
             user = User(**result.data[0])
@@ -103,14 +104,14 @@ class AuthService:
 
     async def get_user_by_id(self, user_id: str) -> Optional[User]:
         """Get user profile by ID (for RLS compliance)."""
-        result = self.db.table("user_profiles").select("*").eq("id", user_id).execute()
+        result = await execute(self.db.table("user_profiles").select("*").eq("id", user_id))
         if not result.data:
             return None
         return User(**result.data[0])
 
     async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user profile by email (only works if authenticated as that user due to RLS)."""
-        result = self.db.table("user_profiles").select("*").eq("email", email).execute()
+        result = await execute(self.db.table("user_profiles").select("*").eq("email", email))
         if not result.data:
             return None
         return User(**result.data[0])
@@ -4,6 +4,7 @@ Blockchain service for handling Web3 interactions.
 import logging
 from typing import Optional, Dict, Any
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from eth_account import Account
 import json
 import os
@@ -68,38 +69,13 @@ class BlockchainService:
     ) -> Optional[str]:
         """Mint carbon credits to a wallet address."""
         try:
-            contract = self.get_contract('HackCarbonToken')
-            if not contract:
-                return None
-            
-            # Convert amount to wei (18 decimals)
-            amount_wei = self.w3.to_wei(amount, 'ether')
-            price_wei = int(price * 100)  # Convert to cents
-            
-            # Build transaction
-            transaction = contract.functions.mintCarbonCredits(
-                to_address,
-                amount_wei,
-                project_id,
-                vintage,
-                standard,
-                price_wei
-            ).build_transaction({
-                'from': self.admin_account.address,
-                'nonce': self.w3.eth.get_transaction_count(self.admin_account.address),
-                'gas': 500000,
-                'gasPrice': self.w3.to_wei('20', 'gwei')
-            })
-            
-            # Sign and send transaction
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, self.admin_private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+            signed = self.sign_mint_transaction(to_address, amount, project_id, vintage, standard, price)
+            self.broadcast_transaction(signed["raw_transaction"])
+            tx_hash = signed["tx_hash"]
             
             # Wait for transaction receipt
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            if receipt.status == 1:
-                return tx_hash.hex()
+            if self.wait_for_receipt(tx_hash):
+                return tx_hash
             else:
                 logger.error("Transaction failed")
                 return None
@@ -108,6 +84,74 @@ class BlockchainService:
             logger.error(f"Failed to mint carbon credits: {e}")
             return None
     
+    def sign_mint_transaction(
+        self, 
+        to_address: str, 
+        amount: float, 
+        project_id: str, 
+        vintage: str, 
+        standard: str, 
+        price: float
+    ) -> Dict[str, Any]:
+        """Sign a mint without sending it.
+        
+        Returns its tx_hash, nonce and raw_transaction, so the hash can be recorded
+        before broadcast_transaction sends it.
+        """
+        contract = self.get_contract('HackCarbonToken')
+        if not contract:
+            raise RuntimeError("HackCarbonToken contract is not available")
+        
+        # Convert amount to wei (18 decimals)
+        amount_wei = self.w3.to_wei(amount, 'ether')
+        price_wei = int(price * 100)  # Convert to cents
+        
+        # Build transaction; the pending nonce counts mints that are sent but not mined yet
+        transaction = contract.functions.mintCarbonCredits(
+            to_address,
+            amount_wei,
+            project_id,
+            vintage,
+            standard,
+            price_wei
+        ).build_transaction({
+            'from': self.admin_account.address,
+            'nonce': self.w3.eth.get_transaction_count(self.admin_account.address, 'pending'),
+            'gas': 500000,
+            'gasPrice': self.w3.to_wei('20', 'gwei')
+        })
+        
+        signed_txn = self.w3.eth.account.sign_transaction(transaction, self.admin_private_key)
+        return {
+            'tx_hash': Web3.to_hex(signed_txn.hash),
+            'nonce': transaction['nonce'],
+            'raw_transaction': Web3.to_hex(signed_txn.raw_transaction)
+        }
+    
+    def broadcast_transaction(self, raw_transaction: str) -> None:
+        """Send a signed transaction to the node; sending the same one again is harmless."""
+        self.w3.eth.send_raw_transaction(raw_transaction)
+    
+    def transaction_known(self, tx_hash: str) -> bool:
+        """Whether the node has the transaction, pending or mined."""
+        try:
+            self.w3.eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+    
+    def nonce_used(self, nonce: int) -> bool:
+        """Whether a mined transaction from the admin account already has this nonce."""
+        return self.w3.eth.get_transaction_count(self.admin_account.address, 'latest') > nonce
+    
+    def wait_for_receipt(self, tx_hash: str, timeout: float = 120) -> bool:
+        """Wait for a transaction to be mined; True if it succeeded, False if it reverted.
+        
+        Raises web3.exceptions.TimeExhausted if it isn't mined within timeout seconds.
+        """
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+        return receipt.status == 1
+    
     def retire_carbon_credits(
         self, 
         from_address: str, 
@@ -175,12 +219,16 @@ class BlockchainService:
                 logger.error(f"Failed to get balance for {address}: {e}")
             return 0.0
     
-    def validate_transaction(self, user_address: str, amount: float, tx_hash: str) -> bool:
-        """Validate a blockchain transaction."""
+    def validate_transaction(self, user_address: str, tx_hash: str, expected_value_wei: int) -> bool:
+        """Validate a buyer's payment: a successful transaction from user_address to the
+        CarbonMarketplace contract carrying expected_value_wei.
+        
+        Anything that can't be checked (node unavailable, unknown hash) is invalid.
+        """
         try:
             if not self.is_connected():
-                logger.warning("Blockchain not connected, skipping transaction validation")
-                return True  # Allow transaction to proceed when blockchain is unavailable
+                logger.warning(f"Blockchain not connected, cannot validate transaction {tx_hash}")
+                return False
             
             # Get transaction receipt
             receipt = self.w3.eth.get_transaction_receipt(tx_hash)
@@ -196,17 +244,22 @@ class BlockchainService:
                 logger.error(f"Transaction sender mismatch: expected {user_address}, got {transaction['from']}")
                 return False
             
-            # Additional validations can be added here
-            # - Check if transaction interacted with correct contract
-            # - Validate amount/value
-            # - Check gas usage, etc.
+            # Validate that it paid the marketplace
+            marketplace = self.contract_addresses['CarbonMarketplace']
+            if (transaction.get('to') or '').lower() != marketplace.lower():
+                logger.error(f"Transaction {tx_hash} was not sent to the marketplace: got {transaction.get('to')}")
+                return False
+            
+            # Validate the amount paid
+            if transaction['value'] != expected_value_wei:
+                logger.error(f"Transaction value mismatch: expected {expected_value_wei} wei, got {transaction['value']}")
+                return False
             
             return True
             
         except Exception as e:
             logger.error(f"Failed to validate transaction {tx_hash}: {e}")
-            # In production, you might want to be more strict about validation failures
-            return True  # For now, allow transactions when validation fails
+            return False
     
     def is_connected(self) -> bool:
         """Check if connected to blockchain network."""
@@ -1,15 +1,30 @@
 from typing import List, Optional
 from supabase import Client
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
 from app.models.schemas import EmissionCreate, Emission, EmissionSummary, MonthlyTrend, OffsetStats
 from app.core.config import settings
+from app.core.trends_cache import emission_trends_cache
 from app.db.database import get_database
+from app.db.executor import execute
+from app.db.analytics import AnalyticsSession
+from app.db.rows import columns, decode_rows
+from app.utils.pagination import encode_cursor, decode_cursor, postgrest_quote
 from uuid import UUID
 from datetime import datetime, timedelta, timezone  
 from calendar import month_abbr
 
+# Only the columns Emission reads, not e.g. metadata or remaining_amount
+EMISSION_COLUMNS = columns(Emission)
+
+def emission_cursor(emission: Emission) -> str:
+    """Keyset cursor pointing just after `emission` in get_user_emissions order."""
+    return encode_cursor(emission.created_at, emission.id)
+
 class EmissionService:
-    def __init__(self, db: Client):
+    def __init__(self, db: Client, analytics: Optional[AnalyticsSession] = None):
         self.db = db
+        self.analytics = analytics
     
     async def create_emission(self, user_id: UUID, emission_data: EmissionCreate) -> Emission:
         """Create a new emission activity."""
@@ -26,17 +41,29 @@ class EmissionService:
                 **emission_dict
             }
             
-            result = self.db.table("emissions").insert(insert_data).execute()
+            result = await execute(self.db.table("emissions").insert(insert_data))
             
             if not result.data:
                 raise ValueError("Failed to create emission activity")
             
             emission = Emission.model_validate(result.data[0])
+            emission_trends_cache.invalidate(user_id)
             return emission
             
         except Exception as e:
             raise
 
+    async def create_emissions(self, user_id: UUID, emissions: List[EmissionCreate]) -> int:
+        """Insert several emission activities in one statement; returns how many were inserted."""
+        if not emissions:
+            return 0
+        # user_id goes last so it's always the caller's, even on a service-role client
+        rows = [{**emission.model_dump(mode="json"), "user_id": str(user_id)} for emission in emissions]
+        # Bulk callers only need the count, so skip sending the rows back
+        await execute(self.db.table("emissions").insert(rows, returning=ReturnMethod.minimal))
+        emission_trends_cache.invalidate(user_id)
+        return len(rows)
+
     async def get_user_emissions(
         self,
         user_id: UUID,
@@ -45,25 +72,44 @@ class EmissionService:
         category: Optional[str] = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
-        filter_by_created_at: bool = False
+        filter_by_created_at: bool = False,
+        cursor: Optional[str] = None
     ) -> List[Emission]:
         """Get emissions for a user with optional filtering and pagination.
         
         Args:
             filter_by_created_at: If True, filter by created_at instead of date field.
                                  Useful for getting recently added records regardless of their activity date.
+            cursor: Keyset cursor from emission_cursor() for the last row of the previous page.
+                    When given, `skip` is ignored.
         """
-        query = self.db.table("emissions").select("*").eq("user_id", str(user_id))
+        query = self.db.table("emissions").select(EMISSION_COLUMNS).eq("user_id", str(user_id))
         
         # Only apply category filter if provided
         if category:
             query = query.eq("category", category)
         
-        # Remove all date filtering - get all emissions
-        # Order by created_at descending to show newest first
-        result = query.order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+        # Date window, on the activity date or on when the record was added
+        date_column = "created_at" if filter_by_created_at else "date"
+        if start_date:
+            query = query.gte(date_column, start_date.isoformat())
+        if end_date:
+            query = query.lte(date_column, end_date.isoformat())
+        
+        # Newest first; id breaks ties so the order is total and the cursor is exact
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        
+        if cursor:
+            created_at, emission_id = decode_cursor(cursor, 2)
+            query = query.or_(
+                f"created_at.lt.{postgrest_quote(created_at)},"
+                f"and(created_at.eq.{postgrest_quote(created_at)},id.lt.{postgrest_quote(emission_id)})"
+            )
+            result = await execute(query.limit(limit))
+        else:
+            result = await execute(query.range(skip, skip + limit - 1))
         
-        return [Emission.model_validate(item) for item in result.data]
+        return decode_rows(Emission, result.data)
 
     async def get_emission_summary(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> EmissionSummary:
         """Get emission summary for a user for a given period."""
@@ -73,74 +119,22 @@ class EmissionService:
         if start_date is None:
             start_date = end_date - timedelta(days=90)
         
-        # 1. Get overall summary from the view
-        stats_result = self.db.table("user_dashboard_stats").select("*").eq("user_id", str(user_id)).execute()
-        if stats_result.data and len(stats_result.data) > 0:
-            stats_data = stats_result.data[0]
-        else:
-            stats_data = {}
-
-        # 2. Get ALL emissions by category (not filtered by date range)
-        cat_result = self.db.table("emissions").select("category, co2_equivalent") \
-            .eq("user_id", str(user_id)) \
-            .execute()
-
-        emissions_by_category = {}
-        for item in cat_result.data or []:
-            cat = item['category']
-            emissions_by_category[cat] = emissions_by_category.get(cat, 0) + item['co2_equivalent']        # 3. Get monthly trends for the last 12 months
+        # Monthly trends cover the last 12 months
         trends_start_date = (datetime.now(timezone.utc) - timedelta(days=365)).replace(day=1)
-        monthly_trends_result = self.db.rpc('get_monthly_trends', {
-            'p_user_id': str(user_id), 
-            'p_start_date': trends_start_date.isoformat()
-        }).execute()
+        summary = await self._get_aggregates(user_id, trends_start_date)
+
+        total_emissions = float(summary.get('total_emissions') or 0)
+        total_offsets = float(summary.get('total_offsets') or 0)
+        emissions_by_category = summary.get('emissions_by_category') or {}
         
         try:
-            monthly_trends = [MonthlyTrend.model_validate(t) for t in (monthly_trends_result.data or [])]
+            monthly_trends = [MonthlyTrend.model_validate(t) for t in (summary.get('monthly_trends') or [])]
         except Exception as e:
             monthly_trends = []
 
-        try:
-            # Calculate total emissions from actual data
-            total_emissions = sum(emissions_by_category.values()) if emissions_by_category else 0
-            
-            # Calculate total offsets directly from emissions table
-            # Get all emissions with their offset amounts
-            all_emissions_result = self.db.table("emissions").select("offset_amount") \
-                .eq("user_id", str(user_id)) \
-                .execute()
-            
-            total_offsets = 0.0
-            for emission_data in all_emissions_result.data or []:
-                offset_amount = emission_data.get('offset_amount', 0)
-                if offset_amount:
-                    total_offsets += offset_amount
-            
-            # Calculate net emissions
-            net_emissions = max(0, total_emissions - total_offsets)
-            
-            # Calculate offset percentage
-            if total_emissions > 0:
-                offset_percentage = (total_offsets / total_emissions) * 100
-            else:
-                offset_percentage = 0.0
-        except Exception as e:
-            # Fallback: calculate directly from emissions data
-            total_emissions = sum(emissions_by_category.values()) if emissions_by_category else 0
-            
-            # Calculate total offsets as fallback
-            all_emissions_result = self.db.table("emissions").select("offset_amount") \
-                .eq("user_id", str(user_id)) \
-                .execute()
-            
-            total_offsets = 0.0
-            for emission_data in all_emissions_result.data or []:
-                offset_amount = emission_data.get('offset_amount', 0)
-                if offset_amount:
-                    total_offsets += offset_amount
-            
-            net_emissions = max(0, total_emissions - total_offsets)
-            offset_percentage = (total_offsets / total_emissions * 100) if total_emissions > 0 else 0.0
+        # Calculate net emissions and offset percentage
+        net_emissions = max(0, total_emissions - total_offsets)
+        offset_percentage = (total_offsets / total_emissions * 100) if total_emissions > 0 else 0.0
 
         try:
             emission_summary = EmissionSummary(
@@ -157,12 +151,88 @@ class EmissionService:
             print(f"Error creating EmissionSummary: {e}")
             raise
 
+    async def _get_aggregates(self, user_id: UUID, trends_start_date: datetime) -> dict:
+        """Totals, per-category sums, offsets and monthly trends from trends_start_date's month, cached per user."""
+        start_month = trends_start_date.strftime("%Y-%m")
+        cached = emission_trends_cache.get(user_id, start_month)
+        if cached is not None:
+            return cached
+        
+        bucket = emission_trends_cache.bucket(user_id)
+        trends_start_date = trends_start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        
+        # All of it in one server-side aggregate
+        try:
+            result = await execute(self.db.rpc('get_emission_summary', {
+                'p_user_id': str(user_id),
+                'p_start_date': trends_start_date.isoformat()
+            }))
+            summary = result.data or {}
+        except Exception as e:
+            print(f"get_emission_summary RPC failed, aggregating in the service: {e}")
+            summary = await self._aggregate_emission_summary(user_id, trends_start_date)
+        
+        emission_trends_cache.set(user_id, bucket, start_month, summary)
+        return summary
+
+    async def _aggregate_emission_summary(self, user_id: UUID, trends_start_date: datetime) -> dict:
+        """Build the get_emission_summary payload without the RPC (for databases without it)."""
+        sql_totals = await self._category_totals_sql(user_id)
+        if sql_totals is not None:
+            emissions_by_category, total_offsets = sql_totals
+        else:
+            # One scan for both category totals and offsets
+            result = await execute(self.db.table("emissions").select("category, co2_equivalent, offset_amount")
+                .eq("user_id", str(user_id)))
+
+            emissions_by_category = {}
+            total_offsets = 0.0
+            for item in result.data or []:
+                cat = item['category']
+                emissions_by_category[cat] = emissions_by_category.get(cat, 0) + item['co2_equivalent']
+                total_offsets += item.get('offset_amount') or 0
+
+        monthly_trends_result = await execute(self.db.rpc('get_monthly_trends', {
+            'p_user_id': str(user_id),
+            'p_start_date': trends_start_date.isoformat()
+        }))
+
+        return {
+            'total_emissions': sum(emissions_by_category.values()),
+            'total_offsets': total_offsets,
+            'emissions_by_category': emissions_by_category,
+            'monthly_trends': monthly_trends_result.data or []
+        }
+
+    async def _category_totals_sql(self, user_id: UUID) -> Optional[tuple[dict, float]]:
+        """Per-category emissions and total offsets via direct SQL, or None to use PostgREST."""
+        if not self.analytics:
+            return None
+        try:
+            rows = await self.analytics.fetch(
+                """
+                select category,
+                       sum(co2_equivalent)::float8 as emissions,
+                       coalesce(sum(offset_amount), 0)::float8 as offsets
+                from emissions
+                where user_id = $1
+                group by category
+                """,
+                user_id
+            )
+        except Exception as e:
+            print(f"Analytics query failed for emission summary, using PostgREST: {e}")
+            return None
+        emissions_by_category = {row["category"]: row["emissions"] for row in rows}
+        total_offsets = sum(row["offsets"] for row in rows)
+        return emissions_by_category, total_offsets
+
     async def get_emission_by_id(self, emission_id: UUID, user_id: UUID) -> Optional[Emission]:
         """Get a single emission by its ID."""
-        result = self.db.table("emissions").select("*") \
-            .eq("id", str(emission_id)) \
-            .eq("user_id", str(user_id)) \
-            .single().execute()
+        result = await execute(self.db.table("emissions").select(EMISSION_COLUMNS)
+            .eq("id", str(emission_id))
+            .eq("user_id", str(user_id))
+            .single())
             
         if not result.data:
             return None
@@ -170,37 +240,58 @@ class EmissionService:
 
     async def update_emission(self, emission_id: UUID, user_id: UUID, emission_data: EmissionCreate) -> Optional[Emission]:
         """Update an emission activity."""
-        result = self.db.table("emissions").update(emission_data.model_dump()) \
-            .eq("id", str(emission_id)) \
-            .eq("user_id", str(user_id)) \
-            .execute()
+        result = await execute(self.db.table("emissions").update(emission_data.model_dump())
+            .eq("id", str(emission_id))
+            .eq("user_id", str(user_id)))
 
         if not result.data:
             return None
         
+        emission_trends_cache.invalidate(user_id)
         return await self.get_emission_by_id(emission_id, user_id)
 
     async def delete_emission(self, emission_id: UUID, user_id: UUID) -> bool:
         """Delete an emission activity."""
-        result = self.db.table("emissions").delete() \
-            .eq("id", str(emission_id)) \
-            .eq("user_id", str(user_id)) \
-            .execute()
-            
-        return len(result.data) > 0
+        result = await execute(self.db.table("emissions").delete()
+            .eq("id", str(emission_id))
+            .eq("user_id", str(user_id)))
+        
+        deleted = len(result.data) > 0
+        if deleted:
+            emission_trends_cache.invalidate(user_id)
+        return deleted
 
     async def get_emission_trends(self, user_id: UUID, months_back: int) -> List[MonthlyTrend]:
         """Get emission trends over a specified number of months."""
         start_date = (datetime.now(timezone.utc) - timedelta(days=months_back * 30)).replace(day=1)
         
-        # This assumes a DB function `get_monthly_trends` exists for this purpose.
-        # If not, it needs to be created.
-        result = self.db.rpc('get_monthly_trends', {
-            'p_user_id': str(user_id),
-            'p_start_date': start_date.isoformat()
-        }).execute()
+        # Trends come from the per-month rollups behind get_emission_summary
+        summary = await self._get_aggregates(user_id, start_date)
+        return decode_rows(MonthlyTrend, summary.get('monthly_trends') or [])
+
+    async def _fetch_emissions_by_ids(self, user_id: UUID, emission_ids: List[UUID]) -> dict:
+        """Fetch the user's emissions with the given ids in one query, keyed by id."""
+        result = await execute(self.db.table("emissions").select(EMISSION_COLUMNS)
+            .eq("user_id", str(user_id))
+            .in_("id", [str(emission_id) for emission_id in emission_ids]))
+        return {str(emission.id): emission for emission in decode_rows(Emission, result.data)}
 
-        return [MonthlyTrend.model_validate(item) for item in result.data]
+    async def _apply_offsets(self, user_id: UUID, allocations: List[dict], offset_date: datetime) -> List[Emission]:
+        """Write all offset allocations in one transaction (apply_emission_offsets RPC)."""
+        try:
+            result = await execute(self.db.rpc('apply_emission_offsets', {
+                'p_user_id': str(user_id),
+                'p_allocations': allocations,
+                'p_offset_date': offset_date.isoformat()
+            }))
+        except APIError as e:
+            if e.code == '40001':
+                raise ValueError("Some emissions were offset by another request; nothing was applied, please retry")
+            raise
+        emission_trends_cache.invalidate(user_id)
+        updated = {str(emission.id): emission for emission in decode_rows(Emission, result.data)}
+        # Keep the caller's order
+        return [updated[a["id"]] for a in allocations if a["id"] in updated]
 
     async def offset_emissions(
         self, 
@@ -212,20 +303,16 @@ class EmissionService:
         """Offset specific emissions using retired carbon credits."""
         try:
             # Get the emissions to be offset
+            emission_ids = list(dict.fromkeys(emission_ids))
+            found = await self._fetch_emissions_by_ids(user_id, emission_ids)
             emissions_to_offset = []
             total_emissions_amount = 0.0
             
             for emission_id in emission_ids:
-                result = self.db.table("emissions").select("*") \
-                    .eq("id", str(emission_id)) \
-                    .eq("user_id", str(user_id)) \
-                    .eq("is_offset", False) \
-                    .execute()
-                
-                if not result.data:
+                emission = found.get(str(emission_id))
+                if not emission or emission.is_offset:
                     raise ValueError(f"Emission {emission_id} not found or already offset")
                 
-                emission = Emission.model_validate(result.data[0])
                 emissions_to_offset.append(emission)
                 total_emissions_amount += emission.co2_equivalent
             
@@ -233,31 +320,19 @@ class EmissionService:
             if total_offset_amount > total_emissions_amount:
                 raise ValueError(f"Offset amount ({total_offset_amount}) cannot exceed total emissions ({total_emissions_amount})")
             
-            # Update emissions as offset
-            offset_date = datetime.now(timezone.utc)
-            updated_emissions = []
-            
+            # Calculate proportional offset for each emission
+            allocations = []
             for emission in emissions_to_offset:
-                # Calculate proportional offset for this emission
                 proportion = emission.co2_equivalent / total_emissions_amount
-                offset_amount = total_offset_amount * proportion
-                
-                update_data = {
-                    "offset_amount": offset_amount,
+                allocations.append({
+                    "id": str(emission.id),
+                    "offset_amount": total_offset_amount * proportion,
+                    "expected_offset_amount": emission.offset_amount or 0.0,
                     "is_offset": True,
-                    "offset_date": offset_date.isoformat(),
-                    "offset_purchase_id": str(purchase_id),
-                    "updated_at": offset_date.isoformat()
-                }
-                
-                result = self.db.table("emissions").update(update_data) \
-                    .eq("id", str(emission.id)) \
-                    .execute()
-                
-                if result.data:
-                    updated_emissions.append(Emission.model_validate(result.data[0]))
+                    "offset_purchase_id": str(purchase_id)
+                })
             
-            return updated_emissions
+            return await self._apply_offsets(user_id, allocations, datetime.now(timezone.utc))
             
         except Exception as e:
             print(f"Error in offset_emissions: {e}")
@@ -272,20 +347,16 @@ class EmissionService:
         """Offset specific emissions using multiple credit purchases in a single transaction."""
         try:
             # Get the emissions to be offset
+            emission_ids = list(dict.fromkeys(emission_ids))
+            found = await self._fetch_emissions_by_ids(user_id, emission_ids)
             emissions_to_offset = []
             total_emissions_amount = 0.0
             
             for emission_id in emission_ids:
-                result = self.db.table("emissions").select("*") \
-                    .eq("id", str(emission_id)) \
-                    .eq("user_id", str(user_id)) \
-                    .execute()
-                
-                if not result.data:
+                emission = found.get(str(emission_id))
+                if not emission:
                     raise ValueError(f"Emission {emission_id} not found")
                 
-                emission = Emission.model_validate(result.data[0])
-                
                 # Check if emission has remaining amount to offset
                 remaining_amount = emission.co2_equivalent - (emission.offset_amount or 0)
                 if remaining_amount <= 0:
@@ -301,45 +372,30 @@ class EmissionService:
             if total_offset_amount_kg > total_emissions_amount:
                 raise ValueError(f"Offset amount ({total_offset_amount_kg/1000:.3f} tonnes) cannot exceed total emissions ({total_emissions_amount/1000:.3f} tonnes)")
             
-            # Update emissions as offset with combined purchase information
-            offset_date = datetime.now(timezone.utc)
-            updated_emissions = []
-            
             # Create a summary of all purchase IDs used
             purchase_ids = [allocation["purchase_id"] for allocation in credit_allocations]
             primary_purchase_id = purchase_ids[0]  # Use first purchase as primary reference
             
+            allocations = []
             for emission in emissions_to_offset:
                 # Calculate remaining amount for this emission
-                remaining_amount = emission.co2_equivalent - (emission.offset_amount or 0)
+                current_offset = emission.offset_amount or 0.0
+                remaining_amount = emission.co2_equivalent - current_offset
                 
                 # Calculate proportional offset for this emission based on remaining amount
                 proportion = remaining_amount / total_emissions_amount
-                additional_offset_kg = total_offset_amount_kg * proportion
-                
-                # Calculate new cumulative offset amount
-                current_offset = emission.offset_amount or 0.0
-                new_offset_amount = current_offset + additional_offset_kg
-                
-                # Check if emission is now fully offset
-                is_fully_offset = new_offset_amount >= emission.co2_equivalent
+                new_offset_amount = current_offset + total_offset_amount_kg * proportion
                 
-                update_data = {
+                allocations.append({
+                    "id": str(emission.id),
                     "offset_amount": new_offset_amount,
-                    "is_offset": is_fully_offset,
-                    "offset_date": offset_date.isoformat(),
-                    "offset_purchase_id": str(primary_purchase_id),  # Reference primary purchase
-                    "updated_at": offset_date.isoformat()
-                }
-                
-                result = self.db.table("emissions").update(update_data) \
-                    .eq("id", str(emission.id)) \
-                    .execute()
-                
-                if result.data:
-                    updated_emissions.append(Emission.model_validate(result.data[0]))
+                    "expected_offset_amount": current_offset,
+                    # Check if emission is now fully offset
+                    "is_offset": new_offset_amount >= emission.co2_equivalent,
+                    "offset_purchase_id": str(primary_purchase_id)  # Reference primary purchase
+                })
             
-            return updated_emissions
+            return await self._apply_offsets(user_id, allocations, datetime.now(timezone.utc))
             
         except Exception as e:
             print(f"Error in bulk_offset_emissions: {e}")
@@ -348,22 +404,42 @@ class EmissionService:
     async def get_offset_stats(self, user_id: UUID) -> OffsetStats:
         """Get offset statistics for a user."""
         
+        if self.analytics:
+            try:
+                row = await self.analytics.fetchrow(
+                    """
+                    select coalesce(sum(co2_equivalent), 0)::float8 as total_emissions,
+                           coalesce(sum(offset_amount) filter (where is_offset), 0)::float8 as total_offset_amount,
+                           count(*) filter (where is_offset) as offset_emissions_count
+                    from emissions
+                    where user_id = $1
+                    """,
+                    user_id
+                )
+                total_emissions = row["total_emissions"]
+                total_offset_amount = row["total_offset_amount"]
+                return OffsetStats(
+                    total_emissions=total_emissions,
+                    total_offset_amount=total_offset_amount,
+                    net_emissions=total_emissions - total_offset_amount,
+                    offset_percentage=(total_offset_amount / total_emissions * 100) if total_emissions > 0 else 0,
+                    offset_emissions_count=row["offset_emissions_count"],
+                    available_for_offset=total_emissions - total_offset_amount
+                )
+            except Exception as e:
+                print(f"Analytics query failed for offset stats, using PostgREST: {e}")
+        
         try:
-            # Get all emissions for the user
-            result = self.db.table("emissions").select("*") \
-                .eq("user_id", str(user_id)) \
-                .execute()
-            
-            total_emissions = 0.0
-            total_offset_amount = 0.0
-            offset_emissions_count = 0
+            try:
+                result = await execute(self.db.rpc('get_offset_stats', {'p_user_id': str(user_id)}))
+                totals = result.data or {}
+            except APIError as e:
+                print(f"get_offset_stats RPC failed, aggregating in the service: {e}")
+                totals = await self._aggregate_offset_stats(user_id)
             
-            for row in result.data:
-                emission = Emission.model_validate(row)
-                total_emissions += emission.co2_equivalent
-                if emission.is_offset:
-                    total_offset_amount += emission.offset_amount
-                    offset_emissions_count += 1
+            total_emissions = float(totals.get('total_emissions') or 0)
+            total_offset_amount = float(totals.get('total_offset_amount') or 0)
+            offset_emissions_count = int(totals.get('offset_emissions_count') or 0)
             
             net_emissions = total_emissions - total_offset_amount
             offset_percentage = (total_offset_amount / total_emissions * 100) if total_emissions > 0 else 0
@@ -382,39 +458,68 @@ class EmissionService:
             print(f"Error in get_offset_stats: {e}")
             raise
 
-    async def get_emissions_for_offset(self, user_id: UUID) -> List[Emission]:
+    async def _aggregate_offset_stats(self, user_id: UUID) -> dict:
+        """Build the get_offset_stats payload without the RPC (for databases without it)."""
+        result = await execute(self.db.table("emissions").select("co2_equivalent, offset_amount, is_offset")
+            .eq("user_id", str(user_id)))
+        
+        totals = {'total_emissions': 0.0, 'total_offset_amount': 0.0, 'offset_emissions_count': 0}
+        for row in result.data or []:
+            totals['total_emissions'] += row['co2_equivalent']
+            if row.get('is_offset'):
+                totals['total_offset_amount'] += row.get('offset_amount') or 0
+                totals['offset_emissions_count'] += 1
+        return totals
+
+    async def get_emissions_for_offset(self, user_id: UUID, skip: int = 0, limit: Optional[int] = None) -> List[Emission]:
         """Get emissions that are available for offsetting (not fully offset yet)."""
         try:
-            # Get all emissions for the user first, then filter in Python
-            result = self.db.table("emissions").select("*") \
+            query = self.db.table("emissions").select(EMISSION_COLUMNS) \
                 .eq("user_id", str(user_id)) \
-                .order("date", desc=True) \
-                .execute()
-            
-            # Filter to include only emissions that are not fully offset
-            available_emissions = []
-            for row in result.data:
-                emission = Emission.model_validate(row)
-                remaining_amount = emission.co2_equivalent - (emission.offset_amount or 0)
-                if remaining_amount > 0:
-                    available_emissions.append(emission)
-            
-            return available_emissions
+                .gt("remaining_amount", 0) \
+                .order("date", desc=True)
+            if limit is not None:
+                query = query.range(skip, skip + limit - 1)
+            elif skip:
+                query = query.offset(skip)
+            
+            try:
+                result = await execute(query)
+            except APIError as e:
+                # remaining_amount column not migrated yet
+                print(f"Filtering offset-eligible emissions in the service: {e}")
+                return await self._filter_emissions_for_offset(user_id, skip, limit)
+            
+            return decode_rows(Emission, result.data)
             
         except Exception as e:
             print(f"Error in get_emissions_for_offset: {e}")
             raise
 
+    async def _filter_emissions_for_offset(self, user_id: UUID, skip: int, limit: Optional[int]) -> List[Emission]:
+        result = await execute(self.db.table("emissions").select(EMISSION_COLUMNS)
+            .eq("user_id", str(user_id))
+            .order("date", desc=True))
+        
+        # Filter to include only emissions that are not fully offset, on the raw rows
+        # so only the returned page gets decoded
+        available_rows = [
+            row for row in result.data
+            if row["co2_equivalent"] - (row.get("offset_amount") or 0) > 0
+        ]
+        
+        end = skip + limit if limit is not None else None
+        return decode_rows(Emission, available_rows[skip:end])
+
     async def get_offset_history(self, user_id: UUID) -> List[Emission]:
         """Get history of offset emissions."""
         try:
-            result = self.db.table("emissions").select("*") \
-                .eq("user_id", str(user_id)) \
-                .eq("is_offset", True) \
-                .order("offset_date", desc=True) \
-                .execute()
+            result = await execute(self.db.table("emissions").select(EMISSION_COLUMNS)
+                .eq("user_id", str(user_id))
+                .eq("is_offset", True)
+                .order("offset_date", desc=True))
             
-            return [Emission.model_validate(row) for row in result.data]
+            return decode_rows(Emission, result.data)
             
         except Exception as e:
             print(f"Error in get_offset_history: {e}")
@@ -0,0 +1,210 @@
+"""
+Bulk emission ingestion from CSV or NDJSON uploads.
+
+The upload is spooled (to disk past a small in-memory threshold) while the request
+streams in, then processed by a background job: rows are parsed lazily, validated
+in chunks of EMISSION_INGEST_BATCH_SIZE and each chunk is inserted with a single
+statement. A row that fails validation or insertion is reported with its line
+number and the rest of the upload carries on. Clients poll the job for progress.
+
+Jobs outlive the request (and may outlive the caller's token), so they insert
+with the service role; every row is written with the job's user_id.
+"""
+import asyncio
+import contextvars
+import csv
+import io
+import json
+import logging
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.db.database import get_service_role_database
+from app.models.schemas import EmissionCreate, EmissionIngestionJob, IngestionRowError
+from app.services.emission_service import EmissionService
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+INGEST_FORMATS = ("csv", "ndjson")
+
+# In-memory part of the upload spool; larger uploads roll over to a temp file
+SPOOL_MEMORY_BYTES = 1024 * 1024
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+def _iter_csv(text: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    reader = csv.DictReader(text)
+    for record in reader:
+        # Empty cells mean "not provided", so optional fields keep their defaults
+        yield reader.line_num, {key: value for key, value in record.items() if key and value not in ("", None)}
+
+def _iter_ndjson(text: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e.msg}")
+
+def _read_batch(records: Iterator[Tuple[int, Any]], size: int) -> List[Tuple[int, Any]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            break
+    return batch
+
+class EmissionIngestionService:
+    def __init__(self):
+        self._jobs: TTLCache[EmissionIngestionJob] = TTLCache(
+            "emission_ingestion_jobs",
+            max_size=10000,
+            ttl=settings.EMISSION_INGEST_JOB_TTL_SECONDS
+        )
+        self._slots = asyncio.Semaphore(settings.EMISSION_INGEST_MAX_CONCURRENT_JOBS)
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def new_spool() -> tempfile.SpooledTemporaryFile:
+        """Buffer for an upload as it streams in; hand it to start_job once complete"""
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+
+    def start_job(self, user_id: UUID, fmt: str, spool: tempfile.SpooledTemporaryFile) -> EmissionIngestionJob:
+        """Queue a spooled upload for ingestion and return its job; the job owns the spool from here on"""
+        bytes_total = spool.tell()
+        spool.seek(0)
+        job = EmissionIngestionJob(
+            job_id=str(uuid.uuid4()),
+            user_id=user_id,
+            status="queued",
+            format=fmt,
+            bytes_total=bytes_total,
+            created_at=datetime.now(timezone.utc)
+        )
+        self._jobs.set(job.job_id, job)
+
+        # Run outside the request's context so its query stats don't keep counting
+        task = asyncio.create_task(self._run(job, spool), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job.model_copy(deep=True)
+
+    def get_job(self, job_id: str, user_id: UUID) -> Optional[EmissionIngestionJob]:
+        """Get a snapshot of one of the user's jobs"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job.model_copy(deep=True)
+
+    async def _run(self, job: EmissionIngestionJob, spool: tempfile.SpooledTemporaryFile):
+        try:
+            async with self._slots:
+                job.status = "processing"
+                self._touch(job)
+                await self._ingest(job, spool, EmissionService(get_service_role_database()))
+                job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Ingestion was interrupted by a server shutdown"
+            raise
+        except (UnicodeDecodeError, csv.Error) as e:
+            job.status = "failed"
+            job.error = f"Could not parse upload: {e}"
+        except Exception as e:
+            logger.error(f"Emission ingestion job {job.job_id} failed: {e}")
+            job.status = "failed"
+            job.error = "Ingestion failed unexpectedly"
+        finally:
+            job.completed_at = datetime.now(timezone.utc)
+            self._touch(job)
+            spool.close()
+            logger.info(
+                f"Emission ingestion job {job.job_id} {job.status}: "
+                f"{job.rows_inserted} inserted, {job.rows_failed} failed of {job.rows_processed} rows"
+            )
+
+    async def _ingest(self, job: EmissionIngestionJob, spool: tempfile.SpooledTemporaryFile, emission_service: EmissionService):
+        # utf-8-sig drops the BOM spreadsheet exports like to start with
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        records = _iter_csv(text) if job.format == "csv" else _iter_ndjson(text)
+
+        while True:
+            # Parsing may read from the rolled-over temp file, so keep it off the event loop
+            batch = await asyncio.to_thread(_read_batch, records, settings.EMISSION_INGEST_BATCH_SIZE)
+            if not batch:
+                break
+
+            valid: List[Tuple[int, EmissionCreate]] = []
+            for line, record in batch:
+                if isinstance(record, Exception):
+                    self._record_error(job, line, str(record))
+                    continue
+                try:
+                    valid.append((line, EmissionCreate.model_validate(record)))
+                except ValidationError as e:
+                    self._record_error(job, line, _validation_message(e))
+
+            await self._insert(job, valid, emission_service)
+
+            job.rows_processed += len(batch)
+            if job.bytes_total:
+                job.progress = min(99, int(spool.tell() * 100 / job.bytes_total))
+            self._touch(job)
+
+        job.progress = 100
+
+    async def _insert(self, job: EmissionIngestionJob, rows: List[Tuple[int, EmissionCreate]], emission_service: EmissionService):
+        if not rows:
+            return
+        try:
+            job.rows_inserted += await emission_service.create_emissions(job.user_id, [emission for _, emission in rows])
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                self._record_error(job, rows[0][0], f"Insert failed: {e}")
+                return
+
+        # One bad row fails the whole statement; retry row by row to find it
+        for line, emission in rows:
+            try:
+                job.rows_inserted += await emission_service.create_emissions(job.user_id, [emission])
+            except Exception as e:
+                self._record_error(job, line, f"Insert failed: {e}")
+
+    def _record_error(self, job: EmissionIngestionJob, line: int, message: str):
+        job.rows_failed += 1
+        if len(job.errors) < settings.EMISSION_INGEST_MAX_REPORTED_ERRORS:
+            job.errors.append(IngestionRowError(line=line, error=message))
+        else:
+            job.errors_truncated = True
+
+    def _touch(self, job: EmissionIngestionJob):
+        # Re-storing the job restarts its TTL, so running jobs never expire
+        self._jobs.set(job.job_id, job)
+
+    async def shutdown(self):
+        """Cancel running jobs; they are marked failed"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_jobs": len(self._tasks),
+            "tracked_jobs": len(self._jobs)
+        }
+
+# Global ingestion service instance
+emission_ingestion_service = EmissionIngestionService()
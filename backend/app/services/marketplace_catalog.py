@@ -0,0 +1,374 @@
+"""
+Process-wide in-memory snapshot of the marketplace catalog.
+
+Available seller listings (seller_credits joined to carbon_projects) are mapped to
+CarbonCredit once and indexed by project type, vintage, verification standard and
+price, so filtering, sorting and pagination of /marketplace/credits (and the
+credit universe of AI recommendations) are served from memory for every user.
+
+Freshness:
+- Every MARKETPLACE_CATALOG_REFRESH_SECONDS the next read applies the rows whose
+  updated_at moved past the snapshot's watermark.
+- Purchases and listing changes in this process call invalidate(credit_id); the
+  next read refetches those rows before answering.
+- A full reload every MARKETPLACE_CATALOG_FULL_REFRESH_SECONDS picks up deleted
+  rows and project edits, which don't move a listing's updated_at.
+
+Returned CarbonCredit objects are shared between requests and must not be mutated.
+"""
+import bisect
+import heapq
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+import logging
+
+from app.core.config import settings
+from app.db.database import get_service_role_database
+from app.db.executor import execute
+from app.models.schemas import CarbonCredit
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CATALOG_COLUMNS = (
+    "id, status, quantity, sold_quantity, price_per_ton, vintage_year, created_at, updated_at, "
+    "carbon_projects!inner(name, description, project_type, location, country, standard)"
+)
+
+# PostgREST caps rows per response (max-rows, 1000 by default)
+LOAD_PAGE_SIZE = 1000
+
+# Deltas re-read this far behind the watermark, covering writer clock skew and
+# transactions that commit after a later updated_at was already seen
+DELTA_OVERLAP = timedelta(seconds=30)
+
+# Back off this long after a failed refresh before trying again
+REFRESH_RETRY_SECONDS = 5
+
+@dataclass
+class CatalogEntry:
+    credit: CarbonCredit  # available_quantity is what's actually left
+    listing: CarbonCredit  # As the marketplace list shows it (available_quantity = quantity)
+    sort_key: Tuple[datetime, str]  # Newest first, id breaking ties, like the database query
+
+def _later(watermark: Optional[str], updated_at: str) -> str:
+    """The later of two PostgREST timestamps (their text doesn't sort reliably)"""
+    if watermark is None or datetime.fromisoformat(updated_at) > datetime.fromisoformat(watermark):
+        return updated_at
+    return watermark
+
+def _to_entry(row: Dict[str, Any]) -> Optional[CatalogEntry]:
+    """Map a listing row to a catalog entry, or None if it isn't for sale"""
+    project = row.get("carbon_projects")
+    quantity = float(row["quantity"])
+    available_quantity = quantity - float(row.get("sold_quantity") or 0)
+    if not project or row.get("status") != "available" or available_quantity <= 0:
+        return None
+
+    credit = CarbonCredit.model_validate({
+        "id": row["id"],
+        "project_name": project["name"],
+        "description": project["description"],
+        "project_type": project["project_type"],
+        "project_location": f"{project['location']}, {project['country']}",
+        "verification_standard": project["standard"],
+        "vintage_year": row["vintage_year"],
+        "total_quantity": quantity,
+        "available_quantity": available_quantity,
+        "price_per_ton": float(row["price_per_ton"]),
+        "status": "available",
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"]
+    })
+    # The list sends the quantity field as available_quantity (user's request)
+    listing = credit.model_copy(update={"available_quantity": quantity})
+    return CatalogEntry(credit=credit, listing=listing, sort_key=(credit.created_at, str(credit.id)))
+
+class MarketplaceCatalog:
+    def __init__(self, refresh_interval: float = 5, full_refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._by_project_type: Dict[str, Set[str]] = {}
+        self._by_vintage: Dict[int, Set[str]] = {}
+        self._by_standard: Dict[str, Set[str]] = {}
+        # Rebuilt lazily after changes: (price, id) ascending, and ids newest first
+        self._by_price: List[Tuple[float, str]] = []
+        self._ordered: List[str] = []
+        self._rank: Dict[str, int] = {}  # Position in _ordered, for cheap sorting
+        self._sorted_indexes_stale = False
+
+        self._loaded = False
+        self._watermark: Optional[str] = None  # Highest updated_at applied
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._retry_at = 0.0
+        self._dirty: Set[str] = set()
+
+        self._flight = SingleFlight("marketplace_catalog")
+        self.full_loads = 0
+        self.delta_refreshes = 0
+        self.refresh_failures = 0
+        self.last_error: Optional[str] = None
+
+    # Freshness
+
+    def invalidate(self, credit_id: UUID):
+        """A listing changed (purchase, edit); refetch it before the next read"""
+        self._dirty.add(str(credit_id))
+
+    async def ensure_fresh(self):
+        """Bring the snapshot up to date if it's due; raises if there is no snapshot at all"""
+        now = time.monotonic()
+        if self._loaded:
+            due = (
+                self._dirty
+                or now - self._refreshed_at >= self.refresh_interval
+                or now - self._loaded_at >= self.full_refresh_interval
+            )
+            if not due or now < self._retry_at:
+                return
+
+        try:
+            await self._flight.do("refresh", self._refresh)
+        except Exception as e:
+            self.refresh_failures += 1
+            self.last_error = str(e)
+            self._retry_at = time.monotonic() + REFRESH_RETRY_SECONDS
+            if not self._loaded:
+                raise
+            logger.warning(f"Marketplace catalog refresh failed, serving the previous snapshot: {e}")
+
+    async def _refresh(self):
+        if not self._loaded or time.monotonic() - self._loaded_at >= self.full_refresh_interval:
+            await self._load_all()
+        else:
+            await self._load_changes()
+
+    async def load_credits(self) -> List[CarbonCredit]:
+        """Every listing for sale, read straight from the database; for when there's no snapshot"""
+        rows = await self._load_available(get_service_role_database())
+        return [entry.credit for entry in map(_to_entry, rows) if entry is not None]
+
+    async def _load_available(self, client) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = (await execute(
+                client.table("seller_credits").select(CATALOG_COLUMNS)
+                .eq("status", "available")
+                .order("id")
+                .range(offset, offset + LOAD_PAGE_SIZE - 1)
+            )).data or []
+            rows.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                return rows
+            offset += LOAD_PAGE_SIZE
+
+    async def _load_all(self):
+        client = get_service_role_database()
+        started = time.monotonic()
+        dirty_before = set(self._dirty)
+        rows = await self._load_available(client)
+
+        entries = {}
+        for row in rows:
+            entry = _to_entry(row)
+            if entry is not None:
+                entries[str(entry.credit.id)] = entry
+
+        # Swap in the new snapshot without yielding, so readers never see a half-built one
+        self._entries = {}
+        self._by_project_type, self._by_vintage, self._by_standard = {}, {}, {}
+        for entry in entries.values():
+            self._add(entry)
+        self._sorted_indexes_stale = True
+        for row in rows:
+            self._watermark = _later(self._watermark, row["updated_at"])
+        # Invalidations that arrived during the load may not be reflected in it
+        self._dirty -= dirty_before
+        self._loaded = True
+        self._loaded_at = self._refreshed_at = started
+        self.full_loads += 1
+        logger.info(f"Loaded marketplace catalog: {len(entries)} listings")
+
+    async def _load_changes(self):
+        client = get_service_role_database()
+        started = time.monotonic()
+        dirty = set(self._dirty)
+        self._dirty -= dirty
+
+        try:
+            rows = []
+            if self._watermark:
+                # Re-applying a row is idempotent, so overlapping the last refresh is safe
+                since = datetime.fromisoformat(self._watermark) - DELTA_OVERLAP
+                rows.extend(await self._load_updated_since(client, since.isoformat()))
+            if dirty:
+                rows.extend((await execute(
+                    client.table("seller_credits").select(CATALOG_COLUMNS)
+                    .in_("id", sorted(dirty))
+                )).data or [])
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+        seen = set()
+        for row in rows:
+            credit_id = str(row["id"])
+            seen.add(credit_id)
+            self._remove(credit_id)
+            entry = _to_entry(row)
+            if entry is not None:
+                self._add(entry)
+            self._watermark = _later(self._watermark, row["updated_at"])
+        # Invalidated ids that no longer come back were deleted (or lost their project)
+        for credit_id in dirty - seen:
+            self._remove(credit_id)
+
+        if rows or dirty:
+            self._sorted_indexes_stale = True
+        self._refreshed_at = started
+        self.delta_refreshes += 1
+
+    async def _load_updated_since(self, client, since: str) -> List[Dict[str, Any]]:
+        """
+        Every row updated at or after `since`. Paged by (updated_at, id) from the last
+        row seen, so the watermark never moves past rows a capped response left out.
+        """
+        rows: List[Dict[str, Any]] = []
+        after: Optional[Tuple[str, str]] = None
+        while True:
+            query = client.table("seller_credits").select(CATALOG_COLUMNS).gte("updated_at", since)
+            if after is not None:
+                updated_at, credit_id = after
+                query = query.or_(f'updated_at.gt."{updated_at}",and(updated_at.eq."{updated_at}",id.gt.{credit_id})')
+            page = (await execute(
+                query.order("updated_at").order("id").limit(LOAD_PAGE_SIZE)
+            )).data or []
+            rows.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                return rows
+            after = (page[-1]["updated_at"], page[-1]["id"])
+
+    # Index maintenance
+
+    def _add(self, entry: CatalogEntry):
+        credit_id = str(entry.credit.id)
+        credit = entry.credit
+        self._entries[credit_id] = entry
+        self._by_project_type.setdefault(credit.project_type.value, set()).add(credit_id)
+        self._by_vintage.setdefault(credit.vintage_year, set()).add(credit_id)
+        self._by_standard.setdefault(credit.verification_standard, set()).add(credit_id)
+
+    def _remove(self, credit_id: str):
+        entry = self._entries.pop(credit_id, None)
+        if entry is None:
+            return
+        credit = entry.credit
+        for index, key in (
+            (self._by_project_type, credit.project_type.value),
+            (self._by_vintage, credit.vintage_year),
+            (self._by_standard, credit.verification_standard)
+        ):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(credit_id)
+                if not ids:
+                    del index[key]
+
+    def _rebuild_sorted_indexes(self):
+        self._by_price = sorted((entry.credit.price_per_ton, credit_id) for credit_id, entry in self._entries.items())
+        self._ordered = [
+            credit_id for credit_id, _ in
+            sorted(self._entries.items(), key=lambda item: item[1].sort_key, reverse=True)
+        ]
+        self._rank = {credit_id: position for position, credit_id in enumerate(self._ordered)}
+        self._sorted_indexes_stale = False
+
+    # Reads
+
+    def query(
+        self,
+        skip: int = 0,
+        limit: int = 20,
+        project_type: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        vintage_year: Optional[int] = None,
+        verification_standard: Optional[str] = None,
+        as_listing: bool = True
+    ) -> List[CarbonCredit]:
+        """One page of available credits matching the filters, newest first"""
+        if self._sorted_indexes_stale:
+            self._rebuild_sorted_indexes()
+
+        index_sets: List[Set[str]] = []
+        if project_type is not None:
+            index_sets.append(self._by_project_type.get(project_type, set()))
+        if vintage_year is not None:
+            index_sets.append(self._by_vintage.get(vintage_year, set()))
+        if verification_standard is not None:
+            index_sets.append(self._by_standard.get(verification_standard, set()))
+        price_filtered = min_price is not None or max_price is not None
+
+        if not index_sets and not price_filtered:
+            page_ids: Iterable[str] = self._ordered[skip:skip + limit]
+        else:
+            if price_filtered:
+                lo = bisect.bisect_left(self._by_price, (min_price,)) if min_price is not None else 0
+                hi = bisect.bisect_right(self._by_price, (max_price, "\uffff")) if max_price is not None else len(self._by_price)
+
+            if index_sets:
+                # Intersect starting from the most selective index
+                index_sets.sort(key=len)
+                candidates: Iterable[str] = index_sets[0].intersection(*index_sets[1:])
+                if price_filtered:
+                    if hi - lo < len(candidates):
+                        candidates = [credit_id for _, credit_id in self._by_price[lo:hi] if credit_id in candidates]
+                    else:
+                        candidates = [
+                            credit_id for credit_id in candidates
+                            if (min_price is None or self._entries[credit_id].credit.price_per_ton >= min_price)
+                            and (max_price is None or self._entries[credit_id].credit.price_per_ton <= max_price)
+                        ]
+            else:
+                candidates = [credit_id for _, credit_id in self._by_price[lo:hi]]
+
+            page_ids = heapq.nsmallest(skip + limit, candidates, key=self._rank.__getitem__)[skip:]
+
+        return [
+            self._entries[credit_id].listing if as_listing else self._entries[credit_id].credit
+            for credit_id in page_ids
+        ]
+
+    def all_credits(self) -> List[CarbonCredit]:
+        """Every available credit with its real remaining quantity"""
+        return [entry.credit for entry in self._entries.values()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "loaded": self._loaded,
+            "listings": len(self._entries),
+            "project_types": len(self._by_project_type),
+            "pending_invalidations": len(self._dirty),
+            "watermark": self._watermark,
+            "seconds_since_full_load": round(now - self._loaded_at, 1) if self._loaded else None,
+            "seconds_since_refresh": round(now - self._refreshed_at, 1) if self._loaded else None,
+            "full_loads": self.full_loads,
+            "delta_refreshes": self.delta_refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_error": self.last_error,
+            "coalescing": self._flight.get_stats()
+        }
+
+# Global marketplace catalog instance
+marketplace_catalog = MarketplaceCatalog(
+    refresh_interval=settings.MARKETPLACE_CATALOG_REFRESH_SECONDS,
+    full_refresh_interval=settings.MARKETPLACE_CATALOG_FULL_REFRESH_SECONDS
+)
@@ -5,12 +5,24 @@ from typing import List, Optional
 from uuid import UUID
 from supabase import Client
 from fastapi import HTTPException, status
+from postgrest.exceptions import APIError
 import logging
 
 from ..models.schemas import CarbonCredit, CarbonCreditPurchase, CarbonCreditPurchaseCreate, MarketplaceStats, RetireCreditsRequest, PurchaseStatus
+from ..db.database import get_service_role_database
+from ..db.executor import execute
+from ..core.config import settings
+from .marketplace_catalog import marketplace_catalog
+from .settlement_service import purchase_settlement_service
 
 logger = logging.getLogger(__name__)
 
+# Listing and project columns the marketplace list shows
+LISTING_COLUMNS = (
+    "id, quantity, sold_quantity, price_per_ton, vintage_year, created_at, updated_at, "
+    "carbon_projects!inner(name, description, project_type, location, country, standard)"
+)
+
 class MarketplaceService:
     def __init__(self, db: Client):
         self.db = db
@@ -21,35 +33,35 @@ class MarketplaceService:
         limit: int = 20,
         project_type: Optional[str] = None,
         min_price: Optional[float] = None,
-        max_price: Optional[float] = None
+        max_price: Optional[float] = None,
+        vintage_year: Optional[int] = None,
+        verification_standard: Optional[str] = None
     ) -> List[CarbonCredit]:
         """Get available carbon credits from seller listings."""
+        filters = (project_type, min_price, max_price, vintage_year, verification_standard)
+        
+        # Served from the shared in-memory catalog when it's available
+        if settings.MARKETPLACE_CATALOG_ENABLED:
+            try:
+                await marketplace_catalog.ensure_fresh()
+                return marketplace_catalog.query(skip, limit, *filters)
+            except Exception as e:
+                logger.warning(f"Marketplace catalog unavailable, querying listings: {str(e)}")
+        
         try:
-            # Query seller_credits with project information
-            query = self.db.table("seller_credits").select(
-                "*, carbon_projects(*)"
-            ).eq("status", "available")
-            
-            # Filter by project type if specified
-            if project_type:
-                query = query.eq("carbon_projects.project_type", project_type)
-            
-            # Apply price filters
-            if min_price is not None:
-                query = query.gte("price_per_ton", min_price)
-            if max_price is not None:
-                query = query.lte("price_per_ton", max_price)
-            
-            response = query.order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+            try:
+                rows = await self._query_listings(skip, limit, *filters, filter_available=True)
+            except APIError as e:
+                # available_quantity not migrated yet: sold-out listings are dropped after paging
+                logger.warning(f"Filtering sold-out listings in the service: {str(e)}")
+                rows = await self._query_listings(skip, limit, *filters, filter_available=False)
             
             credits = []
-            for seller_credit in response.data:
-                project = seller_credit.get('carbon_projects')
-                if not project:
-                    continue
+            for seller_credit in rows:
+                project = seller_credit['carbon_projects']
                 
                 # Calculate available quantity (quantity - sold_quantity)
-                available_quantity = float(seller_credit['quantity']) - float(seller_credit.get('sold_quantity', 0))
+                available_quantity = float(seller_credit['quantity']) - float(seller_credit.get('sold_quantity') or 0)
                 
                 # Skip if no quantity available
                 if available_quantity <= 0:
@@ -81,12 +93,51 @@ class MarketplaceService:
             logger.error(f"Error getting available credits: {str(e)}")
             return []
 
+    async def _query_listings(
+        self,
+        skip: int,
+        limit: int,
+        project_type: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        vintage_year: Optional[int],
+        verification_standard: Optional[str],
+        filter_available: bool
+    ) -> List[dict]:
+        """One page of available listings with their projects, all filters applied in the database."""
+        # !inner makes the project filter drop listings instead of just nulling their project
+        query = self.db.table("seller_credits").select(
+            LISTING_COLUMNS
+        ).eq("status", "available")
+        
+        if filter_available:
+            query = query.gt("available_quantity", 0)
+        
+        # Filter by project type if specified
+        if project_type:
+            query = query.eq("carbon_projects.project_type", project_type)
+        
+        # Apply price filters
+        if min_price is not None:
+            query = query.gte("price_per_ton", min_price)
+        if max_price is not None:
+            query = query.lte("price_per_ton", max_price)
+        if vintage_year is not None:
+            query = query.eq("vintage_year", vintage_year)
+        if verification_standard:
+            query = query.eq("carbon_projects.standard", verification_standard)
+        
+        # id breaks created_at ties so pages don't overlap or skip rows
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        response = await execute(query.range(skip, skip + limit - 1))
+        return response.data
+
     async def get_credit_by_id(self, credit_id: UUID) -> Optional[CarbonCredit]:
         """Get a specific seller credit by ID (displayed as credit in marketplace)."""
         try:
-            response = self.db.table("seller_credits").select(
+            response = await execute(self.db.table("seller_credits").select(
                 "*, carbon_projects(*)"
-            ).eq("id", str(credit_id)).single().execute()
+            ).eq("id", str(credit_id)).single())
             
             if response.data:
                 seller_credit = response.data
@@ -122,139 +173,12 @@ class MarketplaceService:
             return None
 
     async def purchase_credits(self, user_id: UUID, purchase_data: CarbonCreditPurchaseCreate) -> CarbonCreditPurchase:
-        """Purchase carbon credits from seller listings using database operations."""
+        """Purchase carbon credits from a seller listing; the credits are minted by background settlement."""
         try:
-            # Get seller credit details (purchase_data.credit_id refers to seller_credit.id)
-            seller_credit_response = self.db.table("seller_credits").select(
-                "*, carbon_projects(*)"
-            ).eq("id", str(purchase_data.credit_id)).single().execute()
-            
-            if not seller_credit_response.data:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Seller credit not found")
-            
-            seller_credit = seller_credit_response.data
-            project = seller_credit.get('carbon_projects')
-            
-            if not project:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Associated project not found")
-            
-            # Check if seller credit is available
-            if seller_credit['status'] != 'available':
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Credit listing is not available")
-            
-            # Calculate actual available quantity
-            available_quantity = float(seller_credit['quantity']) - float(seller_credit.get('sold_quantity', 0))
-            
-            # Check if sufficient quantity is available
-            if available_quantity < purchase_data.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, 
-                    detail=f"Insufficient quantity available. Available: {available_quantity}, Requested: {purchase_data.quantity}"
-                )
-            
-            # Calculate costs
-            price_per_ton = float(seller_credit['price_per_ton'])
-            total_cost = price_per_ton * purchase_data.quantity
-            
-            # First, attempt blockchain transaction before creating database records
-            blockchain_success = False
-            blockchain_tx_hash = None
-            
-            try:
-                from .blockchain_service import BlockchainService
-                blockchain_service = BlockchainService()
-                
-                if not blockchain_service.is_connected():
-                    raise HTTPException(
-                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                        detail="Blockchain service is not available. Please try again later."
-                    )
-                
-                # For marketplace purchases, mint credits to user's address if available
-                # TODO: Get user's wallet address from user profile when wallet integration is complete
-                # For now, mint to admin address and track ownership in database
-                user_address = blockchain_service.admin_account.address  # Temporary fallback
-                
-                blockchain_tx_hash = blockchain_service.mint_carbon_credits(
-                    to_address=user_address,
-                    amount=purchase_data.quantity,
-                    project_id=str(project['id']),
-                    vintage=str(seller_credit['vintage_year']),
-                    standard=project.get('standard', 'VCS'),
-                    price=price_per_ton
-                )
-                
-                if not blockchain_tx_hash:
-                    raise HTTPException(
-                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                        detail="Blockchain transaction failed. Please try again later."
-                    )
-                
-                blockchain_success = True
-                    
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.error(f"Blockchain transaction failed: {str(e)}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=f"Blockchain transaction failed: {str(e)}"
-                )
-            
-            # Only create database records after successful blockchain transaction
-            purchase_data_dict = {
-                "user_id": str(user_id),
-                "credit_id": str(purchase_data.credit_id),  # This is seller_credit.id
-                "quantity": purchase_data.quantity,
-                "price_per_ton": price_per_ton,
-                "total_cost": total_cost,
-                "status": "completed",
-                "retired_quantity": 0.0,
-                "blockchain_tx_hash": blockchain_tx_hash
-            }
-            
-            # Verify the seller credit exists before attempting purchase
-            verify_response = self.db.table("seller_credits").select("id").eq("id", str(purchase_data.credit_id)).execute()
-            if not verify_response.data:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Seller credit {purchase_data.credit_id} not found in seller_credits table")
-            
-            purchase_response = self.db.table("carbon_credit_purchases").insert(purchase_data_dict).execute()
-            
-            if not purchase_response.data:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create purchase record")
-            
-            purchase_id = purchase_response.data[0]['id']
-            
-            # Create sale transaction for the seller (still references seller_credit)
-            sale_data = {
-                "seller_credit_id": str(purchase_data.credit_id),  # Original seller_credit.id
-                "buyer_id": str(user_id),
-                "quantity": purchase_data.quantity,
-                "price_per_ton": price_per_ton,
-                "total_amount": total_cost,
-                "status": "completed"
-            }
-            
-            sale_response = self.db.table("sale_transactions").insert(sale_data).execute()
-            
-            if not sale_response.data:
-                # Rollback purchase if sale creation fails
-                self.db.table("carbon_credit_purchases").delete().eq("id", purchase_id).execute()
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create sale transaction")
-            
-            # Update seller_credits sold_quantity
-            new_sold_quantity = float(seller_credit.get('sold_quantity', 0)) + purchase_data.quantity
-            update_response = self.db.table("seller_credits").update({
-                "sold_quantity": new_sold_quantity
-            }).eq("id", str(purchase_data.credit_id)).execute()
-            
-            if not update_response.data:
-                # Rollback both purchase and sale if update fails
-                self.db.table("carbon_credit_purchases").delete().eq("id", purchase_id).execute()
-                self.db.table("sale_transactions").delete().eq("id", sale_response.data[0]['id']).execute()
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update seller credit inventory")
-            
-            return CarbonCreditPurchase.model_validate(purchase_response.data[0])
+            # purchase_data.credit_id refers to seller_credit.id. The purchase is returned as
+            # pending_settlement; poll it for the mint's outcome.
+            result = await self.record_purchase(purchase_data.credit_id, purchase_data.quantity)
+            return CarbonCreditPurchase.model_validate(result["purchase"])
             
         except HTTPException:
             raise
@@ -262,11 +186,72 @@ class MarketplaceService:
             logger.error(f"Purchase failed: {str(e)}")
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Purchase failed: {str(e)}")
 
+    async def record_purchase(self, credit_id: UUID, quantity: float, settlement_address: Optional[str] = None) -> dict:
+        """
+        Record a purchase by the current user atomically (purchase_seller_credits RPC).
+        
+        Locks the listing, re-checks availability, inserts the purchase and the sale and
+        increments sold_quantity in one transaction. Returns the purchase and sale rows,
+        the seller_id and the quantity left.
+        
+        The purchase is pending_settlement and is handed to the settlement worker, which
+        mints to settlement_address (default: the platform account).
+        """
+        result = await self._purchase_rpc(self.db, 'purchase_seller_credits', credit_id, {
+            'p_credit_id': str(credit_id),
+            'p_quantity': quantity,
+            'p_settlement_address': settlement_address
+        })
+        
+        purchase_settlement_service.submit(result['purchase']['id'])
+        return result
+
+    async def record_settled_purchase(
+        self,
+        user_id: UUID,
+        credit_id: UUID,
+        quantity: float,
+        blockchain_tx_hash: str,
+        price_per_ton: float,
+        settlement_address: Optional[str] = None
+    ) -> dict:
+        """
+        Record a purchase the user already paid for on chain, as completed (record_settled_purchase RPC).
+        
+        Runs with the service role, so only call it after validating blockchain_tx_hash
+        as a payment at price_per_ton; the purchase is refused if the listing's price
+        has changed since. Same transaction and result as record_purchase.
+        """
+        return await self._purchase_rpc(get_service_role_database(), 'record_settled_purchase', credit_id, {
+            'p_buyer_id': str(user_id),
+            'p_credit_id': str(credit_id),
+            'p_quantity': quantity,
+            'p_blockchain_tx_hash': blockchain_tx_hash,
+            'p_price_per_ton': price_per_ton,
+            'p_settlement_address': settlement_address
+        })
+
+    async def _purchase_rpc(self, db: Client, fn: str, credit_id: UUID, params: dict) -> dict:
+        try:
+            result = await execute(db.rpc(fn, params))
+        except APIError as e:
+            if e.code == 'P0002':
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=e.message)
+            if e.code == 'P0001':
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+            if e.code == '23505':
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Transaction was already used for another purchase")
+            raise
+        finally:
+            marketplace_catalog.invalidate(credit_id)
+        
+        return result.data
+
     async def get_user_purchases(self, user_id: UUID, skip: int = 0, limit: int = 100) -> List[CarbonCreditPurchase]:
         """Get all purchases for a user with pagination."""
-        response = self.db.table("carbon_credit_purchases").select(
+        response = await execute(self.db.table("carbon_credit_purchases").select(
             "*, credit:seller_credits(*, carbon_projects(*))"
-        ).eq("user_id", str(user_id)).order("purchase_date", desc=True).range(skip, skip + limit - 1).execute()
+        ).eq("user_id", str(user_id)).order("purchase_date", desc=True).range(skip, skip + limit - 1))
         
         return [CarbonCreditPurchase.model_validate(purchase) for purchase in response.data]
 
@@ -274,12 +259,15 @@ class MarketplaceService:
         """Retire carbon credits using direct table operations."""
         try:
             # Get purchase details
-            purchase_response = self.db.table("carbon_credit_purchases").select("*").eq("id", str(retire_data.purchase_id)).eq("user_id", str(user_id)).single().execute()
+            purchase_response = await execute(self.db.table("carbon_credit_purchases").select("*").eq("id", str(retire_data.purchase_id)).eq("user_id", str(user_id)).single())
             
             if not purchase_response.data:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Purchase not found or does not belong to user")
             
             purchase = purchase_response.data
+            if purchase['status'] != PurchaseStatus.COMPLETED:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Purchase is {purchase['status']} and can't be retired yet")
+            
             current_retired = float(purchase['retired_quantity'])
             total_quantity = float(purchase['quantity'])
             
@@ -296,9 +284,9 @@ class MarketplaceService:
             # Update retired quantity (status remains 'completed')
             new_retired_quantity = current_retired + retire_data.quantity
             
-            update_response = self.db.table("carbon_credit_purchases").update({
+            update_response = await execute(self.db.table("carbon_credit_purchases").update({
                 "retired_quantity": new_retired_quantity
-            }).eq("id", str(retire_data.purchase_id)).execute()
+            }).eq("id", str(retire_data.purchase_id)))
             
             if not update_response.data:
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update retirement record")
@@ -332,9 +320,9 @@ class MarketplaceService:
     async def get_purchase_by_id(self, purchase_id: UUID, user_id: UUID) -> Optional[CarbonCreditPurchase]:
         """Get a specific purchase by ID for a user."""
         try:
-            response = self.db.table("carbon_credit_purchases").select(
+            response = await execute(self.db.table("carbon_credit_purchases").select(
                 "*, credit:seller_credits(*, carbon_projects(*))"
-            ).eq("id", str(purchase_id)).eq("user_id", str(user_id)).execute()
+            ).eq("id", str(purchase_id)).eq("user_id", str(user_id)))
             
             if not response.data:
                 return None
@@ -349,8 +337,8 @@ class MarketplaceService:
         """Update the retired quantity for a carbon credit purchase."""
         try:
             # First, get the current purchase to calculate new retired quantity
-            response = self.db.table("carbon_credit_purchases").select("*") \
-                .eq("id", str(purchase_id)).execute()
+            response = await execute(self.db.table("carbon_credit_purchases").select("*")
+                .eq("id", str(purchase_id)))
             
             if not response.data:
                 raise ValueError(f"Purchase {purchase_id} not found")
@@ -365,9 +353,9 @@ class MarketplaceService:
                 raise ValueError(f"Cannot retire {additional_retired} credits. Only {total_quantity - current_retired} credits available for retirement")
             
             # Update the purchase with new retired quantity
-            update_result = self.db.table("carbon_credit_purchases").update({
+            update_result = await execute(self.db.table("carbon_credit_purchases").update({
                 "retired_quantity": new_retired_quantity
-            }).eq("id", str(purchase_id)).execute()
+            }).eq("id", str(purchase_id)))
             
             return bool(update_result.data)
             
@@ -5,94 +5,143 @@ from typing import List, Dict, Any, Optional
 from uuid import UUID, uuid4
 from datetime import datetime, timedelta, timezone
 import json
+from dataclasses import dataclass
 from supabase import Client
+from postgrest.exceptions import APIError
 
-from ..models.schemas import Report, Emission, CarbonCreditPurchase
+from ..models.schemas import Report, CarbonCreditPurchase
+from ..db.executor import execute
+from ..db.analytics import AnalyticsSession
+from ..db.rows import decode_rows
+
+
+@dataclass
+class EmissionTotal:
+    """Emissions of one category at one date - a monthly rollup row or a single emission."""
+    category: str
+    date: datetime
+    co2_equivalent: float
+
+def _covers_whole_months(start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """Whether the period starts on a month boundary and ends on a month's last day."""
+    starts_on_month = start_date is None or (start_date.day == 1 and start_date.time() == datetime.min.time())
+    ends_on_month = end_date is None or (end_date + timedelta(days=1)).day == 1
+    return starts_on_month and ends_on_month
 
 
 class ReportService:
-    def __init__(self, db: Client):
+    def __init__(self, db: Client, analytics: Optional[AnalyticsSession] = None):
         self.supabase = db
+        self.analytics = analytics
 
-    def _parse_emission_data(self, emission_data: Dict[str, Any]) -> Emission:
-        """Parse emission data from database with proper type conversion."""
-        # Parse datetime fields
-        emission_data["date"] = datetime.fromisoformat(emission_data["date"].replace("Z", "+00:00"))
-        if emission_data.get("offset_date"):
-            emission_data["offset_date"] = datetime.fromisoformat(emission_data["offset_date"].replace("Z", "+00:00"))
-        emission_data["created_at"] = datetime.fromisoformat(emission_data["created_at"].replace("Z", "+00:00"))
-        emission_data["updated_at"] = datetime.fromisoformat(emission_data["updated_at"].replace("Z", "+00:00"))
-        
-        # Convert UUIDs
-        emission_data["id"] = UUID(emission_data["id"])
-        emission_data["user_id"] = UUID(emission_data["user_id"])
-        if emission_data.get("offset_purchase_id"):
-            emission_data["offset_purchase_id"] = UUID(emission_data["offset_purchase_id"])
-        
-        return Emission(**emission_data)
+    async def _fetch_rows_sql(
+        self,
+        query: str,
+        user_id: UUID,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Fetch rows as PostgREST-shaped dicts via direct SQL, or None to use PostgREST."""
+        if not self.analytics:
+            return None
+        try:
+            records = await self.analytics.fetch(
+                query,
+                user_id,
+                start_date.isoformat() if start_date else None,
+                end_date.isoformat() if end_date else None
+            )
+        except Exception as e:
+            print(f"Analytics query failed for report data, using PostgREST: {str(e)}")
+            return None
+        return [json.loads(record[0]) for record in records]
 
-    def _parse_purchase_data(self, purchase_data: Dict[str, Any]) -> CarbonCreditPurchase:
-        """Parse purchase data from database with proper type conversion."""
-        # Handle the nested seller_credits relationship (not carbon_credits)
-        credit_data = purchase_data.pop("credit", None)
-        if credit_data:
-            purchase_data["credit"] = credit_data
-        
-        # Parse datetime fields
-        purchase_data["purchase_date"] = datetime.fromisoformat(purchase_data["purchase_date"].replace("Z", "+00:00"))
-        if purchase_data.get("last_retirement_date"):
-            purchase_data["last_retirement_date"] = datetime.fromisoformat(purchase_data["last_retirement_date"].replace("Z", "+00:00"))
-        
-        # Convert UUIDs
-        purchase_data["id"] = UUID(purchase_data["id"])
-        purchase_data["user_id"] = UUID(purchase_data["user_id"])
-        purchase_data["credit_id"] = UUID(purchase_data["credit_id"])
-        
-        return CarbonCreditPurchase(**purchase_data)
+    async def _fetch_emission_rows(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Fetch the category, date and CO2e of a user's emissions within a date range."""
+        rows = await self._fetch_rows_sql(
+            """
+            select jsonb_build_object('category', e.category, 'date', e.date, 'co2_equivalent', e.co2_equivalent)::text
+            from emissions e
+            where e.user_id = $1
+              and ($2::text is null or e.date >= $2::text::timestamptz)
+              and ($3::text is null or e.date <= $3::text::timestamptz)
+            """,
+            user_id, start_date, end_date
+        )
+        if rows is None:
+            query = self.supabase.table("emissions").select("category, date, co2_equivalent").eq("user_id", str(user_id))
+            
+            if start_date:
+                query = query.gte("date", start_date.isoformat())
+            if end_date:
+                query = query.lte("date", end_date.isoformat())
+            
+            rows = (await execute(query)).data
+        
+        return rows
 
-    def _fetch_emissions(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Emission]:
-        """Fetch and parse emissions data for a user within a date range."""
-        query = self.supabase.table("emissions").select("*").eq("user_id", str(user_id))
-        
-        if start_date:
-            query = query.gte("date", start_date.isoformat())
-        if end_date:
-            query = query.lte("date", end_date.isoformat())
-        
-        response = query.execute()
-        
-        emissions = []
-        for e in response.data:
+    async def _fetch_emission_totals(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[EmissionTotal]:
+        """Emissions by category and month for the period, from the rollups when it covers whole months."""
+        if _covers_whole_months(start_date, end_date):
+            query = self.supabase.table("emission_rollups").select("month, category, co2_equivalent").eq("user_id", str(user_id))
+            
+            if start_date:
+                query = query.gte("month", start_date.date().isoformat())
+            if end_date:
+                query = query.lte("month", end_date.date().replace(day=1).isoformat())
+            
             try:
-                emission = self._parse_emission_data(e)
-                emissions.append(emission)
-            except Exception as ex:
-                # Skip invalid emission records
-                continue
-        
-        return emissions
+                response = await execute(query)
+                return [
+                    EmissionTotal(
+                        category=row["category"],
+                        date=datetime.fromisoformat(row["month"]),
+                        co2_equivalent=float(row["co2_equivalent"])
+                    )
+                    for row in response.data
+                ]
+            except APIError as e:
+                print(f"Emission rollups unavailable, reading raw emissions: {str(e)}")
+        
+        # Totals only need three columns, so skip building Emission models
+        rows = await self._fetch_emission_rows(user_id, start_date, end_date)
+        return [
+            EmissionTotal(
+                category=row["category"],
+                date=datetime.fromisoformat(row["date"]),
+                co2_equivalent=float(row["co2_equivalent"])
+            )
+            for row in rows
+        ]
 
-    def _fetch_purchases(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[CarbonCreditPurchase]:
+    async def _fetch_purchases(self, user_id: UUID, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[CarbonCreditPurchase]:
         """Fetch and parse purchase data for a user within a date range."""
-        query = self.supabase.table("carbon_credit_purchases").select("*, credit:seller_credits(*, carbon_projects(*))").eq("user_id", str(user_id))
-        
-        if start_date:
-            query = query.gte("purchase_date", start_date.isoformat())
-        if end_date:
-            query = query.lte("purchase_date", end_date.isoformat())
-        
-        response = query.execute()
-        
-        purchases = []
-        for p in response.data:
-            try:
-                purchase = self._parse_purchase_data(p)
-                purchases.append(purchase)
-            except Exception as e:
-                # Skip invalid purchase records
-                continue
-        
-        return purchases
+        rows = await self._fetch_rows_sql(
+            """
+            select (to_jsonb(p) || jsonb_build_object(
+                       'credit', to_jsonb(c) || jsonb_build_object('carbon_projects', to_jsonb(cp))
+                   ))::text
+            from carbon_credit_purchases p
+            left join seller_credits c on c.id = p.credit_id
+            left join carbon_projects cp on cp.id = c.project_id
+            where p.user_id = $1
+              and ($2::text is null or p.purchase_date >= $2::text::timestamptz)
+              and ($3::text is null or p.purchase_date <= $3::text::timestamptz)
+            """,
+            user_id, start_date, end_date
+        )
+        if rows is None:
+            query = self.supabase.table("carbon_credit_purchases").select("*, credit:seller_credits(*, carbon_projects(*))").eq("user_id", str(user_id))
+            
+            if start_date:
+                query = query.gte("purchase_date", start_date.isoformat())
+            if end_date:
+                query = query.lte("purchase_date", end_date.isoformat())
+            
+            rows = (await execute(query)).data
+        
+        # Skip invalid purchase records
+        return decode_rows(CarbonCreditPurchase, rows, skip_invalid=True)
 
     async def generate_emissions_report(
         self,
@@ -104,10 +153,10 @@ class ReportService:
         """Generate comprehensive emissions report."""
         try:
             # Fetch emissions data for the period
-            emissions = self._fetch_emissions(user_id, start_date, end_date)
+            emissions = await self._fetch_emission_totals(user_id, start_date, end_date)
             
             # Fetch credit purchases for the period
-            purchases = self._fetch_purchases(user_id, start_date, end_date)
+            purchases = await self._fetch_purchases(user_id, start_date, end_date)
             
             # Generate report data
             report_data = self._generate_emissions_report_data(emissions, purchases, start_date, end_date)
@@ -125,7 +174,7 @@ class ReportService:
                 "period_end": end_date.isoformat()
             }
             
-            self.supabase.table("reports").insert(report_record).execute()
+            await execute(self.supabase.table("reports").insert(report_record))
             
             # Create Report object with proper types
             return Report(
@@ -157,9 +206,9 @@ class ReportService:
             end_date = datetime(year, 12, 31)
             
             # Fetch all data for the year
-            emissions = self._fetch_emissions(user_id, start_date, end_date)
+            emissions = await self._fetch_emission_totals(user_id, start_date, end_date)
             
-            purchases = self._fetch_purchases(user_id, start_date, end_date)
+            purchases = await self._fetch_purchases(user_id, start_date, end_date)
             
             # Generate compliance-specific report
             report_data = self._generate_compliance_report_data(
@@ -179,7 +228,7 @@ class ReportService:
                 "period_end": end_date.isoformat()
             }
             
-            self.supabase.table("reports").insert(report_record).execute()
+            await execute(self.supabase.table("reports").insert(report_record))
             
             # Create Report object with proper types
             return Report(
@@ -200,9 +249,9 @@ class ReportService:
         """Generate net-zero progress tracking report."""
         try:
             # Get all user data
-            emissions = self._fetch_emissions(user_id)
+            emissions = await self._fetch_emission_totals(user_id)
             
-            purchases = self._fetch_purchases(user_id)
+            purchases = await self._fetch_purchases(user_id)
             
             # Generate net-zero analysis
             report_data = self._generate_net_zero_report_data(emissions, purchases)
@@ -220,7 +269,7 @@ class ReportService:
                 "period_end": None
             }
             
-            self.supabase.table("reports").insert(report_record).execute()
+            await execute(self.supabase.table("reports").insert(report_record))
             
             # Create Report object with proper types
             return Report(
@@ -258,7 +307,7 @@ class ReportService:
                 query = query.eq("report_type", report_type)
             
             # Add pagination and ordering
-            response = query.order("generated_at", desc=True).range(skip, skip + limit - 1).execute()
+            response = await execute(query.order("generated_at", desc=True).range(skip, skip + limit - 1))
             
             if not response.data or len(response.data) == 0:
                 print(f"No reports found for user {user_id}")
@@ -316,9 +365,9 @@ class ReportService:
     async def get_report_by_id(self, report_id: UUID, user_id: UUID) -> Optional[Report]:
         """Get a specific report by ID."""
         try:
-            response = self.supabase.table("reports").select("*").eq(
+            response = await execute(self.supabase.table("reports").select("*").eq(
                 "id", str(report_id)
-            ).eq("user_id", str(user_id)).execute()
+            ).eq("user_id", str(user_id)))
             
             if response.data:
                 report_data = response.data[0]
@@ -348,7 +397,7 @@ class ReportService:
 
     def _generate_emissions_report_data(
         self,
-        emissions: List[Emission],
+        emissions: List[EmissionTotal],
         purchases: List[CarbonCreditPurchase],
         start_date: datetime,
         end_date: datetime
@@ -411,7 +460,7 @@ class ReportService:
 
     def _generate_compliance_report_data(
         self,
-        emissions: List[Emission],
+        emissions: List[EmissionTotal],
         purchases: List[CarbonCreditPurchase],
         standard: str,
         year: int
@@ -455,7 +504,7 @@ class ReportService:
 
     def _generate_net_zero_report_data(
         self,
-        emissions: List[Emission],
+        emissions: List[EmissionTotal],
         purchases: List[CarbonCreditPurchase]
     ) -> Dict[str, Any]:
         """Generate net-zero progress analysis."""
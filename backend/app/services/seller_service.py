@@ -7,8 +7,14 @@ from uuid import UUID
 from datetime import datetime
 from supabase import Client
 from fastapi import HTTPException, status
+import json
 import logging
 
+from ..core.token_cache import verified_token_cache
+from ..core.user_cache import user_profile_cache
+from ..db.executor import execute
+from .marketplace_catalog import marketplace_catalog
+from ..db.analytics import AnalyticsSession
 from ..models.schemas import (
     SellerVerificationRequest, SellerVerification, VerificationStatus,
     CarbonProjectCreate, CarbonProject, SellerCreditCreate, SellerCredit,
@@ -19,14 +25,15 @@ logger = logging.getLogger(__name__)
 
 
 class SellerService:
-    def __init__(self, db: Client):
+    def __init__(self, db: Client, analytics: Optional[AnalyticsSession] = None):
         self.db = db
+        self.analytics = analytics
 
     async def submit_verification(self, user_id: UUID, verification_data: SellerVerificationRequest) -> SellerVerification:
         """Submit seller verification request."""
         try:
             # Check if user is already verified or has pending verification
-            existing_response = self.db.table("seller_verifications").select("*").eq("user_id", str(user_id)).execute()
+            existing_response = await execute(self.db.table("seller_verifications").select("*").eq("user_id", str(user_id)))
             
             if existing_response.data:
                 existing = existing_response.data[0]
@@ -48,7 +55,7 @@ class SellerService:
                 "submitted_at": datetime.utcnow().isoformat()
             }
             
-            response = self.db.table("seller_verifications").insert(verification_dict).execute()
+            response = await execute(self.db.table("seller_verifications").insert(verification_dict))
             
             if not response.data:
                 raise HTTPException(
@@ -56,6 +63,10 @@ class SellerService:
                     detail="Failed to submit verification"
                 )
             
+            # Cached users carry their seller verification - drop them
+            verified_token_cache.invalidate_user(str(user_id))
+            await user_profile_cache.invalidate(str(user_id))
+            
             return SellerVerification(**response.data[0])
             
         except HTTPException:
@@ -70,7 +81,7 @@ class SellerService:
     async def get_verification_status(self, user_id: UUID) -> Optional[SellerVerification]:
         """Get seller verification status."""
         try:
-            response = self.db.table("seller_verifications").select("*").eq("user_id", str(user_id)).execute()
+            response = await execute(self.db.table("seller_verifications").select("*").eq("user_id", str(user_id)))
             
             if not response.data:
                 return None
@@ -105,7 +116,7 @@ class SellerService:
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            response = self.db.table("carbon_projects").insert(project_dict).execute()
+            response = await execute(self.db.table("carbon_projects").insert(project_dict))
             
             if not response.data:
                 raise HTTPException(
@@ -127,7 +138,7 @@ class SellerService:
     async def get_seller_projects(self, user_id: UUID, skip: int = 0, limit: int = 20) -> List[CarbonProject]:
         """Get all projects for a seller."""
         try:
-            response = self.db.table("carbon_projects").select("*").eq("seller_id", str(user_id)).order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+            response = await execute(self.db.table("carbon_projects").select("*").eq("seller_id", str(user_id)).order("created_at", desc=True).range(skip, skip + limit - 1))
             
             return [CarbonProject(**project) for project in response.data]
             
@@ -139,7 +150,7 @@ class SellerService:
         """Create a new carbon credit listing."""
         try:
             # Verify project belongs to seller and is approved
-            project_response = self.db.table("carbon_projects").select("*").eq("id", str(credit_data.project_id)).eq("seller_id", str(user_id)).execute()
+            project_response = await execute(self.db.table("carbon_projects").select("*").eq("id", str(credit_data.project_id)).eq("seller_id", str(user_id)))
             
             if not project_response.data:
                 raise HTTPException(
@@ -171,7 +182,7 @@ class SellerService:
                 "listed_at": datetime.utcnow().isoformat()
             }
             
-            response = self.db.table("seller_credits").insert(credit_dict).execute()
+            response = await execute(self.db.table("seller_credits").insert(credit_dict))
             
             if not response.data:
                 raise HTTPException(
@@ -179,6 +190,7 @@ class SellerService:
                     detail="Failed to create credit listing"
                 )
             
+            marketplace_catalog.invalidate(response.data[0]["id"])
             return SellerCredit(**response.data[0])
             
         except HTTPException:
@@ -193,7 +205,7 @@ class SellerService:
     async def get_seller_credit_by_id(self, credit_id: UUID) -> Optional[SellerCredit]:
         """Get a specific seller credit by ID."""
         try:
-            response = self.db.table("seller_credits").select("*").eq("id", str(credit_id)).execute()
+            response = await execute(self.db.table("seller_credits").select("*").eq("id", str(credit_id)))
             
             if response.data:
                 return SellerCredit(**response.data[0])
@@ -206,7 +218,7 @@ class SellerService:
     async def get_seller_credits(self, user_id: UUID, skip: int = 0, limit: int = 20) -> List[SellerCredit]:
         """Get all credit listings for a seller."""
         try:
-            response = self.db.table("seller_credits").select("*").eq("seller_id", str(user_id)).order("created_at", desc=True).range(skip, skip + limit - 1).execute()
+            response = await execute(self.db.table("seller_credits").select("*").eq("seller_id", str(user_id)).order("created_at", desc=True).range(skip, skip + limit - 1))
             
             return [SellerCredit(**credit) for credit in response.data]
             
@@ -218,9 +230,9 @@ class SellerService:
         """Get sales transactions for a seller."""
         try:
             # Join with seller_credits to get only this seller's transactions
-            response = self.db.table("sale_transactions").select(
+            response = await execute(self.db.table("sale_transactions").select(
                 "*, seller_credits!inner(seller_id)"
-            ).eq("seller_credits.seller_id", str(user_id)).order("transaction_date", desc=True).range(skip, skip + limit - 1).execute()
+            ).eq("seller_credits.seller_id", str(user_id)).order("transaction_date", desc=True).range(skip, skip + limit - 1))
             
             return [SaleTransaction(**transaction) for transaction in response.data]
             
@@ -230,16 +242,22 @@ class SellerService:
 
     async def get_dashboard_stats(self, user_id: UUID) -> SellerDashboardStats:
         """Get dashboard statistics for a seller."""
+        if self.analytics:
+            try:
+                return await self._dashboard_stats_sql(user_id)
+            except Exception as e:
+                logger.warning(f"Analytics query failed for seller dashboard, using PostgREST: {str(e)}")
+
         try:
             # Get projects count
-            projects_response = self.db.table("carbon_projects").select("id, status").eq("seller_id", str(user_id)).execute()
+            projects_response = await execute(self.db.table("carbon_projects").select("id, status").eq("seller_id", str(user_id)))
             projects = projects_response.data or []
             
             total_projects = len(projects)
             pending_verification = len([p for p in projects if p["status"] == "pending"])
             
             # Get credits stats
-            credits_response = self.db.table("seller_credits").select("quantity, sold_quantity, status").eq("seller_id", str(user_id)).execute()
+            credits_response = await execute(self.db.table("seller_credits").select("quantity, sold_quantity, status").eq("seller_id", str(user_id)))
             credits = credits_response.data or []
             
             active_listings = len([c for c in credits if c["status"] == "available"])
@@ -247,9 +265,9 @@ class SellerService:
             total_credits_sold = sum(float(c["sold_quantity"]) for c in credits)
             
             # Get sales transactions
-            transactions_response = self.db.table("sale_transactions").select(
+            transactions_response = await execute(self.db.table("sale_transactions").select(
                 "total_amount, transaction_date, seller_credits!inner(seller_id)"
-            ).eq("seller_credits.seller_id", str(user_id)).execute()
+            ).eq("seller_credits.seller_id", str(user_id)).neq("status", "cancelled"))
             transactions = transactions_response.data or []
             
             total_revenue = sum(float(t["total_amount"]) for t in transactions)
@@ -313,6 +331,54 @@ class SellerService:
                 recent_transactions=[]
             )
 
+    async def _dashboard_stats_sql(self, user_id: UUID) -> SellerDashboardStats:
+        """Aggregate the seller dashboard in one SQL round trip."""
+        row = await self.analytics.fetchrow(
+            """
+            with projects as (
+                select count(*) as total_projects,
+                       count(*) filter (where status = 'pending') as pending_verification
+                from carbon_projects
+                where seller_id = $1
+            ), credits as (
+                select count(*) filter (where status = 'available') as active_listings,
+                       coalesce(sum(quantity), 0)::float8 as total_credits_minted,
+                       coalesce(sum(sold_quantity), 0)::float8 as total_credits_sold
+                from seller_credits
+                where seller_id = $1
+            ), sales as (
+                select t.id, t.quantity, t.total_amount, t.transaction_date
+                from sale_transactions t
+                join seller_credits c on c.id = t.seller_credit_id
+                where c.seller_id = $1
+                  and t.status <> 'cancelled'  -- Purchases whose settlement failed
+            )
+            select projects.*, credits.*,
+                   (select coalesce(sum(total_amount), 0)::float8 from sales) as total_revenue,
+                   (select coalesce(json_agg(m order by m.month), '[]')
+                    from (select to_char(transaction_date at time zone 'utc', 'YYYY-MM') as month,
+                                 count(*) as sales,
+                                 sum(total_amount)::float8 as revenue
+                          from sales group by 1) m)::text as monthly_sales,
+                   (select coalesce(json_agg(r), '[]')
+                    from (select id, 'Customer' as buyer, quantity::float8 as quantity,
+                                 total_amount::float8 as amount, transaction_date as date
+                          from sales order by transaction_date desc limit 5) r)::text as recent_transactions
+            from projects, credits
+            """,
+            user_id
+        )
+        return SellerDashboardStats(
+            total_projects=row["total_projects"],
+            active_listings=row["active_listings"],
+            total_credits_minted=row["total_credits_minted"],
+            total_credits_sold=row["total_credits_sold"],
+            total_revenue=row["total_revenue"],
+            pending_verification=row["pending_verification"],
+            monthly_sales=json.loads(row["monthly_sales"]),
+            recent_transactions=json.loads(row["recent_transactions"])
+        )
+
     async def get_seller_analytics(self, user_id: UUID) -> SellerAnalytics:
         """Get detailed analytics for a seller."""
         try:
@@ -344,11 +410,13 @@ class SellerService:
     async def update_user_type_to_seller(self, user_id: UUID) -> bool:
         """Update user type to seller after verification approval."""
         try:
-            response = self.db.table("user_profiles").update({
+            response = await execute(self.db.table("user_profiles").update({
                 "type": UserType.SELLER.value,
                 "updated_at": datetime.utcnow().isoformat()
-            }).eq("id", str(user_id)).execute()
+            }).eq("id", str(user_id)))
             
+            verified_token_cache.invalidate_user(str(user_id))
+            await user_profile_cache.invalidate(str(user_id))
             return bool(response.data)
             
         except Exception as e:
@@ -359,7 +427,7 @@ class SellerService:
         """Update the sold_quantity for a seller credit after a purchase."""
         try:
             # First get the current seller credit
-            current_response = self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)).execute()
+            current_response = await execute(self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)))
             
             if not current_response.data:
                 logger.error(f"Seller credit not found: {seller_credit_id}")
@@ -370,13 +438,14 @@ class SellerService:
             new_sold_quantity = current_sold_quantity + quantity_sold
             
             # Update the sold_quantity
-            update_response = self.db.table("seller_credits").update({
+            update_response = await execute(self.db.table("seller_credits").update({
                 "sold_quantity": new_sold_quantity,
                 "updated_at": datetime.utcnow().isoformat()
-            }).eq("id", str(seller_credit_id)).execute()
+            }).eq("id", str(seller_credit_id)))
+            marketplace_catalog.invalidate(seller_credit_id)
             
             # Always verify by fetching the record again (RLS might return empty data)
-            verification_response = self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)).execute()
+            verification_response = await execute(self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)))
             
             if verification_response.data:
                 updated_record = verification_response.data[0]
@@ -412,10 +481,10 @@ class SellerService:
                 update_data["blockchain_token_id"] = blockchain_token_id
             
             # Update the seller credit with blockchain information
-            update_response = self.db.table("seller_credits").update(update_data).eq("id", str(seller_credit_id)).execute()
+            update_response = await execute(self.db.table("seller_credits").update(update_data).eq("id", str(seller_credit_id)))
             
             # Verify the update by fetching the updated record
-            verification_response = self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)).execute()
+            verification_response = await execute(self.db.table("seller_credits").select("*").eq("id", str(seller_credit_id)))
             
             if verification_response.data:
                 updated_record = verification_response.data[0]
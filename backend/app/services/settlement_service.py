@@ -0,0 +1,279 @@
+"""
+Background on-chain settlement of marketplace purchases.
+
+Purchases are recorded as pending_settlement with the listing's stock already
+reserved (purchase_seller_credits), so the request returns without touching the
+chain. A settlement worker then claims the purchase, signs the mint, records it,
+sends it, waits for the receipt and completes the purchase; clients poll the
+purchase for its status.
+
+- Claims are leases held in the database, so only one worker in any process settles
+  a purchase, and one left behind by a crashed worker is picked up once its lease
+  runs out.
+- Mints from the platform account are sent one at a time so each gets the next
+  nonce, and a purchase is claimed only once its turn to send comes. Receipt waits
+  run concurrently on the settlement thread pool, away from the event loop and the
+  database executor, so throughput is set by the chain.
+- A signed mint is recorded (hash, nonce and raw transaction) before it is sent.
+  A later attempt rebroadcasts or waits on that mint and never signs another,
+  unless the mint reverted or a different transaction took its nonce; neither
+  mints anything.
+- A mint the node rejects or that reverts is retried with backoff; after
+  PURCHASE_SETTLEMENT_MAX_ATTEMPTS the purchase is cancelled and its stock released.
+  While the node can't be reached purchases just wait, however long that takes.
+- Pending purchases are rescanned every PURCHASE_SETTLEMENT_SWEEP_SECONDS, which
+  schedules retries and recovers purchases from restarts.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+import logging
+
+from postgrest.types import ReturnMethod
+from web3 import Web3
+from web3.exceptions import ProviderConnectionError, TimeExhausted
+
+from app.core.config import settings
+from app.db.database import get_service_role_database
+from app.db.executor import execute
+from app.services.blockchain_service import BlockchainService
+from app.services.marketplace_catalog import marketplace_catalog
+
+logger = logging.getLogger(__name__)
+
+# Pending purchases picked up per sweep
+SWEEP_BATCH_SIZE = 500
+
+# A claim outlives the receipt wait, so a live worker never loses its purchase
+LEASE_MARGIN_SECONDS = 60
+
+class PurchaseSettlementService:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()  # Queued or being settled in this process
+        self._workers: List[asyncio.Task] = []
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._chain: Optional[BlockchainService] = None
+        self._stats = {"submitted": 0, "settled": 0, "retried": 0, "cancelled": 0, "errors": 0}
+
+    def start(self):
+        """Start the settlement workers and the pending purchase sweep"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._send_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.PURCHASE_SETTLEMENT_CONCURRENCY,
+            thread_name_prefix="settlement"
+        )
+        # Run outside any request's context so its query stats don't keep counting
+        self._workers = [
+            asyncio.create_task(self._work(), context=contextvars.Context())
+            for _ in range(settings.PURCHASE_SETTLEMENT_CONCURRENCY)
+        ]
+        self._workers.append(asyncio.create_task(self._sweep_forever(), context=contextvars.Context()))
+
+    def submit(self, purchase_id: UUID):
+        """Settle a pending purchase as soon as a worker is free"""
+        key = str(purchase_id)
+        # Not started (or already queued): the sweep picks it up
+        if self._queue is None or key in self._queued:
+            return
+        self._queued.add(key)
+        self._queue.put_nowait(key)
+        self._stats["submitted"] += 1
+
+    async def shutdown(self):
+        """Stop the workers; unfinished purchases are resumed once their lease runs out"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if self._executor is not None:
+            # Threads still waiting on a receipt give up at their timeout
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._queue = None
+        self._executor = None
+        self._queued.clear()
+
+    async def _work(self):
+        while True:
+            purchase_id = await self._queue.get()
+            try:
+                await self._settle(purchase_id)
+            except Exception as e:
+                # The lease runs out and a later sweep tries again
+                self._stats["errors"] += 1
+                logger.error(f"Settling purchase {purchase_id} failed: {e}")
+            finally:
+                self._queued.discard(purchase_id)
+
+    async def _sweep_forever(self):
+        while True:
+            try:
+                await self._sweep()
+            except Exception as e:
+                logger.warning(f"Pending purchase sweep failed: {e}")
+            await asyncio.sleep(settings.PURCHASE_SETTLEMENT_SWEEP_SECONDS)
+
+    async def _sweep(self):
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        response = await execute(get_service_role_database().table("carbon_credit_purchases").select("id")
+            .eq("status", "pending_settlement")
+            .or_(f"settlement_claimed_until.is.null,settlement_claimed_until.lt.{now}")
+            .order("purchase_date")
+            .limit(SWEEP_BATCH_SIZE))
+        for row in response.data or []:
+            self.submit(row["id"])
+
+    def _blockchain(self) -> BlockchainService:
+        if self._chain is None:
+            self._chain = BlockchainService()
+        return self._chain
+
+    async def _in_thread(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def _settle(self, purchase_id: str):
+        db = get_service_role_database()
+        chain = self._blockchain()
+        # Claim once it's this worker's turn to send, so waiting for the lock doesn't use up the lease
+        async with self._send_lock:
+            claim = await execute(db.rpc("claim_purchase_settlement", {
+                "p_purchase_id": purchase_id,
+                "p_lease_seconds": int(settings.PURCHASE_SETTLEMENT_RECEIPT_TIMEOUT_SECONDS) + LEASE_MARGIN_SECONDS
+            }))
+            purchase = claim.data
+            if not purchase:
+                # Already settled, or another worker holds it
+                return
+            tx_hash = await self._send_mint(db, chain, purchase)
+        if tx_hash is None:
+            return
+
+        try:
+            succeeded = await self._in_thread(
+                chain.wait_for_receipt, tx_hash, settings.PURCHASE_SETTLEMENT_RECEIPT_TIMEOUT_SECONDS
+            )
+        except TimeExhausted:
+            await self._release(purchase_id, "Waiting for the mint to be confirmed", settings.PURCHASE_SETTLEMENT_RETRY_SECONDS)
+            return
+        except Exception as e:
+            # The mint may still be mined, so this doesn't count as a failed attempt
+            await self._release(purchase_id, f"Could not check the mint: {e}", settings.PURCHASE_SETTLEMENT_RETRY_SECONDS)
+            return
+
+        if not succeeded:
+            await self._failed_attempt(purchase, "Mint transaction reverted", clear_tx_hash=True)
+            return
+
+        await execute(db.rpc("complete_purchase_settlement", {
+            "p_purchase_id": purchase_id,
+            "p_blockchain_tx_hash": tx_hash
+        }))
+        self._stats["settled"] += 1
+        logger.info(f"Purchase {purchase_id} settled: {tx_hash}")
+
+    async def _send_mint(self, db, chain: BlockchainService, purchase: Dict[str, Any]) -> Optional[str]:
+        """Send the purchase's mint, signing it first if it has none; None if it was released instead"""
+        if not await self._in_thread(chain.is_connected):
+            await self._release(purchase["id"], "Blockchain node unavailable", settings.PURCHASE_SETTLEMENT_RETRY_SECONDS)
+            return None
+
+        tx_hash = purchase.get("blockchain_tx_hash")
+        if tx_hash:
+            raw_transaction = purchase.get("settlement_raw_tx")
+            try:
+                if await self._in_thread(chain.transaction_known, tx_hash):
+                    return tx_hash
+                if raw_transaction is None or await self._in_thread(chain.nonce_used, int(purchase["settlement_nonce"])):
+                    # Another transaction took its nonce, so this mint can never be mined
+                    await self._release(purchase["id"], "Mint was dropped, signing a new one", 0, clear_tx_hash=True)
+                    return None
+            except Exception as e:
+                await self._send_failed(purchase, f"Could not check the mint: {e}", e)
+                return None
+        else:
+            try:
+                signed = await self._in_thread(
+                    chain.sign_mint_transaction,
+                    to_address=Web3.to_checksum_address(purchase.get("settlement_address") or chain.admin_account.address),
+                    amount=float(purchase["quantity"]),
+                    project_id=str(purchase["project_id"]),
+                    vintage=str(purchase["vintage_year"]),
+                    standard=purchase.get("standard") or "VCS",
+                    price=float(purchase["price_per_ton"])
+                )
+            except Exception as e:
+                await self._send_failed(purchase, f"Mint could not be signed: {e}", e)
+                return None
+
+            # Record the mint before sending it: if this worker dies, the next attempt finds it
+            tx_hash, raw_transaction = signed["tx_hash"], signed["raw_transaction"]
+            await execute(db.table("carbon_credit_purchases").update({
+                "blockchain_tx_hash": tx_hash,
+                "settlement_nonce": signed["nonce"],
+                "settlement_raw_tx": raw_transaction
+            }, returning=ReturnMethod.minimal).eq("id", purchase["id"]).eq("status", "pending_settlement"))
+
+        try:
+            await self._in_thread(chain.broadcast_transaction, raw_transaction)
+        except Exception as e:
+            # The recorded mint is kept: the next attempt checks for it before sending it again
+            await self._send_failed(purchase, f"Mint could not be sent: {e}", e)
+            return None
+        return tx_hash
+
+    async def _send_failed(self, purchase: Dict[str, Any], error: str, e: Exception):
+        if isinstance(e, (OSError, ProviderConnectionError)):
+            # The node is unreachable, not refusing the mint: wait without using up an attempt
+            await self._release(purchase["id"], error, settings.PURCHASE_SETTLEMENT_RETRY_SECONDS)
+        else:
+            await self._failed_attempt(purchase, error)
+
+    async def _failed_attempt(self, purchase: Dict[str, Any], error: str, clear_tx_hash: bool = False):
+        attempts = int(purchase.get("settlement_attempts") or 0) + 1
+        if attempts < settings.PURCHASE_SETTLEMENT_MAX_ATTEMPTS:
+            self._stats["retried"] += 1
+            await self._release(
+                purchase["id"], error, settings.PURCHASE_SETTLEMENT_RETRY_SECONDS * attempts,
+                failed_attempt=True, clear_tx_hash=clear_tx_hash
+            )
+            return
+
+        # Out of attempts: cancel and put the reserved stock back on the listing
+        await execute(get_service_role_database().rpc("fail_purchase_settlement", {
+            "p_purchase_id": purchase["id"],
+            "p_error": error
+        }))
+        marketplace_catalog.invalidate(purchase["credit_id"])
+        self._stats["cancelled"] += 1
+        logger.warning(f"Purchase {purchase['id']} cancelled after {attempts} settlement attempts: {error}")
+
+    async def _release(self, purchase_id: str, error: str, retry_seconds: int,
+                       failed_attempt: bool = False, clear_tx_hash: bool = False):
+        await execute(get_service_role_database().rpc("release_purchase_settlement", {
+            "p_purchase_id": purchase_id,
+            "p_error": error,
+            "p_retry_seconds": int(retry_seconds),
+            "p_failed_attempt": failed_attempt,
+            "p_clear_tx_hash": clear_tx_hash
+        }))
+
+    def get_stats(self) -> Dict[str, Any]:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {
+            "running": bool(self._workers),
+            "queued": queued,
+            "settling": len(self._queued) - queued,
+            **self._stats
+        }
+
+# Global purchase settlement service instance
+purchase_settlement_service = PurchaseSettlementService()
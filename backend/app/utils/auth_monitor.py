@@ -181,6 +181,10 @@ class AuthDurationMeasurer:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.start_time is None:
             return False
+        
+        # A hedged lookup that lost the race was cancelled, not failed
+        if exc_type is asyncio.CancelledError:
+            return False
             
         duration_ms = (time.time() - self.start_time) * 1000
         
@@ -0,0 +1,34 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row of a page (e.g. created_at and id).
+The next page asks for rows strictly after that key, so a deep page costs the same
+as the first one, unlike offset pagination which scans and discards `skip` rows.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+from uuid import UUID
+
+def encode_cursor(*values: Any) -> str:
+    """Encode a row's sort key as an opaque, URL-safe cursor"""
+    normalized = [v.isoformat() if isinstance(v, datetime) else str(v) if isinstance(v, UUID) else v for v in values]
+    raw = json.dumps(normalized, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if it's malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid pagination cursor")
+    return values
+
+def postgrest_quote(value: Any) -> str:
+    """Quote a value for use inside a PostgREST or=(...) filter"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
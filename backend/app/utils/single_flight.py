@@ -0,0 +1,63 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call instead of
+each running it. The key is forgotten as soon as the call finishes, so only keys
+with a call in progress are held in memory.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn` for `key`, or wait for the call already in flight for that key.
+
+        The call runs in its own task, so a waiter being cancelled (e.g. a client
+        disconnecting) doesn't cancel it for the other waiters.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, fn))
+            task.add_done_callback(_consume_exception)
+            self._calls[key] = task
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        try:
+            return await fn()
+        finally:
+            if self._calls.get(key) is asyncio.current_task():
+                del self._calls[key]
+
+    def forget(self, key: Hashable):
+        """Stop sharing the in-flight call for a key; later callers start a new call"""
+        self._calls.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        return {
+            "name": self.name,
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
+
+def _consume_exception(task: asyncio.Task):
+    # Every waiter may have gone away; mark the exception as retrieved
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,134 @@
+"""
+Size-bounded LRU cache with per-entry TTL and hit/miss/eviction counters.
+
+All operations are plain dict operations that never await, so on the event loop
+they are atomic without a lock. Expired entries are dropped lazily on read and
+proactively by a background sweeper task.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    def __init__(self, name: str, max_size: int = 10000, ttl: float = 300):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[V, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _registry.append(self)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Get a value if present and not expired, marking it most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None, expires_at: Optional[float] = None):
+        """Store a value, expiring after `ttl` (default: cache TTL) or at `expires_at`, whichever is earlier"""
+        deadline = time.time() + (self.ttl if ttl is None else ttl)
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+
+        self._entries[key] = (value, deadline)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove a key, returning whether it was present"""
+        return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Remove all entries"""
+        self._entries.clear()
+
+    def sweep(self) -> int:
+        """Remove all expired entries, returning how many were removed"""
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0
+        }
+
+# Every cache registers itself so sweeping and metrics cover them all
+_registry: List[TTLCache] = []
+_sweeper_task: Optional[asyncio.Task] = None
+
+def get_all_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Get statistics for every TTL cache in the process"""
+    return {cache.name: cache.get_stats() for cache in _registry}
+
+async def _sweep_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        for cache in list(_registry):
+            try:
+                removed = cache.sweep()
+                if removed:
+                    logger.debug(f"Swept {removed} expired entries from {cache.name} cache")
+            except Exception as e:
+                logger.warning(f"Failed to sweep {cache.name} cache: {e}")
+
+def start_cache_sweeper(interval: float = 30):
+    """Start the background task that removes expired entries from all caches"""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweep_forever(interval))
+
+async def stop_cache_sweeper():
+    """Stop the background sweeper task"""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
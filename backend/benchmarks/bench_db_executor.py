@@ -0,0 +1,77 @@
+"""
+Concurrency benchmark for the database executor.
+
+Serves one FastAPI app in-process (a single worker) with two routes that run the same
+simulated Supabase query: one calls the blocking `.execute()` directly on the event
+loop, the other awaits `app.db.executor.execute()`. Fires concurrent requests at each
+and prints throughput.
+
+Usage (from the backend directory):
+    python benchmarks/bench_db_executor.py --requests 200 --concurrency 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from app.db.executor import execute, get_executor_stats
+
+class SimulatedQuery:
+    """Stands in for a PostgREST query builder; `.execute()` blocks for one round trip"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return {"data": []}
+
+def build_app(latency: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/blocking")
+    async def blocking():
+        return SimulatedQuery(latency).execute()
+
+    @app.get("/offloaded")
+    async def offloaded():
+        return await execute(SimulatedQuery(latency))
+
+    return app
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                response = await client.get(path)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated query round trip in seconds")
+    args = parser.parse_args()
+
+    app = build_app(args.latency)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.latency * 1000:.0f}ms per query")
+    for label, path in (("blocking .execute()", "/blocking"), ("await execute()", "/offloaded")):
+        elapsed = await run(app, path, args.requests, args.concurrency)
+        print(f"  {label:<22} {elapsed:7.2f}s  {args.requests / elapsed:8.1f} req/s")
+    print(f"  executor: {get_executor_stats()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+"""
+Contention benchmark for marketplace purchases.
+
+Fires N concurrent buyers at one seller listing, first with the old multi-statement
+flow (read the listing, check what's left, insert the purchase, insert the sale, write
+back sold_quantity as read + bought) and then with the purchase_seller_credits RPC.
+The listing is given stock for half the buyers, so a correct run accepts exactly that
+many and leaves sold_quantity at the listing's stock. Reports throughput, latency,
+accepted purchases, oversold tons and lost sold_quantity increments for each.
+
+`--rtt` sleeps between the statements of the old flow to stand in for the PostgREST
+round trips it made; the RPC is a single round trip.
+
+Runs against DATABASE_URL with asyncpg. Point it at a disposable database with the
+migrations applied and no settlement worker running against it: it rewrites the
+listing's quantities for the run and restores them afterwards, and cancels and
+deletes the purchases and sales it created. The RPC's purchases are
+pending_settlement and are removed before the listing is restored, so nothing is
+left for a worker to mint.
+
+Usage (from the backend directory):
+    python benchmarks/bench_purchase_contention.py --credit-id <seller_credit id> --buyer-id <auth user id> --buyers 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncpg
+
+from app.core.config import settings
+
+class Listing:
+    """Sets a listing's stock for a run and puts its quantities back afterwards"""
+
+    def __init__(self, pool: asyncpg.Pool, credit_id: uuid.UUID):
+        self.pool = pool
+        self.credit_id = credit_id
+        self.original = None
+        self.purchases: List[uuid.UUID] = []  # Every purchase the run recorded
+
+    async def save(self):
+        self.original = await self.pool.fetchrow(
+            "select quantity, sold_quantity, status from public.seller_credits where id = $1", self.credit_id
+        )
+        if self.original is None:
+            raise SystemExit(f"seller credit {self.credit_id} not found")
+
+    async def reset(self, stock: float):
+        await self.pool.execute(
+            "update public.seller_credits set quantity = $2, sold_quantity = 0, status = 'available' where id = $1",
+            self.credit_id, stock
+        )
+
+    async def sold(self) -> float:
+        return float(await self.pool.fetchval(
+            "select sold_quantity from public.seller_credits where id = $1", self.credit_id
+        ))
+
+    async def restore(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Cancel first so a settlement worker can no longer claim them and
+                # release their stock onto the restored listing
+                await conn.execute(
+                    "update public.carbon_credit_purchases set status = 'cancelled', settlement_claimed_until = null "
+                    "where id = any($1::uuid[])", self.purchases
+                )
+                # The naive flow's sales aren't linked to their purchase; match them by hash
+                await conn.execute(
+                    "delete from public.sale_transactions where purchase_id = any($1::uuid[]) "
+                    "or blockchain_tx_hash in (select blockchain_tx_hash from public.carbon_credit_purchases "
+                    "where id = any($1::uuid[]) and blockchain_tx_hash is not null)", self.purchases
+                )
+                await conn.execute("delete from public.carbon_credit_purchases where id = any($1::uuid[])", self.purchases)
+                await conn.execute(
+                    "update public.seller_credits set quantity = $2, sold_quantity = $3, status = $4 where id = $1",
+                    self.credit_id, self.original["quantity"], self.original["sold_quantity"], self.original["status"]
+                )
+
+async def naive_purchase(pool: asyncpg.Pool, credit_id: uuid.UUID, buyer_id: uuid.UUID,
+                         quantity: float, tx_hash: str, rtt: float) -> Optional[uuid.UUID]:
+    """The old flow: every step is its own statement and autocommits"""
+    credit = await pool.fetchrow(
+        "select quantity, sold_quantity, price_per_ton, status from public.seller_credits where id = $1", credit_id
+    )
+    await asyncio.sleep(rtt)
+    if credit["status"] != "available" or float(credit["quantity"]) - float(credit["sold_quantity"] or 0) < quantity:
+        return None
+    total = float(credit["price_per_ton"]) * quantity
+
+    purchase_id = await pool.fetchval(
+        "insert into public.carbon_credit_purchases "
+        "(user_id, credit_id, quantity, price_per_ton, total_cost, status, retired_quantity, blockchain_tx_hash) "
+        "values ($1, $2, $3, $4, $5, 'completed', 0, $6) returning id",
+        buyer_id, credit_id, quantity, credit["price_per_ton"], total, tx_hash
+    )
+    await asyncio.sleep(rtt)
+    await pool.execute(
+        "insert into public.sale_transactions "
+        "(seller_credit_id, buyer_id, quantity, price_per_ton, total_amount, blockchain_tx_hash, status) "
+        "values ($1, $2, $3, $4, $5, $6, 'completed')",
+        credit_id, buyer_id, quantity, credit["price_per_ton"], total, tx_hash
+    )
+    await asyncio.sleep(rtt)
+    await pool.execute(
+        "update public.seller_credits set sold_quantity = $2 where id = $1",
+        credit_id, float(credit["sold_quantity"] or 0) + quantity
+    )
+    await asyncio.sleep(rtt)
+    return purchase_id
+
+async def rpc_purchase(pool: asyncpg.Pool, credit_id: uuid.UUID, buyer_id: uuid.UUID,
+                       quantity: float, tx_hash: str, rtt: float) -> Optional[uuid.UUID]:
+    """
+    purchase_seller_credits, called as the buyer the way PostgREST would. Buyers
+    can't attach a transaction hash, so the purchase is pending_settlement.
+    """
+    claims = json.dumps({"sub": str(buyer_id), "role": "authenticated"})
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("select set_config('request.jwt.claims', $1, true)", claims)
+            try:
+                result = await conn.fetchval("select public.purchase_seller_credits($1, $2)", credit_id, quantity)
+            except asyncpg.RaiseError:
+                return None
+    await asyncio.sleep(rtt)
+    return uuid.UUID(json.loads(result)["purchase"]["id"])
+
+async def run(label, purchase, pool, listing, args, tag):
+    stock = args.quantity * (args.buyers // 2)
+    await listing.reset(stock)
+
+    latencies = []
+
+    async def one(i: int) -> bool:
+        start = time.perf_counter()
+        purchase_id = await purchase(pool, listing.credit_id, args.buyer_id, args.quantity, f"{tag}-{label}-{i}", args.rtt)
+        latencies.append(time.perf_counter() - start)
+        if purchase_id is None:
+            return False
+        listing.purchases.append(purchase_id)
+        return True
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.buyers)))
+    elapsed = time.perf_counter() - start
+
+    accepted = sum(results)
+    bought = accepted * args.quantity
+    sold = await listing.sold()
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+
+    print(f"  {label:<8} {elapsed:6.2f}s  {args.buyers / elapsed:7.1f} purchases/s  "
+          f"p50 {p50:6.1f}ms  p99 {p99:6.1f}ms  accepted {accepted:3d}  "
+          f"oversold {max(0.0, bought - stock):g}t  lost updates {bought - sold:g}t")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credit-id", type=uuid.UUID, required=True, help="seller_credits.id to buy from")
+    parser.add_argument("--buyer-id", type=uuid.UUID, required=True, help="auth.users.id the purchases are recorded for")
+    parser.add_argument("--buyers", type=int, default=100)
+    parser.add_argument("--quantity", type=float, default=1.0, help="Tons per purchase")
+    parser.add_argument("--rtt", type=float, default=0.02, help="Simulated API round trip in seconds")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    args = parser.parse_args()
+
+    if not args.database_url:
+        raise SystemExit("DATABASE_URL is not set")
+
+    pool = await asyncpg.create_pool(args.database_url, min_size=1, max_size=args.buyers)
+    listing = Listing(pool, args.credit_id)
+    await listing.save()
+    tag = f"bench-{uuid.uuid4().hex[:8]}"
+
+    print(f"{args.buyers} buyers x {args.quantity:g}t, stock for {args.buyers // 2}, {args.rtt * 1000:.0f}ms round trip")
+    try:
+        await run("naive", naive_purchase, pool, listing, args, tag)
+        await run("rpc", rpc_purchase, pool, listing, args, tag)
+    finally:
+        await listing.restore()
+        await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+"""
+Decoding benchmark for emission read paths.
+
+Builds a synthetic result for one user with many emissions, shaped like PostgREST
+JSON, and times the ways the services turn it into something usable:
+
+    per-row model_validate     - the old EmissionService path over select("*") rows
+    hand-parsed constructor    - the old ReportService._parse_emission_data path
+    decode_rows (projected)    - app.db.rows.decode_rows over select(EMISSION_COLUMNS) rows
+    raw dicts (3 columns)      - aggregation-only callers that build no models
+
+Also prints the JSON payload size of the full and projected rows.
+
+Usage (from the backend directory):
+    python benchmarks/bench_row_decoding.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.rows import decode_rows
+from app.models.schemas import Emission
+from app.services.emission_service import EMISSION_COLUMNS
+
+CATEGORIES = ["transportation", "energy", "manufacturing", "agriculture", "waste"]
+
+def build_rows(count: int):
+    """Rows as select("*") returns them, including columns Emission doesn't read"""
+    user_id = str(uuid.uuid4())
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created = (start + timedelta(minutes=i)).isoformat().replace("+00:00", "Z")
+        co2 = round(random.uniform(1, 500), 3)
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "activity_name": f"Activity {i}",
+            "category": random.choice(CATEGORIES),
+            "description": "Fleet fuel consumption imported from ERP",
+            "amount": round(random.uniform(1, 1000), 2),
+            "unit": "kWh",
+            "emission_factor": 0.233,
+            "co2_equivalent": co2,
+            "offset_amount": 0.0,
+            "remaining_amount": co2,
+            "is_offset": False,
+            "offset_date": None,
+            "offset_purchase_id": None,
+            "metadata": {"source": "erp", "batch": i // 500},
+            "date": created,
+            "created_at": created,
+            "updated_at": created
+        })
+    return rows
+
+def per_row_model_validate(rows):
+    return [Emission.model_validate(row) for row in rows]
+
+def hand_parsed(rows):
+    emissions = []
+    for row in rows:
+        data = dict(row)
+        data["date"] = datetime.fromisoformat(data["date"].replace("Z", "+00:00"))
+        data["created_at"] = datetime.fromisoformat(data["created_at"].replace("Z", "+00:00"))
+        data["updated_at"] = datetime.fromisoformat(data["updated_at"].replace("Z", "+00:00"))
+        data["id"] = UUID(data["id"])
+        data["user_id"] = UUID(data["user_id"])
+        emissions.append(Emission(**data))
+    return emissions
+
+def raw_totals(rows):
+    totals = defaultdict(float)
+    for row in rows:
+        totals[(row["category"], row["date"][:7])] += row["co2_equivalent"]
+    return totals
+
+def timed(label: str, fn, rows, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<28} {best * 1000:9.1f} ms   {len(rows) / best:12,.0f} rows/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Emission row decoding benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    full = build_rows(args.rows)
+    fields = [name.strip() for name in EMISSION_COLUMNS.split(",")]
+    projected = [{name: row[name] for name in fields} for row in full]
+    narrow = [{"category": row["category"], "date": row["date"], "co2_equivalent": row["co2_equivalent"]} for row in full]
+
+    print(f"Payload for {args.rows:,} rows:")
+    print(f"  select(*)                    {len(json.dumps(full)) / 1e6:9.1f} MB")
+    print(f"  select(EMISSION_COLUMNS)     {len(json.dumps(projected)) / 1e6:9.1f} MB")
+    print(f"  category, date, co2e         {len(json.dumps(narrow)) / 1e6:9.1f} MB")
+
+    print(f"Decoding (best of {args.repeat}):")
+    timed("per-row model_validate", per_row_model_validate, full, args.repeat)
+    timed("hand-parsed constructor", hand_parsed, full, args.repeat)
+    timed("decode_rows (projected)", lambda rows: decode_rows(Emission, rows), projected, args.repeat)
+    timed("raw dicts (3 columns)", raw_totals, narrow, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,13 @@ import os
 from pathlib import Path
 from app.core.config import settings
 from app.api.v1 import auth, emissions, marketplace, ai_recommendations, reports, dashboard, carbon_estimates, offsets, external_api, api_management, seller, blockchain, health
-from app.db.database import db
+from app.db.database import db, start_health_prober, stop_health_prober
+from app.db.executor import shutdown_executor
+from app.db.analytics import analytics_db
+from app.db.query_stats import begin_request, end_request
+from app.utils.ttl_cache import start_cache_sweeper, stop_cache_sweeper
+from app.services.ingestion_service import emission_ingestion_service
+from app.services.settlement_service import purchase_settlement_service
 import logging
 import time
 
@@ -42,6 +48,28 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+# Count database queries per request, report them in Server-Timing and flag N+1 patterns
+@app.middleware("http")
+async def instrument_queries(request: Request, call_next):
+    stats, token = begin_request()
+    try:
+        response = await call_next(request)
+    finally:
+        end_request(token)
+    
+    if stats.queries:
+        response.headers.append("Server-Timing", stats.server_timing())
+        route = f"{request.method} {request.url.path}"
+        if stats.queries > settings.DB_QUERY_BUDGET_PER_REQUEST:
+            logger.warning(
+                f"{route} made {stats.queries} database queries "
+                f"(budget {settings.DB_QUERY_BUDGET_PER_REQUEST}): {stats.to_dict()}"
+            )
+        for shape, count in stats.repeated_shapes(settings.DB_REPEATED_QUERY_WARN_THRESHOLD):
+            logger.warning(f"{route} repeated query {count} times, possible N+1: {shape}")
+    
+    return response
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -49,6 +77,7 @@ app.add_middleware(
     allow_credentials=False,  # Set to False when using allow_origins=["*"]
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
 # Mount static files from frontend build
@@ -160,11 +189,27 @@ async def startup_event():
     """Initialize database connection on startup"""
     try:
         db.connect()
+        await analytics_db.connect()
+        start_health_prober(settings.DB_HEALTH_PROBE_INTERVAL_SECONDS)
+        start_cache_sweeper(settings.CACHE_SWEEP_INTERVAL_SECONDS)
+        purchase_settlement_service.start()
         logger.info("Application started successfully")
     except Exception as e:
         logger.error(f"Failed to start application: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and close pooled connections on shutdown"""
+    await stop_cache_sweeper()
+    await stop_health_prober()
+    # Before the executor goes away, since running jobs and settlements write through it
+    await emission_ingestion_service.shutdown()
+    await purchase_settlement_service.shutdown()
+    shutdown_executor()
+    await analytics_db.close()
+    db.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,54 @@
+"""
+Maintenance commands for the emission_rollups table.
+
+    python scripts/emission_rollups.py rebuild [--user-id UUID]   # backfill / recompute from emissions
+    python scripts/emission_rollups.py check [--user-id UUID]     # list rollups that disagree with emissions
+
+`check` exits with status 1 when it finds inconsistencies. Both use the service role key.
+"""
+import argparse
+import os
+import sys
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.database import get_service_role_database
+
+def rebuild(user_id):
+    db = get_service_role_database()
+    result = db.rpc("rebuild_emission_rollups", {"p_user_id": user_id}).execute()
+    scope = f"user {user_id}" if user_id else "all users"
+    print(f"Rebuilt emission rollups for {scope}: {result.data} rows written")
+    return 0
+
+def check(user_id):
+    db = get_service_role_database()
+    result = db.rpc("check_emission_rollups", {"p_user_id": user_id}).execute()
+    mismatches = result.data or []
+    if not mismatches:
+        print("Emission rollups are consistent")
+        return 0
+
+    print(f"Found {len(mismatches)} inconsistent rollup rows:")
+    for row in mismatches:
+        print(
+            f"  user={row['user_id']} month={row['month']} category={row['category']} "
+            f"co2 {row['rollup_co2_equivalent']} vs {row['actual_co2_equivalent']}, "
+            f"offset {row['rollup_offset_amount']} vs {row['actual_offset_amount']}, "
+            f"count {row['rollup_emission_count']} vs {row['actual_emission_count']}"
+        )
+    print("Run `rebuild` to recompute them")
+    return 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", help="Limit to one user")
+    args = parser.parse_args()
+
+    command = rebuild if args.command == "rebuild" else check
+    sys.exit(command(args.user_id))
+
+if __name__ == "__main__":
+    main()
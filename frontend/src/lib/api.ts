@@ -392,10 +392,11 @@ class ApiClient {
     return response;
   }
 
-  async purchaseCredits(purchaseData: { credit_id: string; quantity: number }): Promise<CreditPurchase> {
+  async purchaseCredits(purchaseData: { credit_id: string; quantity: number }, idempotencyKey?: string): Promise<CreditPurchase> {
     const response = await this.request<CreditPurchase>('/marketplace/purchase', {
       method: 'POST',
       body: JSON.stringify(purchaseData),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
     });
     return response;
   }
@@ -417,10 +418,11 @@ class ApiClient {
     return response;
   }
 
-  async retireCredits(retireData: { purchase_id: string; quantity: number }): Promise<CreditPurchase> {
+  async retireCredits(retireData: { purchase_id: string; quantity: number }, idempotencyKey?: string): Promise<CreditPurchase> {
     const response = await this.request<CreditPurchase>('/marketplace/retire', {
       method: 'POST',
       body: JSON.stringify(retireData),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
     });
     return response;
   }
@@ -900,10 +902,12 @@ class ApiClient {
     return this.request('/blockchain/status');
   }
 
-  async purchaseCreditsBlockchain(data: { project_id: string; quantity: number; wallet_address: string }) {
+  // Pass the same idempotencyKey when retrying a purchase so it isn't made twice
+  async purchaseCreditsBlockchain(data: { project_id: string; quantity: number; wallet_address: string }, idempotencyKey?: string) {
     return this.request('/blockchain/purchase-credits', {
       method: 'POST',
       body: JSON.stringify(data),
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined,
     });
   }
 }
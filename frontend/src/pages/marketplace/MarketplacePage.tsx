@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAccount } from 'wagmi';
 import { Card, CardContent, CardHeader } from '../../components/ui/Card';
 import { Button } from '../../components/ui/Button';
@@ -22,6 +22,8 @@ export default function MarketplacePage() {
   });
   const [selectedCredit, setSelectedCredit] = useState<CarbonCredit | null>(null);
   const [purchaseQuantity, setPurchaseQuantity] = useState(1);
+  // One key per purchase dialog, so retrying after a timeout can't buy twice
+  const purchaseKey = useRef<string | null>(null);
   const [showPurchaseModal, setShowPurchaseModal] = useState(false);
 
   const projectTypes = [
@@ -99,12 +101,12 @@ export default function MarketplacePage() {
       setIsPurchasing(true);
       
       // Use blockchain purchase instead of traditional database purchase
-      // This will: 1) mint credits to buyer's wallet, 2) transfer payment, 3) record transaction in DB
+      // The purchase is recorded right away; credits are minted to the buyer's wallet in the background
       const response = await apiClient.purchaseCreditsBlockchain({ 
         project_id: selectedCredit.id, 
         quantity: purchaseQuantity,
         wallet_address: address
-      }) as { transaction_hash: string, success: boolean };
+      }, purchaseKey.current ?? undefined) as { purchase_id: string, status: string, success: boolean };
       
       // Refresh credits to update availability
       fetchCredits();
@@ -114,7 +116,12 @@ export default function MarketplacePage() {
       setSelectedCredit(null);
       setPurchaseQuantity(1);
       
-      addToast(`Purchase completed! Tx: ${response.transaction_hash}`, 'success');
+      addToast(
+        response.status === 'pending_settlement'
+          ? 'Purchase accepted! Your credits are being minted to your wallet.'
+          : 'Purchase completed!',
+        'success'
+      );
     } catch (error) {
       console.error('Error purchasing credits:', error);
       addToast('Failed to complete purchase. Please try again.', 'error');
@@ -126,6 +133,7 @@ export default function MarketplacePage() {
   const openPurchaseModal = (credit: CarbonCredit) => {
     setSelectedCredit(credit);
     setPurchaseQuantity(1);
+    purchaseKey.current = crypto.randomUUID();
     setShowPurchaseModal(true);  };
 
   const totalCreditsAvailable = credits.reduce((sum, credit) => sum + credit.available_quantity, 0);  const averagePrice = credits.length > 0 
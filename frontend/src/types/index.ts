@@ -103,9 +103,11 @@ export interface CreditPurchase {
   price_per_ton: number;
   total_cost: number;
   purchase_date: string;
-  status: 'pending' | 'completed' | 'cancelled';
+  status: 'pending' | 'pending_settlement' | 'completed' | 'cancelled';
   retired_quantity: number;
   last_retirement_date?: string;
+  settlement_error?: string;
+  settled_at?: string;
   credit?: CarbonCredit;
 }
 
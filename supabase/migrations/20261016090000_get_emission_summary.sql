@@ -0,0 +1,59 @@
+-- Emission summary in one round trip: totals, per-category sums, offsets and
+-- monthly trends from a single pass over the user's emissions.
+-- Runs as the caller (security invoker), so RLS on emissions still applies.
+
+create index if not exists emissions_user_id_date_idx
+    on public.emissions (user_id, date);
+
+create or replace function public.get_emission_summary(
+    p_user_id uuid,
+    p_start_date timestamptz default date_trunc('month', now() - interval '11 months')
+)
+returns jsonb
+language sql
+stable
+as $$
+    with grouped as (
+        select category,
+               date_trunc('month', date) as month,
+               sum(co2_equivalent) as emissions,
+               sum(coalesce(offset_amount, 0)) as offsets
+        from public.emissions
+        where user_id = p_user_id
+        group by category, date_trunc('month', date)
+    ),
+    by_category as (
+        select category, sum(emissions) as emissions
+        from grouped
+        group by category
+    ),
+    by_month as (
+        select month, sum(emissions) as emissions, sum(offsets) as offsets
+        from grouped
+        where month >= date_trunc('month', p_start_date)
+        group by month
+    )
+    select jsonb_build_object(
+        'total_emissions', coalesce((select sum(emissions) from grouped), 0),
+        'total_offsets', coalesce((select sum(offsets) from grouped), 0),
+        'emissions_by_category', coalesce(
+            (select jsonb_object_agg(category, emissions) from by_category),
+            '{}'::jsonb
+        ),
+        'monthly_trends', coalesce(
+            (select jsonb_agg(
+                        jsonb_build_object(
+                            'month', to_char(month, 'YYYY-MM'),
+                            'emissions', emissions,
+                            'offsets', offsets,
+                            'net_emissions', emissions - offsets
+                        )
+                        order by month
+                    )
+             from by_month),
+            '[]'::jsonb
+        )
+    );
+$$;
+
+grant execute on function public.get_emission_summary(uuid, timestamptz) to authenticated;
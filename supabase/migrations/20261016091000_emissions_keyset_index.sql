@@ -0,0 +1,5 @@
+-- Keyset pagination for get_user_emissions: newest first, id as tie-breaker.
+-- The (user_id, date) index from get_emission_summary serves the date-window filter.
+
+create index if not exists emissions_user_id_created_at_id_idx
+    on public.emissions (user_id, created_at desc, id desc);
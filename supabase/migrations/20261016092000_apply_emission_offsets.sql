@@ -0,0 +1,53 @@
+-- Apply offset allocations to many emissions in one transaction.
+-- p_allocations: [{"id", "offset_amount", "expected_offset_amount", "is_offset", "offset_purchase_id"}, ...]
+-- Every row must still carry the offset_amount the caller read (expected_offset_amount);
+-- otherwise another offset got there first and nothing is applied.
+-- Runs as the caller (security invoker), so RLS on emissions still applies.
+
+create or replace function public.apply_emission_offsets(
+    p_user_id uuid,
+    p_allocations jsonb,
+    p_offset_date timestamptz default now()
+)
+returns setof public.emissions
+language plpgsql
+as $$
+declare
+    v_expected integer := jsonb_array_length(p_allocations);
+    v_updated integer;
+begin
+    return query
+    with allocations as (
+        select *
+        from jsonb_to_recordset(p_allocations) as a(
+            id uuid,
+            offset_amount double precision,
+            expected_offset_amount double precision,
+            is_offset boolean,
+            offset_purchase_id uuid
+        )
+    ),
+    updated as (
+        update public.emissions e
+           set offset_amount = a.offset_amount,
+               is_offset = a.is_offset,
+               offset_date = p_offset_date,
+               offset_purchase_id = a.offset_purchase_id,
+               updated_at = p_offset_date
+          from allocations a
+         where e.id = a.id
+           and e.user_id = p_user_id
+           and abs(coalesce(e.offset_amount, 0) - coalesce(a.expected_offset_amount, 0)) < 1e-6
+        returning e.*
+    )
+    select * from updated;
+
+    get diagnostics v_updated = row_count;
+    if v_updated <> v_expected then
+        raise exception 'Emissions changed while offsetting (% of % could be updated)', v_updated, v_expected
+            using errcode = '40001';
+    end if;
+end;
+$$;
+
+grant execute on function public.apply_emission_offsets(uuid, jsonb, timestamptz) to authenticated;
@@ -0,0 +1,28 @@
+-- Remaining (not yet offset) amount per emission, maintained by Postgres, so
+-- offset-eligible emissions can be filtered and paginated in the database.
+
+alter table public.emissions
+    add column if not exists remaining_amount numeric
+    generated always as ((co2_equivalent - coalesce(offset_amount, 0))::numeric) stored;
+
+-- Offset-eligible emissions, newest activity first
+create index if not exists emissions_offset_eligible_idx
+    on public.emissions (user_id, date desc)
+    where remaining_amount > 0;
+
+-- Offset statistics in one aggregate. Runs as the caller, so RLS still applies.
+create or replace function public.get_offset_stats(p_user_id uuid)
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'total_emissions', coalesce(sum(co2_equivalent), 0),
+        'total_offset_amount', coalesce(sum(offset_amount) filter (where is_offset), 0),
+        'offset_emissions_count', count(*) filter (where is_offset)
+    )
+    from public.emissions
+    where user_id = p_user_id;
+$$;
+
+grant execute on function public.get_offset_stats(uuid) to authenticated;
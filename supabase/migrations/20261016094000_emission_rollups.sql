@@ -0,0 +1,242 @@
+-- Per-user emission rollups by month and category, maintained incrementally by a
+-- trigger on emissions, so aggregate reads cost O(months) instead of O(rows).
+-- Rebuild with rebuild_emission_rollups(); verify with check_emission_rollups().
+
+create table if not exists public.emission_rollups (
+    user_id uuid not null,
+    month date not null,
+    category text not null,
+    co2_equivalent numeric not null default 0,
+    offset_amount numeric not null default 0,
+    emission_count integer not null default 0,
+    offset_count integer not null default 0,
+    updated_at timestamptz not null default now(),
+    primary key (user_id, month, category)
+);
+
+alter table public.emission_rollups enable row level security;
+
+drop policy if exists "Users can view their own emission rollups" on public.emission_rollups;
+create policy "Users can view their own emission rollups"
+    on public.emission_rollups for select
+    using (auth.uid() = user_id);
+
+-- Add (or, with negative values, remove) one emission's contribution
+create or replace function public.emission_rollup_add(
+    p_user_id uuid,
+    p_month date,
+    p_category text,
+    p_co2_equivalent numeric,
+    p_offset_amount numeric,
+    p_emission_count integer,
+    p_offset_count integer
+)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.emission_rollups as r
+        (user_id, month, category, co2_equivalent, offset_amount, emission_count, offset_count)
+    values
+        (p_user_id, p_month, p_category, p_co2_equivalent, p_offset_amount, p_emission_count, p_offset_count)
+    on conflict (user_id, month, category) do update
+        set co2_equivalent = r.co2_equivalent + excluded.co2_equivalent,
+            offset_amount = r.offset_amount + excluded.offset_amount,
+            emission_count = r.emission_count + excluded.emission_count,
+            offset_count = r.offset_count + excluded.offset_count,
+            updated_at = now();
+
+    if p_emission_count < 0 then
+        delete from public.emission_rollups
+         where user_id = p_user_id
+           and month = p_month
+           and category = p_category
+           and emission_count <= 0;
+    end if;
+end;
+$$;
+
+create or replace function public.maintain_emission_rollups()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform public.emission_rollup_add(
+            old.user_id,
+            date_trunc('month', old.date)::date,
+            old.category::text,
+            -old.co2_equivalent,
+            -coalesce(old.offset_amount, 0),
+            -1,
+            -(case when old.is_offset then 1 else 0 end)
+        );
+    end if;
+
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.emission_rollup_add(
+            new.user_id,
+            date_trunc('month', new.date)::date,
+            new.category::text,
+            new.co2_equivalent,
+            coalesce(new.offset_amount, 0),
+            1,
+            case when new.is_offset then 1 else 0 end
+        );
+    end if;
+
+    return null;
+end;
+$$;
+
+drop trigger if exists emissions_maintain_rollups on public.emissions;
+create trigger emissions_maintain_rollups
+    after insert or delete or update of user_id, date, category, co2_equivalent, offset_amount, is_offset
+    on public.emissions
+    for each row
+    execute function public.maintain_emission_rollups();
+
+-- Recompute rollups from emissions, for one user or everyone. Returns rows written.
+create or replace function public.rebuild_emission_rollups(p_user_id uuid default null)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_rows integer;
+begin
+    -- Writers' triggers wait until the rebuild commits, then apply their deltas on top
+    lock table public.emission_rollups in share row exclusive mode;
+
+    delete from public.emission_rollups
+     where p_user_id is null or user_id = p_user_id;
+
+    insert into public.emission_rollups
+        (user_id, month, category, co2_equivalent, offset_amount, emission_count, offset_count)
+    select user_id,
+           date_trunc('month', date)::date,
+           category::text,
+           sum(co2_equivalent),
+           sum(coalesce(offset_amount, 0)),
+           count(*),
+           count(*) filter (where is_offset)
+      from public.emissions
+     where p_user_id is null or user_id = p_user_id
+     group by 1, 2, 3;
+
+    get diagnostics v_rows = row_count;
+    return v_rows;
+end;
+$$;
+
+-- Rollup rows that disagree with the raw emissions (empty when consistent)
+create or replace function public.check_emission_rollups(p_user_id uuid default null)
+returns table (
+    user_id uuid,
+    month date,
+    category text,
+    rollup_co2_equivalent numeric,
+    actual_co2_equivalent numeric,
+    rollup_offset_amount numeric,
+    actual_offset_amount numeric,
+    rollup_emission_count integer,
+    actual_emission_count integer
+)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    with actual as (
+        select e.user_id,
+               date_trunc('month', e.date)::date as month,
+               e.category::text as category,
+               sum(e.co2_equivalent) as co2_equivalent,
+               sum(coalesce(e.offset_amount, 0)) as offset_amount,
+               count(*)::integer as emission_count
+          from public.emissions e
+         where p_user_id is null or e.user_id = p_user_id
+         group by 1, 2, 3
+    ),
+    rollup as (
+        select r.user_id, r.month, r.category, r.co2_equivalent, r.offset_amount, r.emission_count
+          from public.emission_rollups r
+         where p_user_id is null or r.user_id = p_user_id
+    )
+    select coalesce(r.user_id, a.user_id),
+           coalesce(r.month, a.month),
+           coalesce(r.category, a.category),
+           r.co2_equivalent,
+           a.co2_equivalent,
+           r.offset_amount,
+           a.offset_amount,
+           r.emission_count,
+           a.emission_count
+      from rollup r
+      full join actual a
+        on a.user_id = r.user_id and a.month = r.month and a.category = r.category
+     where r.user_id is null
+        or a.user_id is null
+        or abs(r.co2_equivalent - a.co2_equivalent) > 1e-6
+        or abs(r.offset_amount - a.offset_amount) > 1e-6
+        or r.emission_count <> a.emission_count;
+$$;
+
+revoke execute on function public.emission_rollup_add(uuid, date, text, numeric, numeric, integer, integer) from public, anon, authenticated;
+revoke execute on function public.rebuild_emission_rollups(uuid) from public, anon, authenticated;
+revoke execute on function public.check_emission_rollups(uuid) from public, anon, authenticated;
+grant execute on function public.rebuild_emission_rollups(uuid) to service_role;
+grant execute on function public.check_emission_rollups(uuid) to service_role;
+
+-- Backfill
+select public.rebuild_emission_rollups();
+
+-- The summary now reads the rollups instead of scanning emissions
+create or replace function public.get_emission_summary(
+    p_user_id uuid,
+    p_start_date timestamptz default date_trunc('month', now() - interval '11 months')
+)
+returns jsonb
+language sql
+stable
+as $$
+    with by_category as (
+        select category, sum(co2_equivalent) as emissions
+          from public.emission_rollups
+         where user_id = p_user_id
+         group by category
+    ),
+    by_month as (
+        select month, sum(co2_equivalent) as emissions, sum(offset_amount) as offsets
+          from public.emission_rollups
+         where user_id = p_user_id
+           and month >= date_trunc('month', p_start_date)::date
+         group by month
+    )
+    select jsonb_build_object(
+        'total_emissions', coalesce((select sum(co2_equivalent) from public.emission_rollups where user_id = p_user_id), 0),
+        'total_offsets', coalesce((select sum(offset_amount) from public.emission_rollups where user_id = p_user_id), 0),
+        'emissions_by_category', coalesce(
+            (select jsonb_object_agg(category, emissions) from by_category),
+            '{}'::jsonb
+        ),
+        'monthly_trends', coalesce(
+            (select jsonb_agg(
+                        jsonb_build_object(
+                            'month', to_char(month, 'YYYY-MM'),
+                            'emissions', emissions,
+                            'offsets', offsets,
+                            'net_emissions', emissions - offsets
+                        )
+                        order by month
+                    )
+               from by_month),
+            '[]'::jsonb
+        )
+    );
+$$;
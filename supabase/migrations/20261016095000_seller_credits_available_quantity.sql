@@ -0,0 +1,23 @@
+-- Marketplace listings: a stored available_quantity so sold-out listings are
+-- filtered (and paginated) in the database, plus indexes for the listing query.
+
+alter table public.seller_credits
+    add column if not exists available_quantity numeric
+    generated always as (quantity - coalesce(sold_quantity, 0)) stored;
+
+-- The default listing: available, newest first. Partial, so sold-out rows are not indexed.
+create index if not exists seller_credits_listing_idx
+    on public.seller_credits (status, created_at desc, id desc)
+    where available_quantity > 0;
+
+-- Price range filters
+create index if not exists seller_credits_listing_price_idx
+    on public.seller_credits (status, price_per_ton)
+    where available_quantity > 0;
+
+-- project_type lives on carbon_projects; the inner join probes it by id
+create index if not exists carbon_projects_project_type_idx
+    on public.carbon_projects (project_type, id);
+
+create index if not exists seller_credits_project_id_idx
+    on public.seller_credits (project_id);
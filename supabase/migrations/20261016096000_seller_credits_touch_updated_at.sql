@@ -0,0 +1,22 @@
+-- Keep seller_credits.updated_at current on every update, including writes that
+-- only change sold_quantity, so the in-process marketplace catalogs of all
+-- workers pick the change up from their updated_at deltas.
+
+create or replace function public.touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists seller_credits_touch_updated_at on public.seller_credits;
+create trigger seller_credits_touch_updated_at
+    before update on public.seller_credits
+    for each row
+    execute function public.touch_updated_at();
+
+create index if not exists seller_credits_updated_at_idx
+    on public.seller_credits (updated_at);
@@ -0,0 +1,90 @@
+-- Buy from a seller listing in one transaction: lock the listing row, check what's
+-- left, insert the purchase and the seller's sale, and increment sold_quantity.
+-- Concurrent buyers of the same listing queue on the row lock, so a listing can't
+-- be oversold and no increment is lost.
+--
+-- The buyer is the caller (auth.uid()). Security definer because buyers can't
+-- update other users' listings under RLS. A purchase already paid on chain
+-- (p_blockchain_tx_hash) can only be recorded by the API with the service role,
+-- after it has validated the transaction; it names the buyer in p_buyer_id.
+--
+-- Errors: P0002 listing not found; P0001 not purchasable (bad quantity, listing
+-- not available, or not enough left).
+
+create or replace function public.purchase_seller_credits(
+    p_credit_id uuid,
+    p_quantity numeric,
+    p_blockchain_tx_hash text default null,
+    p_buyer_id uuid default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_service boolean := coalesce(auth.role(), '') = 'service_role';
+    v_buyer_id uuid := case when v_service then p_buyer_id else auth.uid() end;
+    v_credit public.seller_credits%rowtype;
+    v_available numeric;
+    v_purchase public.carbon_credit_purchases%rowtype;
+    v_sale public.sale_transactions%rowtype;
+begin
+    if v_buyer_id is null then
+        raise exception 'Not authenticated' using errcode = '42501';
+    end if;
+    if p_blockchain_tx_hash is not null and not v_service then
+        raise exception 'Only the API can record a purchase with a transaction hash' using errcode = '42501';
+    end if;
+    if p_quantity is null or p_quantity <= 0 then
+        raise exception 'Quantity must be positive' using errcode = 'P0001';
+    end if;
+
+    select * into v_credit
+      from public.seller_credits
+     where id = p_credit_id
+       for update;
+
+    if not found then
+        raise exception 'Seller credit not found' using errcode = 'P0002';
+    end if;
+    if v_credit.status <> 'available' then
+        raise exception 'Credit listing is not available' using errcode = 'P0001';
+    end if;
+
+    v_available := v_credit.quantity - coalesce(v_credit.sold_quantity, 0);
+    if v_available < p_quantity then
+        raise exception 'Insufficient quantity available. Available: %, Requested: %', v_available, p_quantity
+            using errcode = 'P0001';
+    end if;
+
+    insert into public.carbon_credit_purchases
+        (user_id, credit_id, quantity, price_per_ton, total_cost, status, retired_quantity, blockchain_tx_hash)
+    values
+        (v_buyer_id, p_credit_id, p_quantity, v_credit.price_per_ton, v_credit.price_per_ton * p_quantity,
+         'completed', 0, p_blockchain_tx_hash)
+    returning * into v_purchase;
+
+    insert into public.sale_transactions
+        (seller_credit_id, buyer_id, quantity, price_per_ton, total_amount, blockchain_tx_hash, status)
+    values
+        (p_credit_id, v_buyer_id, p_quantity, v_credit.price_per_ton, v_credit.price_per_ton * p_quantity,
+         p_blockchain_tx_hash, 'completed')
+    returning * into v_sale;
+
+    update public.seller_credits
+       set sold_quantity = coalesce(sold_quantity, 0) + p_quantity,
+           updated_at = now()
+     where id = p_credit_id;
+
+    return jsonb_build_object(
+        'purchase', to_jsonb(v_purchase),
+        'sale', to_jsonb(v_sale),
+        'seller_id', v_credit.seller_id,
+        'available_quantity', v_available - p_quantity
+    );
+end;
+$$;
+
+revoke execute on function public.purchase_seller_credits(uuid, numeric, text, uuid) from public, anon;
+grant execute on function public.purchase_seller_credits(uuid, numeric, text, uuid) to authenticated, service_role;
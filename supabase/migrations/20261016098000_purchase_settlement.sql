@@ -0,0 +1,306 @@
+-- Asynchronous on-chain settlement of marketplace purchases.
+--
+-- A buyer's purchase is recorded as 'pending_settlement': the listing's stock is
+-- reserved (sold_quantity is incremented) and the sale is 'pending'. The API's settlement worker then claims the purchase, mints the
+-- credits, waits for the receipt and completes it, or cancels it and releases the
+-- stock. Claims are leases, so a purchase left behind by a crashed worker is picked
+-- up again once its lease runs out. A mint is recorded here once signed and before
+-- it is sent, so a later worker rebroadcasts or waits on it instead of minting again.
+
+alter table public.carbon_credit_purchases drop constraint if exists carbon_credit_purchases_status_check;
+alter table public.carbon_credit_purchases add constraint carbon_credit_purchases_status_check
+    check (status in ('pending', 'pending_settlement', 'completed', 'cancelled'));
+
+alter table public.carbon_credit_purchases
+    add column if not exists settlement_address text,  -- Mint to; null mints to the platform account
+    add column if not exists settlement_attempts integer not null default 0,  -- Failed mints so far
+    add column if not exists settlement_error text,
+    add column if not exists settlement_nonce bigint,  -- Of the signed mint in blockchain_tx_hash
+    add column if not exists settlement_raw_tx text,  -- The signed mint, for rebroadcasting
+    add column if not exists settlement_claimed_until timestamptz,
+    add column if not exists settled_at timestamptz;
+
+create index if not exists carbon_credit_purchases_pending_settlement_idx
+    on public.carbon_credit_purchases (purchase_date)
+    where status = 'pending_settlement';
+
+alter table public.sale_transactions
+    add column if not exists purchase_id uuid references public.carbon_credit_purchases (id) on delete set null;
+
+create index if not exists sale_transactions_purchase_id_idx
+    on public.sale_transactions (purchase_id);
+
+-- One validated transaction hash backs at most one purchase
+create unique index if not exists carbon_credit_purchases_blockchain_tx_hash_key
+    on public.carbon_credit_purchases (blockchain_tx_hash)
+    where blockchain_tx_hash is not null;
+
+-- Purchases are now recorded by two entry points sharing one implementation:
+-- purchase_seller_credits for buyers (always pending_settlement), and
+-- record_settled_purchase for the API once it has validated a buyer's own
+-- transaction. Drop the old signature so PostgREST doesn't see two overloads.
+drop function if exists public.purchase_seller_credits(uuid, numeric, text, uuid);
+
+-- Internal: not executable through the API
+create or replace function public._record_seller_credit_purchase(
+    p_buyer_id uuid,
+    p_credit_id uuid,
+    p_quantity numeric,
+    p_blockchain_tx_hash text,
+    p_settlement_address text
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_credit public.seller_credits%rowtype;
+    v_available numeric;
+    v_settled boolean := p_blockchain_tx_hash is not null;
+    v_purchase public.carbon_credit_purchases%rowtype;
+    v_sale public.sale_transactions%rowtype;
+begin
+    if p_buyer_id is null then
+        raise exception 'Not authenticated' using errcode = '42501';
+    end if;
+    if p_quantity is null or p_quantity <= 0 then
+        raise exception 'Quantity must be positive' using errcode = 'P0001';
+    end if;
+
+    select * into v_credit
+      from public.seller_credits
+     where id = p_credit_id
+       for update;
+
+    if not found then
+        raise exception 'Seller credit not found' using errcode = 'P0002';
+    end if;
+    if v_credit.status <> 'available' then
+        raise exception 'Credit listing is not available' using errcode = 'P0001';
+    end if;
+
+    v_available := v_credit.quantity - coalesce(v_credit.sold_quantity, 0);
+    if v_available < p_quantity then
+        raise exception 'Insufficient quantity available. Available: %, Requested: %', v_available, p_quantity
+            using errcode = 'P0001';
+    end if;
+
+    insert into public.carbon_credit_purchases
+        (user_id, credit_id, quantity, price_per_ton, total_cost, status, retired_quantity,
+         blockchain_tx_hash, settlement_address, settled_at)
+    values
+        (p_buyer_id, p_credit_id, p_quantity, v_credit.price_per_ton, v_credit.price_per_ton * p_quantity,
+         case when v_settled then 'completed' else 'pending_settlement' end, 0,
+         p_blockchain_tx_hash, p_settlement_address, case when v_settled then now() end)
+    returning * into v_purchase;
+
+    insert into public.sale_transactions
+        (seller_credit_id, buyer_id, quantity, price_per_ton, total_amount, blockchain_tx_hash, status, purchase_id)
+    values
+        (p_credit_id, p_buyer_id, p_quantity, v_credit.price_per_ton, v_credit.price_per_ton * p_quantity,
+         p_blockchain_tx_hash, case when v_settled then 'completed' else 'pending' end, v_purchase.id)
+    returning * into v_sale;
+
+    update public.seller_credits
+       set sold_quantity = coalesce(sold_quantity, 0) + p_quantity,
+           updated_at = now()
+     where id = p_credit_id;
+
+    return jsonb_build_object(
+        'purchase', to_jsonb(v_purchase),
+        'sale', to_jsonb(v_sale),
+        'seller_id', v_credit.seller_id,
+        'available_quantity', v_available - p_quantity
+    );
+end;
+$$;
+
+revoke execute on function public._record_seller_credit_purchase(uuid, uuid, numeric, text, text) from public, anon, authenticated, service_role;
+
+-- A buyer's purchase, settled on chain afterwards. The buyer is always the caller.
+create or replace function public.purchase_seller_credits(
+    p_credit_id uuid,
+    p_quantity numeric,
+    p_settlement_address text default null
+)
+returns jsonb
+language sql
+security definer
+set search_path = public
+as $$
+    select public._record_seller_credit_purchase(auth.uid(), p_credit_id, p_quantity, null, p_settlement_address);
+$$;
+
+revoke execute on function public.purchase_seller_credits(uuid, numeric, text) from public, anon;
+grant execute on function public.purchase_seller_credits(uuid, numeric, text) to authenticated;
+
+-- A purchase the buyer already paid for on chain, recorded completed. Service role
+-- only: the API calls it after validating p_blockchain_tx_hash as a payment at
+-- p_price_per_ton, so a listing repriced in between is refused.
+create or replace function public.record_settled_purchase(
+    p_buyer_id uuid,
+    p_credit_id uuid,
+    p_quantity numeric,
+    p_blockchain_tx_hash text,
+    p_price_per_ton numeric,
+    p_settlement_address text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_price numeric;
+begin
+    if p_blockchain_tx_hash is null then
+        raise exception 'Transaction hash is required' using errcode = 'P0001';
+    end if;
+
+    -- Locked until commit, so the price can't change before the purchase is recorded
+    select price_per_ton into v_price
+      from public.seller_credits
+     where id = p_credit_id
+       for update;
+    if found and v_price is distinct from p_price_per_ton then
+        raise exception 'Listing price changed; the transaction paid % per ton', p_price_per_ton using errcode = 'P0001';
+    end if;
+
+    return public._record_seller_credit_purchase(p_buyer_id, p_credit_id, p_quantity, p_blockchain_tx_hash, p_settlement_address);
+end;
+$$;
+
+revoke execute on function public.record_settled_purchase(uuid, uuid, numeric, text, numeric, text) from public, anon, authenticated;
+grant execute on function public.record_settled_purchase(uuid, uuid, numeric, text, numeric, text) to service_role;
+
+-- Lease a pending purchase to a settlement worker. Returns what the mint needs, or
+-- null if the purchase is settled or another worker holds it.
+create or replace function public.claim_purchase_settlement(p_purchase_id uuid, p_lease_seconds integer)
+returns jsonb
+language sql
+security definer
+set search_path = public
+as $$
+    with claimed as (
+        update public.carbon_credit_purchases
+           set settlement_claimed_until = now() + make_interval(secs => p_lease_seconds)
+         where id = p_purchase_id
+           and status = 'pending_settlement'
+           and (settlement_claimed_until is null or settlement_claimed_until < now())
+        returning *
+    )
+    select jsonb_build_object(
+               'id', p.id,
+               'quantity', p.quantity,
+               'price_per_ton', p.price_per_ton,
+               'blockchain_tx_hash', p.blockchain_tx_hash,
+               'settlement_nonce', p.settlement_nonce,
+               'settlement_raw_tx', p.settlement_raw_tx,
+               'settlement_address', p.settlement_address,
+               'settlement_attempts', p.settlement_attempts,
+               'credit_id', p.credit_id,
+               'project_id', c.project_id,
+               'vintage_year', c.vintage_year,
+               'standard', cp.standard
+           )
+      from claimed p
+      join public.seller_credits c on c.id = p.credit_id
+      left join public.carbon_projects cp on cp.id = c.project_id;
+$$;
+
+-- The mint was confirmed: complete the purchase and its sale.
+create or replace function public.complete_purchase_settlement(p_purchase_id uuid, p_blockchain_tx_hash text)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    update public.carbon_credit_purchases
+       set status = 'completed',
+           blockchain_tx_hash = p_blockchain_tx_hash,
+           settled_at = now(),
+           settlement_error = null,
+           settlement_raw_tx = null,
+           settlement_claimed_until = null
+     where id = p_purchase_id
+       and status = 'pending_settlement';
+
+    if found then
+        update public.sale_transactions
+           set status = 'completed',
+               blockchain_tx_hash = p_blockchain_tx_hash
+         where purchase_id = p_purchase_id;
+    end if;
+end;
+$$;
+
+-- Give a claimed purchase back for a later attempt. p_failed_attempt counts it
+-- towards the worker's attempt limit; p_clear_tx_hash forgets a mint that reverted or
+-- can no longer be mined, so the next attempt signs a new one.
+create or replace function public.release_purchase_settlement(
+    p_purchase_id uuid,
+    p_error text,
+    p_retry_seconds integer,
+    p_failed_attempt boolean,
+    p_clear_tx_hash boolean default false
+)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update public.carbon_credit_purchases
+       set settlement_error = p_error,
+           settlement_attempts = settlement_attempts + case when p_failed_attempt then 1 else 0 end,
+           settlement_claimed_until = now() + make_interval(secs => p_retry_seconds),
+           blockchain_tx_hash = case when p_clear_tx_hash then null else blockchain_tx_hash end,
+           settlement_nonce = case when p_clear_tx_hash then null else settlement_nonce end,
+           settlement_raw_tx = case when p_clear_tx_hash then null else settlement_raw_tx end
+     where id = p_purchase_id
+       and status = 'pending_settlement';
+$$;
+
+-- Settlement gave up: cancel the purchase and its sale and put the reserved stock
+-- back on the listing.
+create or replace function public.fail_purchase_settlement(p_purchase_id uuid, p_error text)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_purchase public.carbon_credit_purchases%rowtype;
+begin
+    update public.carbon_credit_purchases
+       set status = 'cancelled',
+           settlement_error = p_error,
+           settlement_claimed_until = null
+     where id = p_purchase_id
+       and status = 'pending_settlement'
+    returning * into v_purchase;
+
+    if not found then
+        return;
+    end if;
+
+    update public.sale_transactions
+       set status = 'cancelled'
+     where purchase_id = p_purchase_id;
+
+    update public.seller_credits
+       set sold_quantity = greatest(coalesce(sold_quantity, 0) - v_purchase.quantity, 0),
+           updated_at = now()
+     where id = v_purchase.credit_id;
+end;
+$$;
+
+revoke execute on function public.claim_purchase_settlement(uuid, integer) from public, anon, authenticated;
+revoke execute on function public.complete_purchase_settlement(uuid, text) from public, anon, authenticated;
+revoke execute on function public.release_purchase_settlement(uuid, text, integer, boolean, boolean) from public, anon, authenticated;
+revoke execute on function public.fail_purchase_settlement(uuid, text) from public, anon, authenticated;
+grant execute on function public.claim_purchase_settlement(uuid, integer) to service_role;
+grant execute on function public.complete_purchase_settlement(uuid, text) to service_role;
+grant execute on function public.release_purchase_settlement(uuid, text, integer, boolean, boolean) to service_role;
+grant execute on function public.fail_purchase_settlement(uuid, text) to service_role;
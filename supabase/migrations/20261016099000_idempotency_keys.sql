@@ -0,0 +1,81 @@
+-- Idempotency-Key support for the purchase, retire and offset endpoints.
+--
+-- One row per (user, key): the request's fingerprint and, once it has succeeded,
+-- its response. A retry with the same key gets the stored response instead of
+-- running the request again. Only the API (service role) reads or writes these.
+
+create table if not exists public.idempotency_keys (
+    user_id uuid not null references auth.users (id) on delete cascade,
+    key text not null,
+    fingerprint text not null,  -- sha256 of the route and the request body
+    status text not null check (status in ('in_progress', 'completed')),
+    response jsonb,
+    locked_until timestamptz,  -- An in_progress row past this belongs to a request that died
+    created_at timestamptz not null default now(),
+    expires_at timestamptz not null,
+    primary key (user_id, key)
+);
+
+alter table public.idempotency_keys enable row level security;
+
+create index if not exists idempotency_keys_expires_at_idx
+    on public.idempotency_keys (expires_at);
+
+-- Claim a key for a request. Returns {"state": ...}:
+--   claimed      the caller runs the request, then completes or deletes the row
+--   completed    replay "response"
+--   in_progress  another request with this key is still running
+--   mismatch     the key was used for a different request
+-- An expired key is reused; a dead request's lock is taken over by a retry of the
+-- same request.
+create or replace function public.claim_idempotency_key(
+    p_user_id uuid,
+    p_key text,
+    p_fingerprint text,
+    p_lock_seconds integer,
+    p_ttl_seconds integer
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_row public.idempotency_keys%rowtype;
+begin
+    insert into public.idempotency_keys as k
+        (user_id, key, fingerprint, status, locked_until, created_at, expires_at)
+    values
+        (p_user_id, p_key, p_fingerprint, 'in_progress',
+         now() + make_interval(secs => p_lock_seconds), now(), now() + make_interval(secs => p_ttl_seconds))
+    on conflict (user_id, key) do update
+        set fingerprint = excluded.fingerprint,
+            status = 'in_progress',
+            response = null,
+            locked_until = excluded.locked_until,
+            created_at = excluded.created_at,
+            expires_at = excluded.expires_at
+      where k.expires_at < now()
+         or (k.status = 'in_progress' and k.locked_until < now() and k.fingerprint = excluded.fingerprint)
+    returning * into v_row;
+
+    if found then
+        return jsonb_build_object('state', 'claimed');
+    end if;
+
+    select * into v_row
+      from public.idempotency_keys
+     where user_id = p_user_id and key = p_key;
+
+    if v_row.fingerprint <> p_fingerprint then
+        return jsonb_build_object('state', 'mismatch');
+    end if;
+    if v_row.status = 'completed' then
+        return jsonb_build_object('state', 'completed', 'response', v_row.response);
+    end if;
+    return jsonb_build_object('state', 'in_progress');
+end;
+$$;
+
+revoke execute on function public.claim_idempotency_key(uuid, text, text, integer, integer) from public, anon, authenticated;
+grant execute on function public.claim_idempotency_key(uuid, text, text, integer, integer) to service_role;